@@ -26,6 +26,19 @@ DEFAULT_CFG = {
     "gql_mutation_update_paymentplan_perms": ["157103"],
     "gql_mutation_delete_paymentplan_perms": ["157104"],
     "gql_mutation_replace_paymentplan_perms": ["157106"],
+
+    "plan_cache_alias": "default",
+    "plan_cache_timeout": 3600,
+    "plan_cache_local_maxsize": 1024,
+    "plan_cache_local_ttl": 5,
+    "approximate_count_timeout": 300,
+    "query_cache_timeout": 300,
+    "bundle_intervals_max_intervals": 200000,
+    "bundle_intervals_local_ttl": 5,
+    "history_archive_horizon_days": 365,
+    "active_catalog_snapshot": False,
+    "calcrule_params_cache_maxsize": 10000,
+    "async_services_thread_sensitive": True,
 }
 
 
@@ -56,6 +69,11 @@ class ContributionPlanConfig(AppConfig):
     gql_mutation_delete_paymentplan_perms = []
     gql_mutation_replace_paymentplan_perms = []
 
+    approximate_count_timeout = 300
+    history_archive_horizon_days = 365
+    active_catalog_snapshot = False
+    async_services_thread_sensitive = True
+
     def _configure_permissions(self, cfg):
         ContributionPlanConfig.gql_query_contributionplanbundle_perms = cfg[
             "gql_query_contributionplanbundle_perms"]
@@ -114,7 +132,60 @@ class ContributionPlanConfig(AppConfig):
             "gql_mutation_replace_paymentplan_perms"
         ]
 
+    def _configure_cache(self, cfg):
+        from contribution_plan.cache import calcrule_params_cache, plan_cache, query_result_cache
+        from contribution_plan.intervals import bundle_details_intervals
+        plan_cache.configure(
+            cache_alias=cfg["plan_cache_alias"],
+            timeout=cfg["plan_cache_timeout"],
+            local_maxsize=cfg["plan_cache_local_maxsize"],
+            local_ttl=cfg["plan_cache_local_ttl"],
+        )
+        query_result_cache.configure(cache_alias=cfg["plan_cache_alias"], timeout=cfg["query_cache_timeout"])
+        bundle_details_intervals.configure(
+            cache_alias=cfg["plan_cache_alias"],
+            max_intervals=cfg["bundle_intervals_max_intervals"],
+            local_ttl=cfg["bundle_intervals_local_ttl"],
+        )
+        calcrule_params_cache.configure(maxsize=cfg["calcrule_params_cache_maxsize"])
+        ContributionPlanConfig.approximate_count_timeout = cfg["approximate_count_timeout"]
+        ContributionPlanConfig.history_archive_horizon_days = cfg["history_archive_horizon_days"]
+        ContributionPlanConfig.active_catalog_snapshot = cfg["active_catalog_snapshot"]
+        ContributionPlanConfig.async_services_thread_sensitive = cfg["async_services_thread_sensitive"]
+
+    def _register_serializers(self):
+        from contribution_plan.serializers import register_model_serializers
+        register_model_serializers(
+            self.get_model("ContributionPlan"),
+            self.get_model("ContributionPlanBundle"),
+            self.get_model("ContributionPlanBundleDetails"),
+            self.get_model("PaymentPlan"),
+        )
+
+    def _connect_product_signals(self):
+        from django.db.models.signals import post_delete, post_save
+        from product.models import Product
+        from contribution_plan.cache import query_result_cache
+        plan_models = (self.get_model("ContributionPlan"), self.get_model("PaymentPlan"))
+
+        def bump_plan_results(sender, **kwargs):
+            # cached plan pages hold the benefit plan of every plan, loaded with select_related
+            for model_class in plan_models:
+                query_result_cache.bump(model_class)
+
+        post_save.connect(bump_plan_results, sender=Product, weak=False,
+                          dispatch_uid="contribution_plan_product_post_save")
+        post_delete.connect(bump_plan_results, sender=Product, weak=False,
+                            dispatch_uid="contribution_plan_product_post_delete")
+
+    def set_dataloaders(self, dataloaders):
+        from contribution_plan.dataloaders import set_dataloaders
+        set_dataloaders(dataloaders)
+
     def ready(self):
         from core.models import ModuleConfiguration
         cfg = ModuleConfiguration.get_or_default(MODULE_NAME, DEFAULT_CFG)
         self._configure_permissions(cfg)
+        self._configure_cache(cfg)
+        self._register_serializers()
+        self._connect_product_signals()
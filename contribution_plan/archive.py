@@ -0,0 +1,171 @@
+import gzip
+import json
+import os
+from datetime import date, datetime as py_datetime, time, timedelta
+
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+
+from contribution_plan.apps import ContributionPlanConfig
+from contribution_plan.models import ContributionPlan, ContributionPlanBundle, ContributionPlanBundleDetails, \
+    PaymentPlan
+from contribution_plan.serializers import json_safe
+
+
+ARCHIVE_ENTITIES = {
+    "contribution_plan": ContributionPlan,
+    "payment_plan": PaymentPlan,
+    "contribution_plan_bundle": ContributionPlanBundle,
+    "contribution_plan_bundle_details": ContributionPlanBundleDetails,
+}
+
+
+def archive_horizon(days=None):
+    """
+    Start of the day history_archive_horizon_days ago by default, rows recorded before it are archived. The same
+    horizon is found all day long, so an interrupted run can be resumed with the same arguments.
+    """
+    if days is None:
+        days = ContributionPlanConfig.history_archive_horizon_days
+    return py_datetime.combine(date.today() - timedelta(days=days), time.min)
+
+
+def get_archive_queryset(entity, before):
+    """
+    Historical rows of the entity recorded before the given date, except the first and the last historical row
+    of every object, which are kept so the creation and the current state remain in the history table.
+    """
+    history_model = ARCHIVE_ENTITIES[entity].history.model
+    same_object = history_model.objects.filter(id=OuterRef("id"))
+    return history_model.objects.filter(
+        Exists(same_object.filter(history_id__lt=OuterRef("history_id")).values("history_id")),
+        Exists(same_object.filter(history_id__gt=OuterRef("history_id")).values("history_id")),
+        history_date__lt=before,
+    )
+
+
+def archive_history(entity, before, archive_path, chunk_size=1000, progress=None):
+    """
+    Moves the rows of get_archive_queryset to archive_path, a gzip compressed JSON lines file with one gzip member
+    per chunk. Each chunk is appended and synced to the archive before its rows are deleted in a transaction.
+    A checkpoint next to the archive records the last archived history_id and the archive size after every step,
+    so an interrupted run started again truncates the archive to the last consistent size and resumes after the
+    last deleted chunk. progress is called with the report after each chunk.
+    Returns the report: archived rows, JSON and compressed bytes written and, on PostgreSQL, the bytes the
+    archived rows used in the table, reclaimed once the table is vacuumed.
+    """
+    checkpoint_path = f"{archive_path}.checkpoint"
+    checkpoint = _resume(checkpoint_path, entity, before, archive_path)
+    # written before the first append, a chunk appended by an interrupted first run is truncated on resume
+    _write_checkpoint(checkpoint_path, checkpoint)
+    queryset = get_archive_queryset(entity, before).order_by("history_id")
+
+    while True:
+        rows = list(queryset.filter(history_id__gt=checkpoint["last_history_id"]).values()[:chunk_size])
+        if not rows:
+            break
+        history_ids = [row["history_id"] for row in rows]
+        table_bytes = _rows_size(queryset.model, history_ids)
+        json_bytes = _append_chunk(archive_path, rows)
+        checkpoint["pending"] = {
+            "last_history_id": history_ids[-1],
+            "archive_size": os.path.getsize(archive_path),
+            "rows": len(rows),
+            "json_bytes": json_bytes,
+            "table_bytes": table_bytes,
+        }
+        _write_checkpoint(checkpoint_path, checkpoint)
+
+        with transaction.atomic():
+            queryset.model.objects.filter(history_id__in=history_ids).delete()
+
+        _commit_pending(checkpoint)
+        _write_checkpoint(checkpoint_path, checkpoint)
+        if progress:
+            progress(_report(checkpoint))
+
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return _report(checkpoint)
+
+
+def _append_chunk(archive_path, rows):
+    lines = "".join(json.dumps(json_safe(row)) + "\n" for row in rows).encode("utf-8")
+    with open(archive_path, "ab") as archive_file:
+        # gzip readers decompress consecutive members as one stream
+        archive_file.write(gzip.compress(lines))
+        archive_file.flush()
+        os.fsync(archive_file.fileno())
+    return len(lines)
+
+
+def _rows_size(history_model, history_ids):
+    if connection.vendor != "postgresql":
+        return None
+    table = connection.ops.quote_name(history_model._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT COALESCE(SUM(pg_column_size(history.*)), 0) FROM {table} history "
+                       f"WHERE history.history_id = ANY(%s)", [history_ids])
+        return int(cursor.fetchone()[0])
+
+
+def _resume(checkpoint_path, entity, before, archive_path):
+    if not os.path.exists(checkpoint_path):
+        archive_size = os.path.getsize(archive_path) if os.path.exists(archive_path) else 0
+        return {
+            "entity": entity,
+            "before": before.isoformat(),
+            "last_history_id": 0,
+            "initial_archive_size": archive_size,
+            "archive_size": archive_size,
+            "archived_rows": 0,
+            "json_bytes": 0,
+            "table_bytes": None,
+            "pending": None,
+        }
+    with open(checkpoint_path, encoding="utf-8") as checkpoint_file:
+        checkpoint = json.load(checkpoint_file)
+    if checkpoint["entity"] != entity or checkpoint["before"] != before.isoformat():
+        raise ValueError(f"Checkpoint {checkpoint_path} belongs to another archive run")
+    pending = checkpoint["pending"]
+    if pending is not None:
+        # the chunk deletion is atomic, its rows are either all still there or all gone
+        deleted = not get_archive_queryset(entity, before).filter(
+            history_id__gt=checkpoint["last_history_id"], history_id__lte=pending["last_history_id"]
+        ).exists()
+        if deleted:
+            _commit_pending(checkpoint)
+        checkpoint["pending"] = None
+    # drops a chunk appended to the archive whose rows were not deleted
+    with open(archive_path, "ab") as archive_file:
+        archive_file.truncate(checkpoint["archive_size"])
+    return checkpoint
+
+
+def _commit_pending(checkpoint):
+    pending = checkpoint["pending"]
+    checkpoint["last_history_id"] = pending["last_history_id"]
+    checkpoint["archive_size"] = pending["archive_size"]
+    checkpoint["archived_rows"] += pending["rows"]
+    checkpoint["json_bytes"] += pending["json_bytes"]
+    if pending["table_bytes"] is not None:
+        checkpoint["table_bytes"] = (checkpoint["table_bytes"] or 0) + pending["table_bytes"]
+    checkpoint["pending"] = None
+
+
+def _write_checkpoint(checkpoint_path, checkpoint):
+    # written next to the checkpoint and renamed, so an interrupted write never leaves a truncated checkpoint
+    temporary_path = f"{checkpoint_path}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file)
+    os.replace(temporary_path, checkpoint_path)
+
+
+def _report(checkpoint):
+    return {
+        "entity": checkpoint["entity"],
+        "archived_rows": checkpoint["archived_rows"],
+        "json_bytes": checkpoint["json_bytes"],
+        "archive_bytes": checkpoint["archive_size"] - checkpoint["initial_archive_size"],
+        "table_bytes": checkpoint["table_bytes"],
+    }
@@ -0,0 +1,57 @@
+import time
+from contextlib import contextmanager
+
+from django.core.management.base import CommandError
+from django.db import transaction
+
+from calculation.calculation_rule import ContributionValuationRule
+from contribution_plan.models import ContributionPlan
+from core.models import User
+from product.test_helpers import create_test_product
+
+
+class _Rollback(Exception):
+    pass
+
+
+@contextmanager
+def rolled_back():
+    """
+    Runs the benchmark body in a transaction rolled back at the end, so benchmark data never stays in the database.
+    """
+    try:
+        with transaction.atomic():
+            yield
+            raise _Rollback()
+    except _Rollback:
+        pass
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def benchmark_user():
+    """
+    User the benchmark data is saved as.
+    """
+    user = User.objects.filter(username='admin').first()
+    if user is None:
+        raise CommandError("Benchmarks save their data as the admin user, which does not exist")
+    return user
+
+
+def create_benchmark_contribution_plan(user):
+    """
+    Saves a contribution plan of a benchmark product, used as the template of the rows a benchmark writes in bulk.
+    The factories of contribution_plan.tests are not used, the tests are not shipped with every deployment.
+    """
+    product = create_test_product("BENCHMARK", custom_props={"insurance_period": 12, })
+    contribution_plan = ContributionPlan(
+        code=f"BENCHMARK-{product.id}", name="Benchmark contribution plan", benefit_plan=product, periodicity=12,
+        calculation=ContributionValuationRule.uuid, json_ext={},
+    )
+    contribution_plan.save(username=user.username)
+    return contribution_plan
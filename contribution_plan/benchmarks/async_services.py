@@ -0,0 +1,38 @@
+import asyncio
+import time
+
+from asgiref.sync import sync_to_async
+
+from contribution_plan.benchmarks import benchmark_user, create_benchmark_contribution_plan
+from contribution_plan.cache import plan_cache
+from contribution_plan.models import ContributionPlan
+from contribution_plan.services import ContributionPlan as ContributionPlanService
+from product.models import Product
+
+
+async def _gather(factory, size):
+    start = time.perf_counter()
+    await asyncio.gather(*[factory() for _ in range(size)])
+    return time.perf_counter() - start
+
+
+def run(stdout, size=500, rounds=5):
+    # async services run in other threads with their own connections, so the data is committed and removed at the end
+    user = benchmark_user()
+    contribution_plan = create_benchmark_contribution_plan(user)
+    product_id = contribution_plan.benefit_plan_id
+    service = ContributionPlanService(user)
+    try:
+        variants = (
+            ("sync_to_async(get_by_id)", lambda: sync_to_async(service.get_by_id)(contribution_plan)),
+            ("aget_by_id", lambda: service.aget_by_id(contribution_plan)),
+            ("aget_by_ids (batch of 10)", lambda: service.aget_by_ids([contribution_plan.id] * 10)),
+        )
+        for label, factory in variants:
+            plan_cache.clear_local()
+            elapsed = min(asyncio.run(_gather(factory, size)) for _ in range(rounds))
+            stdout.write(f"{label:<28} {size / elapsed:10.0f} calls/s ({size} concurrent calls)")
+    finally:
+        ContributionPlan.history.filter(id=contribution_plan.id).delete()
+        ContributionPlan.objects.filter(id=contribution_plan.id).delete()
+        Product.objects.filter(id=product_id).delete()
@@ -0,0 +1,64 @@
+from django.db.models import Exists, OuterRef
+
+from contribution_plan.benchmarks import benchmark_user, create_benchmark_contribution_plan, rolled_back, timed
+from contribution_plan.models import ContributionPlan, ContributionPlanBundle, ContributionPlanBundleDetails
+from contribution_plan.utils import bulk_create_history_objects
+
+
+def _join_distinct(calculation, benefit_plan):
+    # filtering used by resolve_contribution_plan_bundle before the EXISTS subquery
+    return ContributionPlanBundle.objects.filter(
+        contributionplanbundledetails__contribution_plan__calculation=str(calculation)
+    ).distinct().filter(
+        contributionplanbundledetails__contribution_plan__benefit_plan__id=benefit_plan
+    ).distinct().order_by("code")
+
+
+def _details_exists(calculation, benefit_plan):
+    # EXISTS over the details joined to the plans, used before the bundle index
+    details = ContributionPlanBundleDetails.objects.filter(
+        contribution_plan_bundle=OuterRef("pk"),
+        is_deleted=False,
+        contribution_plan__is_deleted=False,
+        contribution_plan__calculation=str(calculation),
+        contribution_plan__benefit_plan_id=benefit_plan,
+    )
+    return ContributionPlanBundle.objects.filter(Exists(details.values("id"))).order_by("code")
+
+
+def _index_exists(calculation, benefit_plan):
+    return ContributionPlanBundle.objects.filter_by_contribution_plans(
+        calculation=calculation, benefit_plan=benefit_plan
+    ).order_by("code")
+
+
+def run(stdout, size=100000, rounds=5):
+    user = benchmark_user()
+    with rolled_back():
+        template = create_benchmark_contribution_plan(user)
+        plans = bulk_create_history_objects(ContributionPlan, [
+            ContributionPlan(code=f"FILTER-{index}", name=f"Filter plan {index}", periodicity=12,
+                             benefit_plan_id=template.benefit_plan_id, calculation=template.calculation)
+            for index in range(100)
+        ], user, batch_size=2000)
+        bundles = bulk_create_history_objects(ContributionPlanBundle, [
+            ContributionPlanBundle(code=f"FILTER-{index}", name=f"Filter bundle {index}", periodicity=12)
+            for index in range(size // 10)
+        ], user, batch_size=2000)
+        bulk_create_history_objects(ContributionPlanBundleDetails, [
+            ContributionPlanBundleDetails(contribution_plan_bundle=bundles[index % len(bundles)],
+                                          contribution_plan=plans[index % len(plans)])
+            for index in range(size)
+        ], user, batch_size=2000)
+
+        for label, queryset_factory in (
+                ("join + DISTINCT", _join_distinct),
+                ("EXISTS on details", _details_exists),
+                ("EXISTS on index", _index_exists),
+        ):
+            elapsed, bundle_ids = min(
+                timed(lambda: list(queryset_factory(template.calculation, template.benefit_plan_id)
+                                   .values_list("id", flat=True)[:100]))
+                for _ in range(rounds)
+            )
+            stdout.write(f"{label:<18} {elapsed * 1000:9.1f} ms first page ({size} details, {len(bundles)} bundles)")
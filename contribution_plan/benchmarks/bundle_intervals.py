@@ -0,0 +1,53 @@
+import random
+from datetime import datetime, timedelta
+
+from django.db.models import Q
+
+from contribution_plan.benchmarks import benchmark_user, create_benchmark_contribution_plan, rolled_back, timed
+from contribution_plan.intervals import bundle_details_intervals
+from contribution_plan.models import ContributionPlanBundle, ContributionPlanBundleDetails
+from contribution_plan.utils import bulk_create_history_objects
+
+
+def _orm_overlapping(bundle_id, date_from, date_to):
+    # range query run by every lookup before the interval index
+    return list(ContributionPlanBundleDetails.objects.filter(
+        Q(date_valid_to__isnull=True) | Q(date_valid_to__gt=date_from),
+        contribution_plan_bundle_id=bundle_id,
+        date_valid_from__lt=date_to,
+        is_deleted=False,
+    ).values_list("id", "contribution_plan_id", "date_valid_from", "date_valid_to"))
+
+
+def run(stdout, size=10000, rounds=3):
+    user = benchmark_user()
+    generator = random.Random(0)
+    with rolled_back():
+        contribution_plan = create_benchmark_contribution_plan(user)
+        bundles = bulk_create_history_objects(ContributionPlanBundle, [
+            ContributionPlanBundle(code=f"INTERVALS-{index}", name=f"Intervals bundle {index}", periodicity=12)
+            for index in range(10)
+        ], user)
+        start = datetime(2000, 1, 1)
+        bulk_create_history_objects(ContributionPlanBundleDetails, [
+            ContributionPlanBundleDetails(contribution_plan_bundle=bundles[index % len(bundles)],
+                                          contribution_plan=contribution_plan,
+                                          date_valid_from=start + timedelta(days=index // len(bundles)),
+                                          date_valid_to=start + timedelta(days=index // len(bundles) + 30))
+            for index in range(size)
+        ], user, batch_size=2000)
+        queries = []
+        for _ in range(1000):
+            date_from = start + timedelta(days=generator.randrange(size // len(bundles)))
+            queries.append((generator.choice(bundles).id, date_from, date_from + timedelta(days=7)))
+
+        bundle_details_intervals.clear()
+        elapsed, _ = timed(lambda: [bundle_details_intervals.overlapping(bundle.id, start) for bundle in bundles])
+        stdout.write(f"index load {elapsed * 1000:9.1f} ms for {len(bundles)} bundles ({size} details)")
+        for label, lookup in (
+                ("index", bundle_details_intervals.overlapping),
+                ("ORM", _orm_overlapping),
+        ):
+            elapsed, _ = min(timed(lambda: [lookup(*query) for query in queries]) for _ in range(rounds))
+            stdout.write(f"{label:<10} {elapsed * 1000:9.1f} ms for {len(queries)} overlap lookups "
+                         f"({size} details, {len(bundles)} bundles)")
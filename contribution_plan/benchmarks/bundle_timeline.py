@@ -0,0 +1,53 @@
+from datetime import date, datetime, timedelta
+
+from contribution_plan.benchmarks import benchmark_user, create_benchmark_contribution_plan, rolled_back, timed
+from contribution_plan.models import ContributionPlan, ContributionPlanBundle, ContributionPlanBundleDetails
+from contribution_plan.services import ContributionPlanBundle as ContributionPlanBundleService
+from contribution_plan.utils import bulk_create_history_objects
+
+
+def _daily_compositions(service, bundle, date_from, date_to):
+    # one composition_at query per day, what contract valuation did before the timeline service
+    day = date_from
+    while day < date_to:
+        service.composition_at(bundle, day)
+        day += timedelta(days=1)
+
+
+def run(stdout, size=5000, rounds=3):
+    user = benchmark_user()
+    service = ContributionPlanBundleService(user)
+    with rolled_back():
+        template = create_benchmark_contribution_plan(user)
+        plans = bulk_create_history_objects(ContributionPlan, [
+            ContributionPlan(code=f"TIMELINE-{index}", name=f"Timeline plan {index}", periodicity=12,
+                             benefit_plan_id=template.benefit_plan_id, calculation=template.calculation,
+                             date_valid_from=datetime(2000, 1, 1))
+            for index in range(50)
+        ], user, batch_size=2000)
+        bundle = bulk_create_history_objects(ContributionPlanBundle, [
+            ContributionPlanBundle(code="TIMELINE", name="Timeline bundle", periodicity=12)
+        ], user)[0]
+        # size details versions, each attaching a plan for 30 days, a new version starting every 3 days
+        start = datetime(2000, 1, 1)
+        bulk_create_history_objects(ContributionPlanBundleDetails, [
+            ContributionPlanBundleDetails(contribution_plan_bundle=bundle, contribution_plan=plans[index % len(plans)],
+                                          date_valid_from=start + timedelta(days=3 * index),
+                                          date_valid_to=start + timedelta(days=3 * index + 30))
+            for index in range(size)
+        ], user, batch_size=2000)
+        date_from = date(2000, 1, 1)
+
+        for days in (365, 3 * size):
+            date_to = date_from + timedelta(days=days)
+            elapsed, response = min(
+                timed(service.composition_timeline, [bundle], date_from, date_to) for _ in range(rounds)
+            )
+            segments = len(response["data"][str(bundle.id)])
+            stdout.write(f"timeline          {elapsed * 1000:9.1f} ms for {days} days "
+                         f"({size} details versions, {segments} segments)")
+        date_to = date_from + timedelta(days=365)
+        elapsed, _ = min(
+            timed(_daily_compositions, service, bundle, date_from, date_to) for _ in range(rounds)
+        )
+        stdout.write(f"daily composition {elapsed * 1000:9.1f} ms for 365 days ({size} details versions)")
@@ -0,0 +1,47 @@
+import uuid
+
+from contribution_plan.benchmarks import timed
+from contribution_plan.cache import calcrule_params_cache
+from contribution_plan.models import PaymentPlan
+from contribution_plan.utils import obtain_calcrule_params, obtain_calcrule_params_cached
+
+INTEGER_PARAMS = ["rate", "numberOfDays", "minimumAmount"]
+NONE_INTEGER_PARAMS = ["partOfHealthFacility", "fixedBatch", "limitPerSingleService"]
+
+
+def _plans(size):
+    # plans are only read, they are never saved
+    return [
+        PaymentPlan(id=uuid.UUID(int=index), version=1, json_ext={"calculation_rule": {
+            "rate": str(index % 100), "numberOfDays": "", "partOfHealthFacility": "null",
+            "fixedBatch": str(index % 7), "limitPerSingleService": None,
+        }})
+        for index in range(size)
+    ]
+
+
+def _calls_per_second(function, size, rounds, plans=None):
+    # obtain_calcrule_params rewrites json_ext in place, every uncached round gets fresh plans
+    best = None
+    for _ in range(rounds):
+        round_plans = plans or _plans(size)
+        elapsed, _ = timed(lambda: [function(plan, INTEGER_PARAMS, NONE_INTEGER_PARAMS) for plan in round_plans])
+        best = elapsed if best is None else min(best, elapsed)
+    return size / best
+
+
+def run(stdout, size=100000, rounds=3):
+    maxsize = calcrule_params_cache.info()["maxsize"]
+    calcrule_params_cache.configure(maxsize=size)
+    try:
+        plans = _plans(size)
+        stdout.write(f"{'cold':<10} {_calls_per_second(obtain_calcrule_params_cached, size, 1, plans):12.0f} "
+                     f"calls/s ({size} plans)")
+        for label, function, round_plans in (
+                ("uncached", obtain_calcrule_params, None),
+                ("cached", obtain_calcrule_params_cached, plans),
+        ):
+            stdout.write(f"{label:<10} {_calls_per_second(function, size, rounds, round_plans):12.0f} "
+                         f"calls/s ({size} plans)")
+    finally:
+        calcrule_params_cache.configure(maxsize=maxsize)
@@ -0,0 +1,36 @@
+import io
+import tracemalloc
+
+from contribution_plan.benchmarks import benchmark_user, create_benchmark_contribution_plan, rolled_back, timed
+from contribution_plan.exports import export_catalog
+from contribution_plan.models import ContributionPlan
+from contribution_plan.utils import bulk_create_history_objects
+
+
+class _NullWriter(io.TextIOBase):
+
+    def write(self, text):
+        return len(text)
+
+
+def run(stdout, size=100000, rounds=3):
+    user = benchmark_user()
+    with rolled_back():
+        template = create_benchmark_contribution_plan(user)
+        plans = [ContributionPlan(code=f"EXPORT-{index}", name=f"Export plan {index}",
+                                  benefit_plan_id=template.benefit_plan_id, calculation=template.calculation,
+                                  periodicity=12, json_ext={"calculation_rule": {"rate": index % 10}})
+                 for index in range(size)]
+        bulk_create_history_objects(ContributionPlan, plans, user, batch_size=2000)
+        del plans
+
+        for export_format in ("jsonl", "csv"):
+            elapsed, peak, count = None, 0, 0
+            for _ in range(rounds):
+                tracemalloc.start()
+                round_elapsed, count = timed(export_catalog, _NullWriter(), "contribution_plan", export_format)
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+                elapsed = round_elapsed if elapsed is None else min(elapsed, round_elapsed)
+            stdout.write(f"{export_format:<6} {count / elapsed:10.0f} rows/s, "
+                         f"peak {peak / 2 ** 20:7.1f} MiB traced ({count} rows)")
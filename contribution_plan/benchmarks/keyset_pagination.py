@@ -0,0 +1,34 @@
+from contribution_plan.benchmarks import benchmark_user, create_benchmark_contribution_plan, rolled_back, timed
+from contribution_plan.gql.connection_fields import encode_keyset_cursor, keyset_ordering, keyset_page
+from contribution_plan.models import ContributionPlan
+from contribution_plan.utils import bulk_create_history_objects
+
+
+PAGE_SIZE = 20
+
+
+def run(stdout, size=100000, rounds=5):
+    user = benchmark_user()
+    with rolled_back():
+        template = create_benchmark_contribution_plan(user)
+        bulk_create_history_objects(ContributionPlan, [
+            ContributionPlan(code=f"PAGE-{index % 1000:04}", name=f"Page plan {index}", periodicity=12,
+                             benefit_plan_id=template.benefit_plan_id, calculation=template.calculation)
+            for index in range(size)
+        ], user, batch_size=2000)
+
+        queryset = ContributionPlan.objects.filter(code__startswith="PAGE-").order_by("code")
+        for page in (1, min(1000, size // PAGE_SIZE)):
+            offset = (page - 1) * PAGE_SIZE
+            # cursor of the last row of the previous page, as returned by the connection
+            previous_row = queryset.order_by("code", "id").values_list(
+                *[name for name, _ in keyset_ordering(queryset)])[offset - 1] if offset else None
+            after = encode_keyset_cursor(list(previous_row)) if previous_row else None
+
+            offset_elapsed = min(
+                timed(lambda: list(queryset.order_by("code", "id")[offset:offset + PAGE_SIZE]))[0]
+                for _ in range(rounds)
+            )
+            keyset_elapsed = min(timed(keyset_page, queryset, PAGE_SIZE, after)[0] for _ in range(rounds))
+            stdout.write(f"page {page:>5}: OFFSET {offset_elapsed * 1000:8.2f} ms, "
+                         f"keyset {keyset_elapsed * 1000:8.2f} ms ({size} rows, {PAGE_SIZE} per page)")
@@ -0,0 +1,32 @@
+from contribution_plan.benchmarks import benchmark_user, create_benchmark_contribution_plan, rolled_back, timed
+from contribution_plan.models import ContributionPlan, ContributionPlanBundle
+from contribution_plan.search import search_plans
+from contribution_plan.utils import bulk_create_history_objects
+
+
+WORDS = ["family", "formal", "informal", "sector", "student", "voluntary", "mandatory", "indigent"]
+TYPED_TERM = "student"
+
+
+def run(stdout, size=200000, rounds=5):
+    user = benchmark_user()
+    with rolled_back():
+        template = create_benchmark_contribution_plan(user)
+        for start in range(0, size, 50000):
+            bulk_create_history_objects(ContributionPlan, [
+                ContributionPlan(code=f"{WORDS[index % len(WORDS)][:3].upper()}-{index}",
+                                 name=f"{WORDS[index % len(WORDS)]} {WORDS[(index // 8) % len(WORDS)]} plan {index}",
+                                 benefit_plan_id=template.benefit_plan_id, calculation=template.calculation,
+                                 periodicity=12)
+                for index in range(start, min(start + 50000, size))
+            ], user, batch_size=5000)
+        bulk_create_history_objects(ContributionPlanBundle, [
+            ContributionPlanBundle(code=f"BUNDLE-{index}", name=f"{WORDS[index % len(WORDS)]} bundle {index}")
+            for index in range(size // 10)
+        ], user, batch_size=5000)
+
+        # one search per keystroke, as fired by the picker widgets
+        for length in range(1, len(TYPED_TERM) + 1):
+            term = TYPED_TERM[:length]
+            elapsed, results = min(timed(search_plans, term, 20) for _ in range(rounds))
+            stdout.write(f"{term!r:<12} {elapsed * 1000:8.2f} ms ({len(results)} results, {size} plans)")
@@ -0,0 +1,49 @@
+import json
+import timeit
+import uuid
+from datetime import date, datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.forms.models import model_to_dict
+
+from contribution_plan.models import ContributionPlan, ContributionPlanBundle, ContributionPlanBundleDetails, \
+    PaymentPlan
+from contribution_plan.serializers import serialize
+
+
+def _legacy_serialize(instance):
+    uuid_string = str(instance.id)
+    dict_representation = model_to_dict(instance)
+    dict_representation["id"], dict_representation["uuid"] = (str(uuid_string), str(uuid_string))
+    return json.loads(json.dumps(dict_representation, cls=DjangoJSONEncoder))
+
+
+def _sample_instances():
+    now = datetime.now()
+    plan_data = {
+        "code": "BENCH", "name": "Benchmark plan", "calculation": uuid.uuid4(), "benefit_plan_id": 1,
+        "periodicity": 12, "date_valid_from": now, "date_valid_to": date(2030, 1, 1), "date_created": now,
+        "date_updated": now, "version": 3, "json_ext": {"calculation_rule": {"rate": 5, "includeFamily": True}},
+    }
+    contribution_plan = ContributionPlan(id=uuid.uuid4(), **plan_data)
+    payment_plan = PaymentPlan(id=uuid.uuid4(), **plan_data)
+    bundle = ContributionPlanBundle(id=uuid.uuid4(), code="BENCH", name="Benchmark bundle", periodicity=12,
+                                    date_valid_from=now, date_created=now, date_updated=now, json_ext={})
+    details = ContributionPlanBundleDetails(id=uuid.uuid4(), contribution_plan=contribution_plan,
+                                            contribution_plan_bundle=bundle, date_valid_from=now, json_ext={})
+    return [contribution_plan, payment_plan, bundle, details]
+
+
+def run(stdout, size=None, rounds=20000):
+    samples = _sample_instances()
+    for instance in samples:
+        legacy, compiled = json.dumps(_legacy_serialize(instance)), json.dumps(serialize(instance))
+        if legacy != compiled:
+            raise AssertionError(f"{type(instance).__name__} serialized differently:\n{legacy}\n{compiled}")
+    # size objects serialized per round, one instance of each model by default
+    instances = samples if size is None else [samples[index % len(samples)] for index in range(size)]
+
+    for label, function in (("model_to_dict + json round-trip", _legacy_serialize), ("compiled serializer", serialize)):
+        elapsed = timeit.timeit(lambda: [function(instance) for instance in instances], number=rounds)
+        per_object = elapsed / (rounds * len(instances)) * 1e6
+        stdout.write(f"{label:<35} {per_object:8.2f} us/object ({rounds * len(instances)} objects)")
@@ -0,0 +1,26 @@
+from contribution_plan.benchmarks import benchmark_user, create_benchmark_contribution_plan, rolled_back, timed
+from contribution_plan.gql.connection_fields import approximate_count
+from contribution_plan.models import ContributionPlan
+from contribution_plan.utils import bulk_create_history_objects
+
+
+def run(stdout, size=2000000, rounds=5):
+    user = benchmark_user()
+    with rolled_back():
+        template = create_benchmark_contribution_plan(user)
+        for start in range(0, size, 50000):
+            bulk_create_history_objects(ContributionPlan, [
+                ContributionPlan(code=f"COUNT-{index}", name=f"Count plan {index}", periodicity=12,
+                                 benefit_plan_id=template.benefit_plan_id, calculation=template.calculation)
+                for index in range(start, min(start + 50000, size))
+            ], user, batch_size=5000)
+
+        for label, queryset in (
+                ("plans", ContributionPlan.objects.all()),
+                ("historical plans", ContributionPlan.history.all()),
+                ("filtered plans", ContributionPlan.objects.filter(code__startswith="COUNT-1")),
+        ):
+            count_elapsed, count = min(timed(queryset.count) for _ in range(rounds))
+            approximate_elapsed, approximate = min(timed(approximate_count, queryset) for _ in range(rounds))
+            stdout.write(f"{label:<17} COUNT(*) {count_elapsed * 1000:9.1f} ms ({count}), "
+                         f"approximate {approximate_elapsed * 1000:9.1f} ms ({approximate})")
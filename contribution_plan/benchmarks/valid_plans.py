@@ -0,0 +1,43 @@
+import random
+from datetime import datetime, timedelta
+
+from calculation.calculation_rule import ContributionValuationRule
+from contribution_plan.benchmarks import benchmark_user, rolled_back, timed
+from contribution_plan.models import ContributionPlan
+from contribution_plan.utils import bulk_create_history_objects
+from contribution_plan.validity import np, valid_contribution_plan, valid_contribution_plans
+from product.test_helpers import create_test_product
+
+
+def run(stdout, size=1000000, rounds=3):
+    if np is None:
+        stdout.write("numpy is not installed, install openimis-be-contribution-plan[numpy]")
+        return
+    user = benchmark_user()
+    generator = random.Random(0)
+    with rolled_back():
+        products = [create_test_product(f"VALID{index}", custom_props={"insurance_period": 12, })
+                    for index in range(20)]
+        start = datetime(2015, 1, 1)
+        # for every product a plan version per month over 10 years, each valid for 45 days
+        bulk_create_history_objects(ContributionPlan, [
+            ContributionPlan(code=f"VALID-{product.id}-{month}", name=f"Valid plan {month}", periodicity=12,
+                             benefit_plan=product, calculation=ContributionValuationRule.uuid,
+                             date_valid_from=start + timedelta(days=30 * month),
+                             date_valid_to=start + timedelta(days=30 * month + 45))
+            for product in products
+            for month in range(120)
+        ], user, batch_size=2000)
+        benefit_plan_ids = np.array([generator.choice(products).id for _ in range(size)])
+        dates = np.datetime64(start, "us") + np.array(
+            [generator.randrange(3650 * 24) for _ in range(size)], dtype="timedelta64[h]")
+
+        elapsed, _ = min(timed(valid_contribution_plans, benefit_plan_ids, dates) for _ in range(rounds))
+        stdout.write(f"vectorized {elapsed * 1000:9.1f} ms for {size} pairs "
+                     f"({size / elapsed:,.0f} pairs/s)")
+        sample = min(size, 1000)
+        elapsed, _ = min(timed(lambda: [valid_contribution_plan(int(benefit_plan_ids[index]), dates[index].item())
+                                        for index in range(sample)])
+                         for _ in range(rounds))
+        stdout.write(f"per row    {elapsed * 1000:9.1f} ms for {sample} pairs "
+                     f"({sample / elapsed:,.0f} pairs/s)")
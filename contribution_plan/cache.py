@@ -0,0 +1,366 @@
+import hashlib
+import json
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from types import MappingProxyType
+
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+
+class LRUCache:
+    """
+    Bounded, thread safe, process-local mapping evicting the least recently used entries.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class _LocalEntry:
+    __slots__ = ("generation", "data", "checked_at")
+
+    def __init__(self, generation, data, checked_at):
+        self.generation = generation
+        self.data = data
+        self.checked_at = checked_at
+
+
+class PlanCache:
+    """
+    Read-through cache of plans by id. Entries are stored under (model, id, generation) in the Django cache, next
+    to a counter holding the current generation of every cached plan. The counter is incremented whenever the
+    plan is saved or deleted, never decremented, so other processes notice the change on their next lookup and
+    a reader storing a row loaded before the change stores it under a generation nobody reads anymore. A bounded
+    LRU tier in front of the Django cache serves repeated lookups, revalidated against the generation counter
+    after local_ttl seconds.
+    """
+    KEY_PREFIX = "contribution_plan:plan"
+
+    def __init__(self, cache_alias="default", timeout=3600, local_maxsize=1024, local_ttl=5):
+        self.cache_alias = cache_alias
+        self.timeout = timeout
+        self.local_ttl = local_ttl
+        self._local = LRUCache(local_maxsize)
+        self._lock = threading.Lock()
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def configure(self, cache_alias, timeout, local_maxsize, local_ttl):
+        self.cache_alias = cache_alias
+        self.timeout = timeout
+        self.local_ttl = local_ttl
+        self._local = LRUCache(local_maxsize)
+
+    @property
+    def _shared(self):
+        return caches[self.cache_alias]
+
+    def get(self, model_class, plan_id):
+        key = self._key(model_class, plan_id)
+        entry = self._local.get(key)
+        now = time.monotonic()
+        if entry is not None and now - entry.checked_at < self.local_ttl:
+            self._count("local_hits")
+            return pickle.loads(entry.data)
+
+        generation = self._generation(key)
+        if entry is not None and entry.generation == generation:
+            entry.checked_at = now
+            self._count("local_hits")
+            return pickle.loads(entry.data)
+        data = self._shared.get(self._data_key(key, generation))
+        if data is not None:
+            self._local.set(key, _LocalEntry(generation, data, now))
+            self._count("shared_hits")
+            return pickle.loads(data)
+
+        self._count("misses")
+        plan = model_class.objects.get(id=plan_id)
+        data = pickle.dumps(plan)
+        self._shared.set(self._data_key(key, generation), data, self.timeout)
+        self._local.set(key, _LocalEntry(generation, data, now))
+        return plan
+
+    def get_local(self, model_class, plan_id):
+        """
+        Returns the plan if the process-local tier holds a fresh entry for it, None otherwise. Never does any IO.
+        """
+        entry = self._local.get(self._key(model_class, plan_id))
+        if entry is not None and time.monotonic() - entry.checked_at < self.local_ttl:
+            self._count("local_hits")
+            return pickle.loads(entry.data)
+        return None
+
+    def invalidate(self, model_class, plan_id):
+        key = self._key(model_class, plan_id)
+        self._count("invalidations")
+        self._bump(key)
+        # readers that loaded the row before the commit could have stored it under the bumped generation
+        transaction.on_commit(lambda: self._bump(key))
+
+    def info(self):
+        with self._lock:
+            return {
+                "local_hits": self.local_hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "local_size": len(self._local),
+                "local_maxsize": self._local.maxsize,
+            }
+
+    def clear_local(self):
+        self._local.clear()
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _generation(self, key):
+        generation_key = self._generation_key(key)
+        generation = self._shared.get(generation_key)
+        if generation is None:
+            # starts at the current time in milliseconds, above any generation the evicted counter reached
+            self._shared.add(generation_key, int(time.time() * 1000), None)
+            generation = self._shared.get(generation_key)
+        return generation
+
+    def _bump(self, key):
+        self._local.pop(key)
+        generation_key = self._generation_key(key)
+        try:
+            self._shared.incr(generation_key)
+        except ValueError:
+            self._shared.add(generation_key, int(time.time() * 1000), None)
+
+    @staticmethod
+    def _key(model_class, plan_id):
+        return model_class._meta.label, str(uuid.UUID(str(plan_id)))
+
+    def _generation_key(self, key):
+        return f"{self.KEY_PREFIX}:{key[0]}:{key[1]}:generation"
+
+    def _data_key(self, key, generation):
+        return f"{self.KEY_PREFIX}:{key[0]}:{key[1]}:{generation}"
+
+
+class QueryResultCache:
+    """
+    Cache of GraphQL query results, keyed by the query arguments and the model generation. The generation of
+    a model is a counter bumped whenever one of its rows is saved, deleted, replaced or written in bulk, so all
+    results cached for the model are dropped at once without having to know their keys. The counter starts at
+    the current time in milliseconds, so results cached before it was evicted are never served again.
+    """
+    KEY_PREFIX = "contribution_plan:query"
+
+    def __init__(self, cache_alias="default", timeout=300):
+        self.cache_alias = cache_alias
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, cache_alias, timeout):
+        self.cache_alias = cache_alias
+        self.timeout = timeout
+
+    @property
+    def _shared(self):
+        return caches[self.cache_alias]
+
+    @property
+    def enabled(self):
+        return bool(self.timeout)
+
+    def key(self, model_class, *parts):
+        digest = hashlib.sha1(json.dumps(parts, sort_keys=True, cls=DjangoJSONEncoder).encode("utf-8")).hexdigest()
+        return f"{self.KEY_PREFIX}:{model_class._meta.label}:{self.generation(model_class)}:{digest}"
+
+    def get(self, key):
+        value = self._shared.get(key)
+        if value is None:
+            self._count("misses")
+            return None
+        self._count("hits")
+        return pickle.loads(value)
+
+    def set(self, key, value):
+        self._shared.set(key, pickle.dumps(value), self.timeout)
+
+    def generation(self, model_class):
+        generation_key = self._generation_key(model_class)
+        generation = self._shared.get(generation_key)
+        if generation is None:
+            self._shared.add(generation_key, int(time.time() * 1000), None)
+            generation = self._shared.get(generation_key)
+        return generation
+
+    def bump(self, model_class):
+        self._bump(model_class)
+        # results computed by concurrent readers before the commit could be stored under the bumped generation
+        transaction.on_commit(lambda: self._bump(model_class))
+
+    def info(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _bump(self, model_class):
+        generation_key = self._generation_key(model_class)
+        try:
+            self._shared.incr(generation_key)
+        except ValueError:
+            self._shared.add(generation_key, int(time.time() * 1000), None)
+
+    def _generation_key(self, model_class):
+        return f"{self.KEY_PREFIX}:{model_class._meta.label}:generation"
+
+
+class CalculationRuleParams:
+    """
+    Read-only calculation rule parameters of a plan, accessed as a mapping or as attributes.
+    """
+    __slots__ = ("_values",)
+
+    def __init__(self, values):
+        object.__setattr__(self, "_values", MappingProxyType(dict(values)))
+
+    def __getattr__(self, name):
+        if name == "_values":
+            raise AttributeError(name)
+        try:
+            return self._values[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def __getitem__(self, key):
+        return self._values[key]
+
+    def __contains__(self, key):
+        return key in self._values
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __eq__(self, other):
+        if isinstance(other, CalculationRuleParams):
+            return self._values == other._values
+        return self._values == other
+
+    def __repr__(self):
+        return f"{type(self).__name__}({dict(self._values)!r})"
+
+    def get(self, key, default=None):
+        return self._values.get(key, default)
+
+    def keys(self):
+        return self._values.keys()
+
+    def values(self):
+        return self._values.values()
+
+    def items(self):
+        return self._values.items()
+
+    def as_dict(self):
+        return dict(self._values)
+
+
+class CalculationRuleParamsCache:
+    """
+    Process-local cache of the calculation rule parameters of plans, keyed by (model, id) and valid for one version
+    of the plan. Entries are dropped when the plan is saved, deleted, replaced or written in bulk, and ignored
+    when the plan given has another version than the cached one.
+    """
+
+    def __init__(self, maxsize=10000):
+        self._local = LRUCache(maxsize)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, maxsize):
+        self._local = LRUCache(maxsize)
+
+    def get(self, plan, param_lists, build):
+        """
+        Parameters of the plan for the given (integer params, none integer params) lists, computed with build()
+        when they are not cached.
+        """
+        key = PlanCache._key(type(plan), plan.id)
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None or entry[0] != plan.version:
+                entry = (plan.version, {})
+                self._local.set(key, entry)
+            params = entry[1].get(param_lists)
+            if params is not None:
+                self.hits += 1
+                return params
+            self.misses += 1
+        params = build()
+        with self._lock:
+            # a concurrent caller may have stored the same params meanwhile, keep the first ones
+            return entry[1].setdefault(param_lists, params)
+
+    def invalidate(self, model_class, plan_id):
+        self._local.pop(PlanCache._key(model_class, plan_id))
+
+    def clear(self):
+        self._local.clear()
+
+    def info(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._local),
+                    "maxsize": self._local.maxsize}
+
+
+plan_cache = PlanCache()
+query_result_cache = QueryResultCache()
+calcrule_params_cache = CalculationRuleParamsCache()
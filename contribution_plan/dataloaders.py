@@ -0,0 +1,51 @@
+from promise import Promise
+from promise.dataloader import DataLoader
+
+from contribution_plan.models import ContributionPlan, ContributionPlanBundle, PaymentPlan
+from product.models import Product
+
+
+class ModelByIdLoader(DataLoader):
+    model = None
+
+    def batch_load_fn(self, keys):
+        objects = {obj.id: obj for obj in self.model.objects.filter(id__in=keys)}
+        return Promise.resolve([objects.get(key) for key in keys])
+
+
+class ContributionPlanLoader(ModelByIdLoader):
+    model = ContributionPlan
+
+
+class ContributionPlanBundleLoader(ModelByIdLoader):
+    model = ContributionPlanBundle
+
+
+class PaymentPlanLoader(ModelByIdLoader):
+    model = PaymentPlan
+
+
+class ProductLoader(ModelByIdLoader):
+    model = Product
+
+
+def set_dataloaders(dataloaders):
+    dataloaders["contribution_plan_loader"] = ContributionPlanLoader()
+    dataloaders["contribution_plan_bundle_loader"] = ContributionPlanBundleLoader()
+    dataloaders["payment_plan_loader"] = PaymentPlanLoader()
+    # the product module registers its own loader when it provides one
+    dataloaders.setdefault("product_loader", ProductLoader())
+
+
+def load_related(instance, field_name, info, loader_name):
+    """
+    Resolves a foreign key of instance through the request data loader, so the related objects of all the edges
+    of a page are loaded with one query. Relations already fetched with the instance, for example by
+    gql_optimizer select_related, are returned as they are.
+    """
+    field = instance._meta.get_field(field_name)
+    related_id = getattr(instance, field.attname)
+    loader = getattr(info.context, "dataloaders", {}).get(loader_name)
+    if field.is_cached(instance) or loader is None or related_id is None:
+        return getattr(instance, field_name)
+    return loader.load(related_id)
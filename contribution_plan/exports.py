@@ -0,0 +1,81 @@
+import csv
+import json
+
+from django.db.models import Exists, OuterRef
+
+from contribution_plan.models import ContributionPlan, ContributionPlanBundle, ContributionPlanBundleDetails, \
+    PaymentPlan
+from contribution_plan.serializers import get_serializer
+from contribution_plan.utils import valid_on_filter
+
+
+EXPORT_ENTITIES = {
+    "contribution_plan": ContributionPlan,
+    "payment_plan": PaymentPlan,
+    "contribution_plan_bundle": ContributionPlanBundle,
+    "contribution_plan_bundle_details": ContributionPlanBundleDetails,
+}
+EXPORT_FORMATS = ("jsonl", "csv")
+
+
+def get_export_queryset(entity, valid_on=None, is_deleted=None, benefit_plan=None):
+    model_class = EXPORT_ENTITIES[entity]
+    queryset = model_class.objects.all()
+    if valid_on is not None:
+        queryset = queryset.filter(valid_on_filter(valid_on))
+    if is_deleted is not None:
+        queryset = queryset.filter(is_deleted=is_deleted)
+    if benefit_plan is not None:
+        if model_class is ContributionPlanBundleDetails:
+            queryset = queryset.filter(contribution_plan__benefit_plan_id=benefit_plan)
+        elif model_class is ContributionPlanBundle:
+            queryset = queryset.filter(Exists(ContributionPlanBundleDetails.objects.filter(
+                contribution_plan_bundle=OuterRef("pk"),
+                contribution_plan__benefit_plan_id=benefit_plan,
+                is_deleted=False,
+            )))
+        else:
+            queryset = queryset.filter(benefit_plan_id=benefit_plan)
+    # no ordering - rows are streamed in storage order
+    return queryset.order_by()
+
+
+def export_catalog(out, entity, export_format="jsonl", chunk_size=2000, **filters):
+    """
+    Streams the rows of one catalog entity to the text stream out as JSON lines or CSV and returns the number
+    of rows written. Rows are read with a server-side cursor where the database supports it and are never
+    accumulated, so memory use does not depend on the number of rows.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format {export_format}, expected one of {EXPORT_FORMATS}")
+    queryset = get_export_queryset(entity, **filters)
+    serializer = get_serializer(queryset.model)
+    rows = (serializer(obj) for obj in queryset.iterator(chunk_size=chunk_size))
+    if export_format == "csv":
+        return _write_csv(out, serializer.keys, rows)
+    return _write_jsonl(out, rows)
+
+
+def _write_jsonl(out, rows):
+    count = 0
+    for row in rows:
+        out.write(json.dumps(row))
+        out.write("\n")
+        count += 1
+    return count
+
+
+def _write_csv(out, fieldnames, rows):
+    writer = csv.writer(out)
+    writer.writerow(fieldnames)
+    count = 0
+    for row in rows:
+        writer.writerow([_csv_value(row[name]) for name in fieldnames])
+        count += 1
+    return count
+
+
+def _csv_value(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
@@ -0,0 +1,313 @@
+import base64
+import hashlib
+import json
+from contextvars import ContextVar
+from datetime import date, datetime as py_datetime
+
+import graphene
+from django.core.cache import caches
+from django.core.exceptions import EmptyResultSet
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import F, Q
+from django.db.models.query import QuerySet
+from django.utils.dateparse import parse_date, parse_datetime
+from graphene.relay import PageInfo
+from graphql.language.printer import print_ast
+from graphql_relay.connection.arrayconnection import get_offset_with_default, offset_to_cursor
+
+from contribution_plan.apps import ContributionPlanConfig
+from contribution_plan.cache import plan_cache, query_result_cache
+from core import ExtendedConnection
+from core.schema import OrderedDjangoFilterConnectionField
+
+
+KEYSET_CURSOR_PREFIX = "keyset:"
+
+# (model, query fingerprint) of the connection resolved with the result cache, set by PlanConnectionField
+_result_cache_scope = ContextVar("contribution_plan_result_cache_scope", default=None)
+
+
+def encode_keyset_cursor(values):
+    payload = json.dumps([_encode_cursor_value(value) for value in values], cls=DjangoJSONEncoder)
+    return base64.b64encode(f"{KEYSET_CURSOR_PREFIX}{payload}".encode("utf-8")).decode("ascii")
+
+
+def decode_keyset_cursor(cursor):
+    try:
+        decoded = base64.b64decode(cursor).decode("utf-8")
+    except Exception:
+        raise ValueError(f"Invalid keyset cursor {cursor}")
+    if not decoded.startswith(KEYSET_CURSOR_PREFIX):
+        raise ValueError(f"Invalid keyset cursor {cursor}")
+    values = json.loads(decoded[len(KEYSET_CURSOR_PREFIX):])
+    if not isinstance(values, list):
+        raise ValueError(f"Invalid keyset cursor {cursor}")
+    return [_decode_cursor_value(value, cursor) for value in values]
+
+
+def _encode_cursor_value(value):
+    # DjangoJSONEncoder cuts datetimes to milliseconds, the seek filter needs the exact stored value
+    if isinstance(value, py_datetime):
+        return {"datetime": value.isoformat()}
+    if isinstance(value, date):
+        return {"date": value.isoformat()}
+    return value
+
+
+def _decode_cursor_value(value, cursor):
+    if not isinstance(value, dict):
+        return value
+    if "datetime" in value:
+        parsed = parse_datetime(value["datetime"])
+    elif "date" in value:
+        parsed = parse_date(value["date"])
+    else:
+        parsed = None
+    if parsed is None:
+        raise ValueError(f"Invalid keyset cursor {cursor}")
+    return parsed
+
+
+def keyset_ordering(queryset):
+    """
+    (field, descending) pairs of the queryset ordering, completed with the primary key so that every row has
+    a distinct position.
+    """
+    ordering = []
+    for order in queryset.query.order_by:
+        if not isinstance(order, str) or order == "?":
+            raise ValueError("Keyset pagination needs an ordering on fields")
+        descending = order.startswith("-")
+        name = order.lstrip("-+")
+        ordering.append(("id" if name == "pk" else name, descending))
+    if not any(name == "id" for name, _ in ordering):
+        ordering.append(("id", False))
+    return ordering
+
+
+def keyset_page(queryset, first, after=None):
+    """
+    Returns the first rows of the queryset following the row encoded in the after cursor, with their cursors and
+    whether more rows follow. The position is found with a WHERE clause on the ordering columns instead of an
+    OFFSET, so deep pages cost as much as the first one when the ordering is backed by an index.
+    Nulls are ordered last whatever the direction, the same way on every database.
+    """
+    ordering = keyset_ordering(queryset)
+    annotations = {f"_keyset_{index}": F(name) for index, (name, _) in enumerate(ordering)}
+    queryset = queryset.annotate(**annotations).order_by(*[
+        F(name).desc(nulls_last=True) if descending else F(name).asc(nulls_last=True)
+        for name, descending in ordering
+    ])
+    if after:
+        queryset = queryset.filter(_seek_filter(ordering, decode_keyset_cursor(after)))
+
+    rows = list(queryset[:first + 1])
+    has_next_page = len(rows) > first
+    rows = rows[:first]
+    cursors = [encode_keyset_cursor([getattr(row, name) for name in annotations]) for row in rows]
+    return rows, cursors, has_next_page
+
+
+def _seek_filter(ordering, values):
+    if len(values) != len(ordering):
+        raise ValueError("Keyset cursor does not match the ordering of the query")
+    # (a, b, id) > (va, vb, vid) expands to a > va OR (a = va AND b > vb) OR (a = va AND b = vb AND id > vid)
+    seek = Q(pk__in=[])
+    same_prefix = Q()
+    for (name, descending), value in zip(ordering, values):
+        if value is None:
+            # nulls are last, only other nulls share the position
+            same_prefix &= Q(**{f"{name}__isnull": True})
+            continue
+        following = Q(**{f"{name}__{'lt' if descending else 'gt'}": value}) | Q(**{f"{name}__isnull": True})
+        seek |= same_prefix & following
+        same_prefix &= Q(**{name: value})
+    return seek
+
+
+def approximate_count(queryset):
+    """
+    Estimated number of rows of the queryset: the planner estimate on PostgreSQL for listings filtered only by
+    the default manager and the model query filter, elsewhere or for filtered listings, whose estimate can be
+    off by orders of magnitude, the exact count cached for approximate_count_timeout seconds under the SQL of
+    the query.
+    """
+    sql, params = queryset.order_by().query.sql_with_params()
+    connection = connections[queryset.db]
+    if connection.vendor == "postgresql" and not _has_own_filters(queryset):
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
+
+    key = "contribution_plan:count:" + hashlib.sha1(f"{sql}|{params}".encode("utf-8")).hexdigest()
+    cache = caches[plan_cache.cache_alias]
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, ContributionPlanConfig.approximate_count_timeout)
+    return count
+
+
+def _has_own_filters(queryset):
+    # WHERE clause other than the one of the unfiltered listing, e.g. the is_deleted filter of filter_queryset
+    model = queryset.model
+    unfiltered = model._default_manager.all()
+    unfiltered_listings = [unfiltered]
+    if hasattr(model, "filter_queryset"):
+        unfiltered_listings.append(model.filter_queryset(unfiltered))
+    where = _where_sql(queryset)
+    return where is None or all(where != _where_sql(listing) for listing in unfiltered_listings)
+
+
+def _where_sql(queryset):
+    query = queryset.query
+    compiler = query.get_compiler(queryset.db)
+    try:
+        sql, params = compiler.compile(query.where)
+    except EmptyResultSet:
+        return None
+    return sql, tuple(params)
+
+
+class PlanConnection(ExtendedConnection):
+    """
+    ExtendedConnection counting the rows only when totalCount is requested. approximateTotalCount gives
+    the estimate of approximate_count instead, for listings where an exact total is not needed.
+    """
+
+    class Meta:
+        abstract = True
+
+    approximate_total_count = graphene.Int()
+
+    def resolve_total_count(self, info, **kwargs):
+        if self.length is None:
+            self.length = self.iterable.count()
+        return super().resolve_total_count(info, **kwargs)
+
+    def resolve_approximate_total_count(self, info, **kwargs):
+        if self.length is not None:
+            return self.length
+        return approximate_count(self.iterable)
+
+
+def _permission_fingerprint(user):
+    # users with the same rights on the plans get the same results
+    return [bool(user.is_anonymous)] + [bool(user.has_perms(perms)) for perms in (
+        ContributionPlanConfig.gql_query_contributionplan_perms,
+        ContributionPlanConfig.gql_query_contributionplan_admins_perms,
+        ContributionPlanConfig.gql_query_paymentplan_perms,
+        ContributionPlanConfig.gql_query_paymentplan_admins_perms,
+    )]
+
+
+class PlanConnectionField(OrderedDjangoFilterConnectionField):
+    """
+    Connection field of the plan queries. Pages requested with first (and optionally after) are read without
+    counting the rows, the count is left to PlanConnection. When the keyset argument is true, pages are read
+    with keyset_page and the cursors hold the ordering values of the row instead of its offset; only first /
+    after are supported.
+    With result_cache=True, pages are stored in query_result_cache under the query arguments, the selected
+    fields and the permission fingerprint of the user, until a row of the model changes.
+    """
+
+    def __init__(self, *args, result_cache=False, **kwargs):
+        self.result_cache = result_cache
+        super().__init__(*args, **kwargs)
+
+    def get_resolver(self, parent_resolver):
+        resolver = super().get_resolver(parent_resolver)
+        if not self.result_cache:
+            return resolver
+        model = self.model
+
+        def resolve_with_result_cache(root, info, **args):
+            if not query_result_cache.enabled:
+                return resolver(root, info, **args)
+            fingerprint = [info.field_name, [print_ast(field) for field in info.field_asts],
+                           _permission_fingerprint(info.context.user)]
+            token = _result_cache_scope.set((model, fingerprint))
+            try:
+                return resolver(root, info, **args)
+            finally:
+                _result_cache_scope.reset(token)
+
+        return resolve_with_result_cache
+
+    @classmethod
+    def resolve_connection(cls, connection, args, iterable, max_limit=None, **kwargs):
+        scope = _result_cache_scope.get()
+        if scope is None or not isinstance(iterable, QuerySet):
+            return cls._resolve_connection(connection, args, iterable, max_limit, **kwargs)
+
+        model, fingerprint = scope
+        key = query_result_cache.key(model, fingerprint, args, max_limit)
+        payload = query_result_cache.get(key)
+        if payload is None:
+            connection_obj = cls._resolve_connection(connection, args, iterable, max_limit, **kwargs)
+            query_result_cache.set(key, (
+                [edge.node for edge in connection_obj.edges],
+                [edge.cursor for edge in connection_obj.edges],
+                connection_obj.page_info.has_next_page,
+                connection_obj.page_info.has_previous_page,
+                connection_obj.length,
+            ))
+            return connection_obj
+        rows, cursors, has_next_page, has_previous_page, length = payload
+        connection_obj = cls._build_connection(connection, iterable, rows, cursors, has_next_page, has_previous_page)
+        connection_obj.length = length
+        return connection_obj
+
+    @classmethod
+    def _resolve_connection(cls, connection, args, iterable, max_limit=None, **kwargs):
+        if args.get("keyset"):
+            return cls._resolve_keyset_connection(connection, args, iterable, max_limit)
+        first = args.get("first") or max_limit
+        if isinstance(iterable, QuerySet) and first \
+                and not (args.get("last") or args.get("before") or args.get("offset")):
+            return cls._resolve_first_page_connection(connection, args, iterable, min(first, max_limit or first))
+        return super().resolve_connection(connection, args, iterable, max_limit=max_limit, **kwargs)
+
+    @classmethod
+    def _resolve_first_page_connection(cls, connection, args, iterable, first):
+        start = get_offset_with_default(args.get("after"), -1) + 1
+        # one more row than requested tells whether there is a next page
+        rows = list(iterable[start:start + first + 1])
+        cursors = [offset_to_cursor(start + index) for index in range(min(first, len(rows)))]
+        return cls._build_connection(connection, iterable, rows[:first], cursors, len(rows) > first,
+                                     has_previous_page=False)
+
+    @classmethod
+    def _resolve_keyset_connection(cls, connection, args, iterable, max_limit):
+        if args.get("last") or args.get("before") or args.get("offset"):
+            raise ValueError("Keyset pagination supports only first and after")
+        if not isinstance(iterable, QuerySet):
+            raise ValueError("Keyset pagination needs a queryset")
+        first = args.get("first") or max_limit
+        if not first:
+            raise ValueError("Keyset pagination needs first")
+        if max_limit:
+            first = min(first, max_limit)
+        rows, cursors, has_next_page = keyset_page(iterable, first, args.get("after"))
+        return cls._build_connection(connection, iterable, rows, cursors, has_next_page,
+                                     has_previous_page=bool(args.get("after")))
+
+    @classmethod
+    def _build_connection(cls, connection, iterable, rows, cursors, has_next_page, has_previous_page):
+        connection_obj = connection(
+            edges=[connection.Edge(node=row, cursor=cursor) for row, cursor in zip(rows, cursors)],
+            page_info=PageInfo(
+                start_cursor=cursors[0] if cursors else None,
+                end_cursor=cursors[-1] if cursors else None,
+                has_previous_page=has_previous_page,
+                has_next_page=has_next_page,
+            ),
+        )
+        connection_obj.iterable = iterable
+        # counted by PlanConnection when requested
+        connection_obj.length = None
+        return connection_obj
@@ -1,3 +1,7 @@
+from django.db import transaction
+from django.db.models import F, Q
+
+from core import datetime
 from core.gql.gql_mutations import DeleteInputType
 from core.gql.gql_mutations.base_mutation import (
     BaseMutation,
@@ -17,9 +21,7 @@ from contribution_plan.models import (
     ContributionPlanBundle,
     ContributionPlanBundleDetails
 )
-from contribution_plan.services import (
-    ContributionPlanBundleDetails as ContributionPlanBundleDetailsService
-)
+from contribution_plan.utils import bulk_create_history_objects
 
 
 class CreateContributionPlanBundleMutation(BaseHistoryModelCreateMutationMixin, BaseMutation):
@@ -58,60 +60,50 @@ class ReplaceContributionPlanBundleMutation(BaseHistoryModelReplaceMutationMixin
     def _mutate(cls, user, **data):
         super()._mutate(user, **data)
         # copy attached contribution plan bundles into new version
-        list_cpbd = ContributionPlanBundleDetails.objects.filter(
+        list_cpbd = list(ContributionPlanBundleDetails.objects.filter(
             contribution_plan_bundle__id=data["uuid"],
             is_deleted=False,
-        )
+        ))
         old_cpb = ContributionPlanBundle.objects.get(id=data["uuid"], is_deleted=False)
         new_cpb = ContributionPlanBundle.objects.get(id=old_cpb.replacement_uuid, is_deleted=False)
-        if new_cpb:
-            for cpbd in list_cpbd:
-                cls._attach_contribution_plan_to_new_version_of_bundle(
-                    user,
-                    cpbd.contribution_plan.id,
-                    new_cpb.id,
-                    new_cpb.date_valid_from,
-                    new_cpb.date_valid_to
-                )
-                cls._update_old_validity_to(cpbd, new_cpb, user)
+        if new_cpb and list_cpbd:
+            with transaction.atomic():
+                cls._attach_contribution_plans_to_new_version_of_bundle(user, list_cpbd, new_cpb)
+                cls._update_old_validity_to(user, list_cpbd, new_cpb)
 
     @classmethod
-    def _create_payload_cpbd(cls, cp_uuid, cpb_uuid, date_valid_from, date_valid_to):
-        return {
-            "contribution_plan_id": f"{cp_uuid}",
-            "contribution_plan_bundle_id": f"{cpb_uuid}",
-            "date_valid_from": date_valid_from,
-            "date_valid_to": date_valid_to
-        }
+    def _attach_contribution_plans_to_new_version_of_bundle(cls, user, list_cpbd, new_cpb):
+        new_list_cpbd = [
+            ContributionPlanBundleDetails(
+                contribution_plan_id=cpbd.contribution_plan_id,
+                contribution_plan_bundle_id=new_cpb.id,
+                date_valid_from=new_cpb.date_valid_from,
+                date_valid_to=new_cpb.date_valid_to,
+            ) for cpbd in list_cpbd
+        ]
+        return bulk_create_history_objects(ContributionPlanBundleDetails, new_list_cpbd, user)
 
     @classmethod
-    def _attach_contribution_plan_to_new_version_of_bundle(cls, user, cp_uuid, cpb_uuid, valid_from, valid_to):
-        cpbd_service = ContributionPlanBundleDetailsService(user)
-        payload_cpbd = cls._create_payload_cpbd(cp_uuid, cpb_uuid, valid_from, valid_to)
-        response = cpbd_service.create(payload_cpbd)
-        return response
-
-    @classmethod
-    def _update_old_validity_to(cls, old_cpbd, new_cpb, user):
-        cpbd_service = ContributionPlanBundleDetailsService(user)
-        payload_update_cpbd = cls._create_payload_update_cpbd(
-            old_cpbd.id,
-            new_cpb.date_valid_from,
-            old_cpbd.date_valid_to
+    def _update_old_validity_to(cls, user, list_cpbd, new_cpb):
+        # old details keep their validity end if it is before the start of the new bundle version,
+        # the other ones are moved to the start of the new version with one update
+        new_valid_from = new_cpb.date_valid_from
+        cpbd_ids = list(ContributionPlanBundleDetails.objects.filter(
+            Q(date_valid_to__isnull=True) | Q(date_valid_to__gt=new_valid_from),
+            id__in=[cpbd.id for cpbd in list_cpbd],
+        ).values_list("id", flat=True))
+        if not cpbd_ids:
+            return []
+        ContributionPlanBundleDetails.objects.filter(id__in=cpbd_ids).update(
+            date_valid_to=new_valid_from,
+            date_updated=datetime.datetime.now(),
+            user_updated=user,
+            version=F("version") + 1,
         )
-        response = cpbd_service.update(payload_update_cpbd)
-        return response
-
-    @classmethod
-    def _create_payload_update_cpbd(cls, cpbd_uuid, new_valid_from, old_valid_to):
-        if old_valid_to:
-            new_valid_from = new_valid_from if old_valid_to > new_valid_from else old_valid_to
-        else:
-            new_valid_from = new_valid_from
-        return {
-            "id": f"{cpbd_uuid}",
-            "date_valid_to": new_valid_from,
-        }
+        updated_list_cpbd = list(ContributionPlanBundleDetails.objects.filter(id__in=cpbd_ids))
+        ContributionPlanBundleDetails.history.bulk_history_create(updated_list_cpbd, update=True, default_user=user)
+        ContributionPlanBundleDetails._notify_bulk_change(cpbd_ids)
+        return updated_list_cpbd
 
     class Input(ContributionPlanBundleReplaceInputType):
         pass
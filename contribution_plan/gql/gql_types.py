@@ -1,7 +1,10 @@
 import graphene
+import graphene_django_optimizer as gql_optimizer
+from contribution_plan.dataloaders import load_related
+from contribution_plan.gql.connection_fields import PlanConnection
 from contribution_plan.models import ContributionPlanBundle, ContributionPlan, \
     ContributionPlanBundleDetails, PaymentPlan
-from core import ExtendedConnection, prefix_filterset
+from core import prefix_filterset
 from graphene_django import DjangoObjectType
 from product.schema import ProductGQLType
 
@@ -26,7 +29,11 @@ class ContributionPlanGQLType(DjangoObjectType):
             "is_deleted": ["exact"]
         }
 
-        connection_class = ExtendedConnection
+        connection_class = PlanConnection
+
+    @gql_optimizer.resolver_hints(model_field="benefit_plan")
+    def resolve_benefit_plan(self, info):
+        return load_related(self, "benefit_plan", info, "product_loader")
 
     @classmethod
     def get_queryset(cls, queryset, info):
@@ -51,7 +58,7 @@ class ContributionPlanBundleGQLType(DjangoObjectType):
             "is_deleted": ["exact"]
         }
 
-        connection_class = ExtendedConnection
+        connection_class = PlanConnection
 
     @classmethod
     def get_queryset(cls, queryset, info):
@@ -77,7 +84,15 @@ class ContributionPlanBundleDetailsGQLType(DjangoObjectType):
             "is_deleted": ["exact"]
         }
 
-        connection_class = ExtendedConnection
+        connection_class = PlanConnection
+
+    @gql_optimizer.resolver_hints(model_field="contribution_plan")
+    def resolve_contribution_plan(self, info):
+        return load_related(self, "contribution_plan", info, "contribution_plan_loader")
+
+    @gql_optimizer.resolver_hints(model_field="contribution_plan_bundle")
+    def resolve_contribution_plan_bundle(self, info):
+        return load_related(self, "contribution_plan_bundle", info, "contribution_plan_bundle_loader")
 
     @classmethod
     def get_queryset(cls, queryset, info):
@@ -104,8 +119,37 @@ class PaymentPlanGQLType(DjangoObjectType):
             "is_deleted": ["exact"]
         }
 
-        connection_class = ExtendedConnection
+        connection_class = PlanConnection
+
+    @gql_optimizer.resolver_hints(model_field="benefit_plan")
+    def resolve_benefit_plan(self, info):
+        return load_related(self, "benefit_plan", info, "product_loader")
 
     @classmethod
     def get_queryset(cls, queryset, info):
         return PaymentPlan.get_queryset(queryset, info)
+
+
+class PlanSearchResultGQLType(graphene.ObjectType):
+    type = graphene.String()
+    id = graphene.UUID()
+    code = graphene.String()
+    name = graphene.String()
+    rank = graphene.Int()
+
+
+class PlanFieldChangeGQLType(graphene.ObjectType):
+    field = graphene.String()
+    old_value = graphene.JSONString()
+    new_value = graphene.JSONString()
+
+
+class PlanHistoryEntryGQLType(graphene.ObjectType):
+    version = graphene.Int()
+    history_date = graphene.String()
+    history_type = graphene.String()
+    history_user_id = graphene.String()
+    changes = graphene.List(PlanFieldChangeGQLType)
+
+    def resolve_changes(self, info, **kwargs):
+        return [PlanFieldChangeGQLType(**change) for change in self.changes]
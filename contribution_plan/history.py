@@ -0,0 +1,87 @@
+from django.db.models import F, Window
+from django.db.models.functions import Lag
+
+from contribution_plan.serializers import get_serializer, json_safe
+from contribution_plan.utils import to_datetime
+
+# audit columns changing with every version, left out of the diffs
+IGNORED_FIELDS = {"id", "version", "date_created", "date_updated", "user_created", "user_updated"}
+
+_ENTRY_FIELDS = ("history_id", "history_date", "history_type", "history_user_id", "version")
+_HISTORY_ORDERING = ("history_date", "history_id")
+
+
+def tracked_fields(model_class):
+    return [(name, attname) for name, attname, _ in get_serializer(model_class).fields if name not in IGNORED_FIELDS]
+
+
+def version_diff(model_class, plan_id, version_from, version_to):
+    """
+    Change entry from version_from to version_to of the plan, comparing only the two historical rows. When a
+    version has several historical rows, the last one is used.
+    """
+    fields = tracked_fields(model_class)
+    rows = model_class.history.filter(id=plan_id, version__in=[version_from, version_to]) \
+        .order_by("version", *_HISTORY_ORDERING).values(*_ENTRY_FIELDS, *[attname for _, attname in fields])
+    rows_by_version = {row["version"]: row for row in rows}
+    for version in (version_from, version_to):
+        if version not in rows_by_version:
+            raise ValueError(f"Version {version} of {model_class.__name__} {plan_id} not found")
+    previous, current = rows_by_version[version_from], rows_by_version[version_to]
+    return _entry(current, [
+        (name, previous[attname], current[attname]) for name, attname in fields
+        if previous[attname] != current[attname]
+    ])
+
+
+def iter_changes(model_class, plan_id, date_from=None, date_to=None, chunk_size=500):
+    """
+    Yields the change entries of the plan recorded between date_from (included) and date_to (excluded), ordered
+    by history date. Each historical row is compared with the previous one by a LAG window over the history
+    table, so the rows are streamed in chunks and never held in memory together.
+    """
+    fields = tracked_fields(model_class)
+    history = model_class.history.filter(id=plan_id)
+    if date_from is not None:
+        date_from = to_datetime(date_from)
+        # the window has to start at the last row before the range, the first change of the range is compared to it
+        baseline_date = history.filter(history_date__lt=date_from).order_by(
+            *[f"-{field}" for field in _HISTORY_ORDERING]
+        ).values_list("history_date", flat=True).first()
+        history = history.filter(history_date__gte=baseline_date or date_from)
+    if date_to is not None:
+        history = history.filter(history_date__lt=to_datetime(date_to))
+
+    ordering = [F(field).asc() for field in _HISTORY_ORDERING]
+    rows = history.annotate(
+        _previous_history_id=Window(Lag("history_id"), order_by=ordering),
+        **{f"_previous_{attname}": Window(Lag(attname), order_by=ordering) for _, attname in fields}
+    ).order_by(*_HISTORY_ORDERING).values(
+        *_ENTRY_FIELDS, "_previous_history_id", *[attname for _, attname in fields],
+        *[f"_previous_{attname}" for _, attname in fields]
+    )
+    for row in rows.iterator(chunk_size=chunk_size):
+        if date_from is not None and row["history_date"] < date_from:
+            continue
+        if row["_previous_history_id"] is None:
+            # first historical row of the plan, every set field is a change
+            changes = [(name, None, row[attname]) for name, attname in fields if row[attname] is not None]
+        else:
+            changes = [
+                (name, row[f"_previous_{attname}"], row[attname]) for name, attname in fields
+                if row[f"_previous_{attname}"] != row[attname]
+            ]
+        yield _entry(row, changes)
+
+
+def _entry(row, changes):
+    return {
+        "version": row["version"],
+        "history_date": json_safe(row["history_date"]),
+        "history_type": row["history_type"],
+        "history_user_id": json_safe(row["history_user_id"]),
+        "changes": [
+            {"field": name, "old_value": json_safe(old_value), "new_value": json_safe(new_value)}
+            for name, old_value, new_value in changes
+        ],
+    }
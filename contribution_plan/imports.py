@@ -0,0 +1,205 @@
+import csv
+import json
+import os
+from collections import Counter
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from calculation.apps import CALCULATION_RULES
+from contribution_plan.models import ContributionPlan, ContributionPlanBundle, ContributionPlanBundleDetails, \
+    PaymentPlan
+from contribution_plan.utils import bulk_create_history_objects
+from product.models import Product
+
+
+IMPORT_ENTITIES = {
+    "contribution_plan": ContributionPlan,
+    "payment_plan": PaymentPlan,
+    "contribution_plan_bundle": ContributionPlanBundle,
+    "contribution_plan_bundle_details": ContributionPlanBundleDetails,
+}
+IMPORT_FORMATS = ("jsonl", "csv")
+
+# columns set by the import itself, ignored so that files produced by export_plan_catalog can be imported back
+_IGNORED_COLUMNS = {
+    "id", "uuid", "version", "is_deleted", "replacement_uuid",
+    "user_created", "user_updated", "date_created", "date_updated",
+}
+# fields filled in by the bulk insert or validated for the whole file with a single query
+_NOT_VALIDATED_FIELDS = [
+    "id", "benefit_plan", "contribution_plan", "contribution_plan_bundle",
+    "user_created", "user_updated", "date_created", "date_updated", "replacement_uuid",
+]
+_BUNDLE_DETAILS_REFERENCES = {
+    "contribution_plan_bundle": ContributionPlanBundle,
+    "contribution_plan": ContributionPlan,
+}
+
+
+class CatalogImportError(Exception):
+    """
+    Raised before anything is written when rows of the import file are invalid. errors holds (row number, message)
+    pairs, rows being numbered from 1 in the order of the file.
+    """
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("\n".join(f"row {row_number}: {message}" for row_number, message in errors))
+
+
+def read_rows(path, import_format="jsonl"):
+    if import_format not in IMPORT_FORMATS:
+        raise ValueError(f"Unknown import format {import_format}, expected one of {IMPORT_FORMATS}")
+    with open(path, newline="", encoding="utf-8") as source:
+        if import_format == "csv":
+            # empty cells are missing values, json_ext is stored as JSON text
+            rows = [{key: value for key, value in row.items() if value != ""} for row in csv.DictReader(source)]
+            for row in rows:
+                if isinstance(row.get("json_ext"), str):
+                    row["json_ext"] = json.loads(row["json_ext"])
+            return rows
+        return [json.loads(line) for line in source if line.strip()]
+
+
+def import_catalog(entity, rows, user, chunk_size=500, checkpoint_path=None, progress=None):
+    """
+    Validates all rows, then inserts them with their history rows in chunks, each chunk in its own transaction.
+    When checkpoint_path is given, the number of committed rows is recorded there after every chunk and the rows
+    already committed are skipped when the same import is run again; the checkpoint is removed once every row
+    is imported. progress is called with (imported rows, total rows) after each chunk.
+    Returns the number of rows inserted by this run.
+    """
+    model_class = IMPORT_ENTITIES[entity]
+    committed = _read_checkpoint(checkpoint_path, entity, len(rows))
+    pending_rows = rows[committed:]
+    objects = _validate(model_class, pending_rows, first_row_number=committed + 1)
+
+    for start in range(0, len(objects), chunk_size):
+        chunk = objects[start:start + chunk_size]
+        with transaction.atomic():
+            bulk_create_history_objects(model_class, chunk, user, batch_size=chunk_size)
+        committed += len(chunk)
+        _write_checkpoint(checkpoint_path, entity, committed, len(rows))
+        if progress:
+            progress(committed, len(rows))
+
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return len(objects)
+
+
+def _validate(model_class, rows, first_row_number):
+    errors = []
+    objects = []
+    field_names = {field.name for field in model_class._meta.concrete_fields}
+    for row_number, row in enumerate(rows, first_row_number):
+        data = {key: value for key, value in row.items() if key not in _IGNORED_COLUMNS}
+        unknown_columns = set(data) - field_names - {"benefit_plan_id"}
+        if unknown_columns:
+            errors.append((row_number, f"unknown columns {sorted(unknown_columns)}"))
+            continue
+        if "benefit_plan" in data:
+            data["benefit_plan_id"] = data.pop("benefit_plan")
+        references = {key: data.pop(key) for key in _BUNDLE_DETAILS_REFERENCES if key in data}
+        try:
+            obj = model_class(**data)
+            obj.clean_fields(exclude=_NOT_VALIDATED_FIELDS)
+            if model_class in (ContributionPlan, PaymentPlan):
+                obj.benefit_plan_id = model_class._meta.get_field("benefit_plan").to_python(obj.benefit_plan_id)
+        except (ValidationError, TypeError, ValueError) as exc:
+            errors.append((row_number, str(exc)))
+            continue
+        objects.append((row_number, obj, references))
+
+    if model_class is ContributionPlanBundleDetails:
+        errors.extend(_resolve_bundle_details_references(objects))
+    else:
+        errors.extend(_check_duplicate_codes(model_class, objects))
+    if model_class in (ContributionPlan, PaymentPlan):
+        errors.extend(_check_plan_references(objects))
+
+    if errors:
+        raise CatalogImportError(sorted(errors, key=lambda error: error[0]))
+    return [obj for _, obj, _ in objects]
+
+
+def _check_duplicate_codes(model_class, objects):
+    codes = Counter(obj.code for _, obj, _ in objects if obj.code)
+    existing_codes = set(
+        model_class.objects.filter(code__in=list(codes), is_deleted=False).values_list("code", flat=True)
+    )
+    for row_number, obj, _ in objects:
+        if codes[obj.code] > 1:
+            yield row_number, f"code {obj.code} is used by more than one row of the file"
+        elif obj.code in existing_codes:
+            yield row_number, f"code {obj.code} already exists"
+
+
+def _check_plan_references(objects):
+    benefit_plan_ids = {obj.benefit_plan_id for _, obj, _ in objects}
+    existing_benefit_plan_ids = set(Product.objects.filter(id__in=benefit_plan_ids).values_list("id", flat=True))
+    calculation_uuids = {str(rule.uuid) for rule in CALCULATION_RULES}
+    for row_number, obj, _ in objects:
+        if obj.benefit_plan_id not in existing_benefit_plan_ids:
+            yield row_number, f"benefit plan {obj.benefit_plan_id} does not exist"
+        if str(obj.calculation) not in calculation_uuids:
+            yield row_number, f"calculation {obj.calculation} is not a registered calculation rule"
+
+
+def _resolve_bundle_details_references(objects):
+    # bundles and plans are referenced by code, only current versions can be referenced
+    ids_by_code = {}
+    for field_name, referenced_model in _BUNDLE_DETAILS_REFERENCES.items():
+        codes = {references.get(field_name) for _, _, references in objects}
+        ids_by_code[field_name] = {}
+        for code, referenced_id in referenced_model.objects.filter(
+                code__in=codes, is_deleted=False, replacement_uuid__isnull=True).values_list("code", "id"):
+            ids_by_code[field_name].setdefault(code, []).append(referenced_id)
+
+    resolved = []
+    for row_number, obj, references in objects:
+        row_errors = []
+        for field_name in _BUNDLE_DETAILS_REFERENCES:
+            code = references.get(field_name)
+            matching_ids = ids_by_code[field_name].get(code, [])
+            if len(matching_ids) != 1:
+                reason = "is missing" if code is None else "does not exist" if not matching_ids else "is ambiguous"
+                row_errors.append((row_number, f"{field_name} {code} {reason}"))
+                continue
+            setattr(obj, f"{field_name}_id", matching_ids[0])
+        if row_errors:
+            yield from row_errors
+        else:
+            resolved.append((row_number, obj))
+
+    pairs = Counter((obj.contribution_plan_bundle_id, obj.contribution_plan_id) for _, obj in resolved)
+    existing_pairs = set(ContributionPlanBundleDetails.objects.filter(
+        contribution_plan_bundle_id__in={bundle_id for bundle_id, _ in pairs}, is_deleted=False
+    ).values_list("contribution_plan_bundle_id", "contribution_plan_id"))
+    for row_number, obj in resolved:
+        pair = (obj.contribution_plan_bundle_id, obj.contribution_plan_id)
+        if pairs[pair] > 1:
+            yield row_number, "contribution plan is attached to the bundle by more than one row of the file"
+        elif pair in existing_pairs:
+            yield row_number, "contribution plan is already attached to the bundle"
+
+
+def _read_checkpoint(checkpoint_path, entity, total_rows):
+    if not checkpoint_path or not os.path.exists(checkpoint_path):
+        return 0
+    with open(checkpoint_path, encoding="utf-8") as checkpoint_file:
+        checkpoint = json.load(checkpoint_file)
+    if checkpoint["entity"] != entity or checkpoint["total_rows"] != total_rows:
+        raise ValueError(f"Checkpoint {checkpoint_path} belongs to another import")
+    return checkpoint["committed_rows"]
+
+
+def _write_checkpoint(checkpoint_path, entity, committed_rows, total_rows):
+    if not checkpoint_path:
+        return
+    # written next to the checkpoint and renamed, so an interrupted write never leaves a truncated checkpoint
+    temporary_path = f"{checkpoint_path}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as checkpoint_file:
+        json.dump({"entity": entity, "committed_rows": committed_rows, "total_rows": total_rows}, checkpoint_file)
+    os.replace(temporary_path, checkpoint_path)
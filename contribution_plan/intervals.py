@@ -0,0 +1,210 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict, namedtuple
+from datetime import datetime as py_datetime
+
+from django.apps import apps
+from django.core.cache import caches
+from django.db import transaction
+
+
+DetailsInterval = namedtuple("DetailsInterval", ["id", "contribution_plan_id", "date_valid_from", "date_valid_to"])
+
+# end of the open-ended intervals
+_OPEN_END = py_datetime.max
+
+
+class IntervalTree:
+    """
+    Static augmented interval tree of half-open [start, end) intervals. The intervals are sorted by start and the
+    tree is implicit: the node of the range [lo, hi) is its middle element, max_ends holds the latest end of the
+    node range. Overlap queries visit O(log n + k) nodes for k results.
+    """
+    __slots__ = ("starts", "ends", "max_ends", "items")
+
+    def __init__(self, intervals):
+        """
+        intervals: (start, end, item) tuples, a None end meaning open-ended.
+        """
+        intervals = sorted(intervals, key=lambda interval: interval[0])
+        self.starts = [start for start, _, _ in intervals]
+        self.ends = [_OPEN_END if end is None else end for _, end, _ in intervals]
+        self.items = [item for _, _, item in intervals]
+        self.max_ends = list(self.ends)
+        self._augment(0, len(intervals))
+
+    def __len__(self):
+        return len(self.items)
+
+    def overlapping(self, start, end=None):
+        """
+        Items of the intervals overlapping [start, end), ordered by interval start. A None end means open-ended.
+        """
+        result = []
+        self._collect(0, len(self.items), start, _OPEN_END if end is None else end, result)
+        return result
+
+    def _augment(self, lo, hi):
+        if lo >= hi:
+            return None
+        mid = (lo + hi) // 2
+        max_end = self.ends[mid]
+        for child_max_end in (self._augment(lo, mid), self._augment(mid + 1, hi)):
+            if child_max_end is not None and child_max_end > max_end:
+                max_end = child_max_end
+        self.max_ends[mid] = max_end
+        return max_end
+
+    def _collect(self, lo, hi, start, end, result):
+        if lo >= hi:
+            return
+        mid = (lo + hi) // 2
+        # no interval of the range ends after the query start
+        if self.max_ends[mid] <= start:
+            return
+        self._collect(lo, mid, start, end, result)
+        # intervals on the right start after the middle one
+        if self.starts[mid] < end:
+            if self.ends[mid] > start:
+                result.append(self.items[mid])
+            self._collect(mid + 1, hi, start, end, result)
+
+
+class _TreeEntry:
+    __slots__ = ("version", "tree", "checked_at")
+
+    def __init__(self, version, tree, checked_at):
+        self.version = version
+        self.tree = tree
+        self.checked_at = checked_at
+
+
+class BundleDetailsIntervalIndex:
+    """
+    Process-local interval trees of the validity of the not deleted details of every bundle, loaded on the first
+    lookup of the bundle. Like PlanCache, a generation counter per bundle is kept in the Django cache and
+    incremented whenever a details of the bundle is saved, deleted, replaced, moved or written in bulk; the trees
+    of other processes are revalidated against it after local_ttl seconds. A changed details drops the whole
+    tree of its bundle, rebuilt on the next lookup. The trees hold at most max_intervals intervals in total, the
+    least recently used bundles are evicted first.
+    """
+    KEY_PREFIX = "contribution_plan:intervals"
+
+    def __init__(self, cache_alias="default", max_intervals=200000, local_ttl=5):
+        self.cache_alias = cache_alias
+        self.max_intervals = max_intervals
+        self.local_ttl = local_ttl
+        self._trees = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+
+    def configure(self, cache_alias, max_intervals, local_ttl):
+        self.cache_alias = cache_alias
+        self.max_intervals = max_intervals
+        self.local_ttl = local_ttl
+        self.clear()
+
+    @property
+    def _shared(self):
+        return caches[self.cache_alias]
+
+    def overlapping(self, bundle_id, date_from, date_to=None):
+        """
+        DetailsInterval of the not deleted details of the bundle whose validity overlaps [date_from, date_to),
+        ordered by date_valid_from. A None date_to means open-ended.
+        """
+        from contribution_plan.utils import to_datetime
+        tree = self._tree(_key(bundle_id))
+        return tree.overlapping(to_datetime(date_from), None if date_to is None else to_datetime(date_to))
+
+    def invalidate(self, bundle_id):
+        key = _key(bundle_id)
+        self._drop(key)
+        # readers that loaded the details before the commit could have stored the old tree meanwhile
+        transaction.on_commit(lambda: self._drop(key))
+
+    def clear(self):
+        with self._lock:
+            self._trees.clear()
+            self._size = 0
+
+    def info(self):
+        return {
+            "hits": self.hits,
+            "loads": self.loads,
+            "bundles": len(self._trees),
+            "intervals": self._size,
+            "max_intervals": self.max_intervals,
+        }
+
+    def _tree(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._trees.get(key)
+            if entry is not None:
+                self._trees.move_to_end(key)
+        if entry is not None and now - entry.checked_at < self.local_ttl:
+            self.hits += 1
+            return entry.tree
+
+        generation_key = self._generation_key(key)
+        version = self._shared.get(generation_key)
+        if version is None:
+            # starts at the current time in milliseconds, above any generation the evicted counter reached
+            self._shared.add(generation_key, int(time.time() * 1000), None)
+            version = self._shared.get(generation_key)
+        if entry is not None and entry.version == version:
+            entry.checked_at = now
+            self.hits += 1
+            return entry.tree
+
+        self.loads += 1
+        tree = IntervalTree(self._load_intervals(key))
+        self._store(key, _TreeEntry(version, tree, now))
+        return tree
+
+    @staticmethod
+    def _load_intervals(bundle_id):
+        details_model = apps.get_model("contribution_plan", "ContributionPlanBundleDetails")
+        rows = details_model.objects.filter(contribution_plan_bundle_id=bundle_id, is_deleted=False).values_list(
+            "id", "contribution_plan_id", "date_valid_from", "date_valid_to"
+        )
+        return [(row[2], row[3], DetailsInterval(*row)) for row in rows]
+
+    def _store(self, key, entry):
+        with self._lock:
+            previous = self._trees.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous.tree)
+            if len(entry.tree) > self.max_intervals:
+                # larger than the whole budget, used for this lookup only
+                return
+            self._trees[key] = entry
+            self._size += len(entry.tree)
+            while self._size > self.max_intervals:
+                _, evicted = self._trees.popitem(last=False)
+                self._size -= len(evicted.tree)
+
+    def _drop(self, key):
+        with self._lock:
+            entry = self._trees.pop(key, None)
+            if entry is not None:
+                self._size -= len(entry.tree)
+        generation_key = self._generation_key(key)
+        try:
+            self._shared.incr(generation_key)
+        except ValueError:
+            self._shared.add(generation_key, int(time.time() * 1000), None)
+
+    def _generation_key(self, key):
+        return f"{self.KEY_PREFIX}:{key}:generation"
+
+
+def _key(bundle_id):
+    return str(uuid.UUID(str(bundle_id)))
+
+
+bundle_details_intervals = BundleDetailsIntervalIndex()
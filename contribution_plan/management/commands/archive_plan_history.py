@@ -0,0 +1,58 @@
+import os
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date, parse_datetime
+
+from contribution_plan.archive import ARCHIVE_ENTITIES, archive_history, archive_horizon
+
+
+class Command(BaseCommand):
+    help = "Moves historical rows of plans, bundles and bundle details older than the archive horizon to gzip " \
+           "compressed JSON lines files. The first and the last historical row of every object are kept. " \
+           "An interrupted run started again with the same arguments resumes after the last archived chunk."
+
+    def add_arguments(self, parser):
+        # no choices, argparse checks the empty default of a nargs="*" positional against them
+        parser.add_argument("entities", nargs="*",
+                            help=f"entities whose history is archived among {', '.join(sorted(ARCHIVE_ENTITIES))}, "
+                                 f"all of them by default")
+        parser.add_argument("--out-dir", default=".", help="directory of the archive files")
+        parser.add_argument("--older-than-days", type=int, default=None,
+                            help="archive horizon in days, defaults to history_archive_horizon_days")
+        parser.add_argument("--before", default=None,
+                            help="archive the rows recorded before this ISO date instead of using the horizon")
+        parser.add_argument("--chunk-size", type=int, default=1000, help="number of rows archived together")
+
+    def handle(self, *args, **options):
+        unknown_entities = sorted(set(options["entities"]) - set(ARCHIVE_ENTITIES))
+        if unknown_entities:
+            raise CommandError(f"Unknown entities {', '.join(unknown_entities)}, "
+                               f"choose among {', '.join(sorted(ARCHIVE_ENTITIES))}")
+        before = self._parse_before(options["before"]) if options["before"] \
+            else archive_horizon(options["older_than_days"])
+        for entity in options["entities"] or sorted(ARCHIVE_ENTITIES):
+            archive_path = os.path.join(options["out_dir"], f"{entity}_history_before_{before:%Y%m%d}.jsonl.gz")
+            report = archive_history(entity, before, archive_path, options["chunk_size"], progress=self._progress)
+            self.stdout.write(
+                f"{entity}: archived {report['archived_rows']} rows to {archive_path}, "
+                f"{report['json_bytes']} bytes of JSON compressed to {report['archive_bytes']} bytes"
+                + (f", {report['table_bytes']} table bytes reclaimable by VACUUM"
+                   if report["table_bytes"] is not None else "")
+            )
+
+    @staticmethod
+    def _parse_before(value):
+        try:
+            before = parse_datetime(value)
+            if before is None:
+                before_date = parse_date(value)
+                before = datetime.combine(before_date, time.min) if before_date else None
+        except ValueError:
+            before = None
+        if before is None:
+            raise CommandError(f"Invalid --before date {value}")
+        return before
+
+    def _progress(self, report):
+        self.stdout.write(f"{report['entity']}: {report['archived_rows']} rows archived")
@@ -0,0 +1,24 @@
+import pkgutil
+from importlib import import_module
+
+from django.core.management.base import BaseCommand
+
+from contribution_plan import benchmarks
+
+
+BENCHMARKS = sorted(module.name for module in pkgutil.iter_modules(benchmarks.__path__))
+
+
+class Command(BaseCommand):
+    help = "Runs one of the contribution plan micro-benchmarks and prints its timings. " \
+           "Benchmarks creating test data roll it back when finished."
+
+    def add_arguments(self, parser):
+        parser.add_argument("benchmark", choices=BENCHMARKS)
+        parser.add_argument("--size", type=int, default=None, help="number of rows or objects to benchmark on")
+        parser.add_argument("--rounds", type=int, default=None, help="number of timed repetitions")
+
+    def handle(self, *args, **options):
+        benchmark = import_module(f"contribution_plan.benchmarks.{options['benchmark']}")
+        kwargs = {key: options[key] for key in ("size", "rounds") if options[key] is not None}
+        benchmark.run(self.stdout, **kwargs)
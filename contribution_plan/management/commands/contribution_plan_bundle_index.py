@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from contribution_plan.models import ContributionPlanBundleIndex
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the bundle index (bundles by calculation and benefit plan) from the bundle details and " \
+           "contribution plans, or only checks that it is consistent with them."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--check", action="store_true", help="only report inconsistent entries")
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        if options["check"]:
+            inconsistent = ContributionPlanBundleIndex.objects.check_consistency()
+            if inconsistent:
+                raise CommandError(
+                    f"{len(inconsistent)} inconsistent bundle index entries, for bundle details: "
+                    + ", ".join(str(details_id) for details_id in inconsistent[:20])
+                )
+            self.stdout.write("Bundle index is consistent")
+            return
+        ContributionPlanBundleIndex.objects.refresh(batch_size=options["batch_size"])
+        self.stdout.write(f"Bundle index rebuilt, {ContributionPlanBundleIndex.objects.count()} entries")
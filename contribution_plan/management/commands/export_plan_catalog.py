@@ -0,0 +1,46 @@
+import argparse
+import sys
+
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_date
+
+from contribution_plan.exports import EXPORT_ENTITIES, EXPORT_FORMATS, export_catalog
+
+
+class Command(BaseCommand):
+    help = "Streams contribution plans, payment plans, bundles or bundle details to a JSONL or CSV file"
+
+    def add_arguments(self, parser):
+        parser.add_argument("entity", choices=sorted(EXPORT_ENTITIES))
+        parser.add_argument("--format", dest="export_format", choices=EXPORT_FORMATS, default="jsonl")
+        parser.add_argument("--output", default=None, help="output file, standard output if not given")
+        parser.add_argument("--valid-on", type=_valid_on, default=None,
+                            help="only rows valid on this date (YYYY-MM-DD)")
+        parser.add_argument("--is-deleted", choices=("true", "false"), default=None)
+        parser.add_argument("--benefit-plan", type=int, default=None, help="id of the benefit plan (product)")
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        filters = {
+            "valid_on": options["valid_on"],
+            "is_deleted": None if options["is_deleted"] is None else options["is_deleted"] == "true",
+            "benefit_plan": options["benefit_plan"],
+        }
+        if options["output"]:
+            with open(options["output"], "w", newline="", encoding="utf-8") as out:
+                count = export_catalog(out, options["entity"], options["export_format"], options["chunk_size"],
+                                       **filters)
+        else:
+            count = export_catalog(sys.stdout, options["entity"], options["export_format"], options["chunk_size"],
+                                   **filters)
+        self.stderr.write(f"Exported {count} rows of {options['entity']}")
+
+
+def _valid_on(value):
+    try:
+        valid_on = parse_date(value)
+    except ValueError:
+        valid_on = None
+    if valid_on is None:
+        raise argparse.ArgumentTypeError(f"Invalid date {value}, expected YYYY-MM-DD")
+    return valid_on
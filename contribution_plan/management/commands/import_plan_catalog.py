@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from contribution_plan.imports import IMPORT_ENTITIES, IMPORT_FORMATS, CatalogImportError, import_catalog, read_rows
+from core.models import User
+
+
+class Command(BaseCommand):
+    help = "Imports contribution plans, payment plans, bundles or bundle details from a JSONL or CSV file. " \
+           "Bundle details reference their bundle and contribution plan by code, so plans and bundles " \
+           "have to be imported first."
+
+    def add_arguments(self, parser):
+        parser.add_argument("entity", choices=sorted(IMPORT_ENTITIES))
+        parser.add_argument("input")
+        parser.add_argument("--format", dest="import_format", choices=IMPORT_FORMATS, default="jsonl")
+        parser.add_argument("--username", default="admin", help="user recorded as creator of the imported rows")
+        parser.add_argument("--chunk-size", type=int, default=500, help="number of rows committed together")
+        parser.add_argument("--checkpoint", default=None,
+                            help="checkpoint file, defaults to <input>.checkpoint; "
+                                 "an interrupted import started again resumes after the last committed chunk")
+
+    def handle(self, *args, **options):
+        user = User.objects.get(username=options["username"])
+        rows = read_rows(options["input"], options["import_format"])
+        checkpoint_path = options["checkpoint"] or f"{options['input']}.checkpoint"
+        try:
+            count = import_catalog(options["entity"], rows, user, options["chunk_size"], checkpoint_path,
+                                   progress=self._progress)
+        except CatalogImportError as exc:
+            raise CommandError(f"Import of {options['input']} failed, no row was written:\n{exc}")
+        self.stdout.write(f"Imported {count} rows of {options['entity']}")
+
+    def _progress(self, imported_rows, total_rows):
+        self.stdout.write(f"{imported_rows}/{total_rows} rows committed")
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from contribution_plan.models import ActivePlanCatalogEntry
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the snapshot of the active plan catalog (plans, bundles and bundle details not deleted and " \
+           "not expired) read by the activeOnly queries. Meant to be scheduled nightly."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        ActivePlanCatalogEntry.objects.refresh(batch_size=options["batch_size"])
+        self.stdout.write(f"Active plan catalog rebuilt, {ActivePlanCatalogEntry.objects.count()} entries")
@@ -0,0 +1,69 @@
+import core.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_bundle_index(apps, schema_editor):
+    # same entries as ContributionPlanBundleIndexManager.refresh, historical models have no custom managers
+    ContributionPlanBundleDetails = apps.get_model('contribution_plan', 'ContributionPlanBundleDetails')
+    ContributionPlanBundleIndex = apps.get_model('contribution_plan', 'ContributionPlanBundleIndex')
+    rows = ContributionPlanBundleDetails.objects.filter(
+        is_deleted=False, contribution_plan__is_deleted=False
+    ).values_list(
+        "id", "contribution_plan_bundle_id", "contribution_plan__calculation", "contribution_plan__benefit_plan_id",
+        "date_valid_from", "date_valid_to", "contribution_plan__date_valid_from", "contribution_plan__date_valid_to",
+    )
+    entries = []
+    for details_id, bundle_id, calculation, benefit_plan_id, \
+            valid_from, valid_to, plan_valid_from, plan_valid_to in rows.iterator():
+        entries.append(ContributionPlanBundleIndex(
+            contribution_plan_bundle_details_id=details_id,
+            contribution_plan_bundle_id=bundle_id,
+            calculation=calculation,
+            benefit_plan_id=benefit_plan_id,
+            date_valid_from=valid_from,
+            date_valid_to=valid_to,
+            plan_date_valid_from=plan_valid_from,
+            plan_date_valid_to=plan_valid_to,
+        ))
+        if len(entries) >= 2000:
+            ContributionPlanBundleIndex.objects.bulk_create(entries)
+            entries = []
+    ContributionPlanBundleIndex.objects.bulk_create(entries)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '__first__'),
+        ('contribution_plan', '0010_payment_plan_roles_for_admin'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContributionPlanBundleIndex',
+            fields=[
+                ('contribution_plan_bundle_details', models.OneToOneField(db_column='ContributionPlanBundleDetailsUUID', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='bundle_index', serialize=False, to='contribution_plan.ContributionPlanBundleDetails')),
+                ('calculation', models.UUIDField(db_column='calculationUUID')),
+                ('date_valid_from', core.fields.DateTimeField(db_column='DateValidFrom')),
+                ('date_valid_to', core.fields.DateTimeField(blank=True, db_column='DateValidTo', null=True)),
+                ('plan_date_valid_from', core.fields.DateTimeField(db_column='PlanDateValidFrom')),
+                ('plan_date_valid_to', core.fields.DateTimeField(blank=True, db_column='PlanDateValidTo', null=True)),
+                ('benefit_plan', models.ForeignKey(db_column='BenefitPlanID', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='product.Product')),
+                ('contribution_plan_bundle', models.ForeignKey(db_column='ContributionPlanBundleUUID', on_delete=django.db.models.deletion.CASCADE, related_name='+', to='contribution_plan.ContributionPlanBundle')),
+            ],
+            options={
+                'db_table': 'tblContributionPlanBundleIndex',
+                'managed': True,
+            },
+        ),
+        migrations.AddIndex(
+            model_name='contributionplanbundleindex',
+            index=models.Index(fields=['calculation', 'contribution_plan_bundle'], name='cpb_index_calculation_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contributionplanbundleindex',
+            index=models.Index(fields=['benefit_plan', 'contribution_plan_bundle'], name='cpb_index_benefit_plan_idx'),
+        ),
+        migrations.RunPython(populate_bundle_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contribution_plan', '0011_contributionplanbundleindex'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='contributionplan',
+            index=models.Index(fields=['is_deleted', 'date_valid_from', 'date_valid_to'], name='cp_deleted_validity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contributionplan',
+            index=models.Index(fields=['benefit_plan', 'is_deleted'], name='cp_benefit_plan_deleted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contributionplan',
+            index=models.Index(fields=['calculation'], name='cp_calculation_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentplan',
+            index=models.Index(fields=['is_deleted', 'date_valid_from', 'date_valid_to'], name='pp_deleted_validity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentplan',
+            index=models.Index(fields=['benefit_plan', 'is_deleted'], name='pp_benefit_plan_deleted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentplan',
+            index=models.Index(fields=['calculation'], name='pp_calculation_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contributionplanbundledetails',
+            index=models.Index(fields=['contribution_plan_bundle', 'is_deleted'], name='cpbd_bundle_deleted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contributionplanbundledetails',
+            index=models.Index(fields=['contribution_plan', 'is_deleted'], name='cpbd_plan_deleted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contributionplanbundledetails',
+            index=models.Index(condition=models.Q(is_deleted=False), fields=['contribution_plan_bundle', 'date_valid_from', 'date_valid_to'], name='cpbd_bundle_validity_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+import logging
+
+from django.db import DatabaseError, migrations, transaction
+
+logger = logging.getLogger(__name__)
+
+TRIGRAM_INDEXES = [
+    (table, column, f"{table}_{column}_trgm_idx".lower())
+    for table in ("tblContributionPlan", "tblPaymentPlan", "tblContributionPlanBundle")
+    for column in ("Code", "Name")
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    # only PostgreSQL has trigram indexes, the search falls back to LIKE scans elsewhere
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    try:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    except DatabaseError as exc:
+        logger.warning("pg_trgm extension not available, trigram search indexes not created: %s", exc)
+        return
+    for table, column, index_name in TRIGRAM_INDEXES:
+        # same expression as the icontains / istartswith lookups
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS "{index_name}" ON "{table}" USING gin (UPPER("{column}"::text) gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for _, _, index_name in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS "{index_name}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contribution_plan', '0012_plan_validity_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,29 @@
+import core.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contribution_plan', '0013_trigram_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivePlanCatalogEntry',
+            fields=[
+                ('id', models.UUIDField(db_column='UUID', primary_key=True, serialize=False)),
+                ('entity', models.CharField(db_column='Entity', max_length=64)),
+                ('date_valid_from', core.fields.DateTimeField(db_column='DateValidFrom')),
+                ('date_valid_to', core.fields.DateTimeField(blank=True, db_column='DateValidTo', null=True)),
+            ],
+            options={
+                'db_table': 'tblActivePlanCatalog',
+                'managed': True,
+            },
+        ),
+        migrations.AddIndex(
+            model_name='activeplancatalogentry',
+            index=models.Index(fields=['entity', 'date_valid_from', 'date_valid_to'], name='active_catalog_entity_idx'),
+        ),
+    ]
@@ -1,8 +1,12 @@
 from django.conf import settings
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import F
 from graphql import ResolveInfo
 
+from core import datetime
 from core.models import HistoryModelManager
+from contribution_plan.cache import plan_cache
 
 
 class GenericPlanManager(HistoryModelManager):
@@ -13,6 +17,9 @@ class GenericPlanManager(HistoryModelManager):
             kwargs[new_key] = kwargs.pop(key)
         return super(GenericPlanManager, self).filter(*args, **kwargs)
 
+    def get_cached(self, id):
+        return plan_cache.get(self.model, id)
+
 
 class GenericPlanQuerysetMixin:
 
@@ -26,3 +33,85 @@ class GenericPlanQuerysetMixin:
         if settings.ROW_SECURITY:
             pass
         return queryset
+
+
+class PartialUpdateMixin:
+    """
+    Update helpers for history models writing only the changed columns instead of the whole row.
+    """
+
+    def save_changed_fields(self, user):
+        """
+        Saves only the changed columns and the audit fields, with the same rules as core's save. The historical
+        record is written explicitly, the post_save signal of the history being skipped.
+        """
+        dirty_fields = [
+            name for name in self.get_dirty_fields(check_relationship=True) if name != self._meta.pk.name
+        ]
+        if not dirty_fields:
+            raise ValidationError('Record has not be updated - there are no changes in fields')
+        if getattr(self, "replacement_uuid", None) is not None and "replacement_uuid" not in dirty_fields:
+            raise ValidationError('Update error! You cannot update replaced entity')
+        self.date_updated = datetime.datetime.now()
+        self.user_updated = user
+        self.version = self.version + 1
+        self._before_change()
+        with transaction.atomic():
+            self.skip_history_when_saving = True
+            try:
+                models.Model.save(self, update_fields=[*dirty_fields, "date_updated", "user_updated", "version"])
+            finally:
+                del self.skip_history_when_saving
+            type(self).history.bulk_history_create([self], update=True, default_user=user)
+        self._notify_change()
+        return self
+
+    @classmethod
+    def update_with_version(cls, data, user):
+        """
+        Updates the row without loading it first. The update only succeeds if the row still has
+        the version given in data, the row is read back afterwards to write its historical record.
+        Keys of data that are not columns of the model, like uuid, are ignored.
+        """
+        data = dict(data)
+        object_id = data.pop("id")
+        expected_version = data.pop("version")
+        columns = {name for field in cls._meta.concrete_fields for name in (field.name, field.attname)}
+        data = {key: value for key, value in data.items() if key in columns}
+        queryset = cls.objects.filter(id=object_id, version=expected_version)
+        if hasattr(cls, "replacement_uuid") and "replacement_uuid" not in data:
+            queryset = queryset.filter(replacement_uuid__isnull=True)
+        with transaction.atomic():
+            cls._before_bulk_change([object_id])
+            updated = queryset.update(
+                **data, date_updated=datetime.datetime.now(), user_updated=user, version=F("version") + 1)
+            if not updated:
+                raise ValidationError(
+                    'Record has not be updated - it does not exist, was replaced or its version has changed')
+            instance = cls.objects.get(id=object_id)
+            cls.history.bulk_history_create([instance], update=True, default_user=user)
+        instance._notify_change()
+        return instance
+
+    def _before_change(self):
+        """
+        Called before the row is written, while the dirty fields still hold the previous values.
+        """
+        pass
+
+    @classmethod
+    def _before_bulk_change(cls, ids):
+        """
+        Counterpart of _before_change for rows updated in bulk, without loading them.
+        """
+        pass
+
+    def _notify_change(self):
+        pass
+
+    @classmethod
+    def _notify_bulk_change(cls, ids):
+        """
+        Counterpart of _notify_change for rows inserted or updated in bulk, without loading them.
+        """
+        pass
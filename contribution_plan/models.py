@@ -1,13 +1,19 @@
+from datetime import datetime as py_datetime
+
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Exists, OuterRef, Q
 from core import models as core_models, fields
 from core.signals import Signal
 from graphql import ResolveInfo
 from product.models import Product
-from contribution_plan.mixins import GenericPlanQuerysetMixin, GenericPlanManager
+from contribution_plan.apps import ContributionPlanConfig
+from contribution_plan.cache import calcrule_params_cache, plan_cache, query_result_cache
+from contribution_plan.intervals import bundle_details_intervals
+from contribution_plan.mixins import GenericPlanQuerysetMixin, GenericPlanManager, PartialUpdateMixin
 
 
-class GenericPlan(GenericPlanQuerysetMixin, core_models.HistoryBusinessModel):
+class GenericPlan(GenericPlanQuerysetMixin, PartialUpdateMixin, core_models.HistoryBusinessModel):
     code = models.CharField(db_column="Code", max_length=255, blank=True, null=True)
     name = models.CharField(db_column="Name", max_length=255, blank=True, null=True)
     calculation = models.UUIDField(db_column="calculationUUID", null=False)
@@ -16,6 +22,29 @@ class GenericPlan(GenericPlanQuerysetMixin, core_models.HistoryBusinessModel):
 
     objects = GenericPlanManager()
 
+    def save(self, *args, **kwargs):
+        result = super().save(*args, **kwargs)
+        self._notify_change()
+        return result
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        self._notify_change()
+        return result
+
+    def _notify_change(self):
+        plan_cache.invalidate(type(self), self.id)
+        query_result_cache.bump(type(self))
+        calcrule_params_cache.invalidate(type(self), self.id)
+        ActivePlanCatalogEntry.objects.refresh_objects(type(self), [self.id])
+
+    @classmethod
+    def _notify_bulk_change(cls, ids):
+        query_result_cache.bump(cls)
+        for plan_id in ids:
+            calcrule_params_cache.invalidate(cls, plan_id)
+        ActivePlanCatalogEntry.objects.refresh_objects(cls, ids)
+
     class Meta:
         abstract = True
 
@@ -32,14 +61,60 @@ class ContributionPlanBundleManager(models.Manager):
             kwargs[new_key] = kwargs.pop(key)
         return super(ContributionPlanBundleManager, self).filter(*args, **kwargs)
 
-
-class ContributionPlanBundle(core_models.HistoryBusinessModel):
+    def filter_by_contribution_plans(self, calculation=None, benefit_plan=None, validity_filters=()):
+        """
+        Bundles with at least one attached, not deleted contribution plan matching the calculation and benefit plan.
+        validity_filters restrict both the bundle details and the plans, each on its own validity held by the
+        bundle index. The correlated EXISTS keeps one row per bundle, so no DISTINCT over the joined details
+        is needed.
+        """
+        index_entries = ContributionPlanBundleIndex.objects.filter(
+            *validity_filters,
+            *[_prefixed_filter(validity_filter, "plan_") for validity_filter in validity_filters],
+            contribution_plan_bundle=OuterRef("pk"),
+        )
+        if calculation:
+            index_entries = index_entries.filter(calculation=str(calculation))
+        if benefit_plan:
+            index_entries = index_entries.filter(benefit_plan_id=benefit_plan)
+        return self.filter(Exists(index_entries.values("pk")))
+
+
+def _prefixed_filter(q, prefix):
+    children = [
+        _prefixed_filter(child, prefix) if isinstance(child, Q) else (f"{prefix}{child[0]}", child[1])
+        for child in q.children
+    ]
+    return Q(*children, _connector=q.connector, _negated=q.negated)
+
+
+class ContributionPlanBundle(PartialUpdateMixin, core_models.HistoryBusinessModel):
     code = models.CharField(db_column='Code', max_length=255, null=False)
     name = models.CharField(db_column='Name', max_length=255, blank=True, null=True)
     periodicity = models.IntegerField(db_column="Periodicity", blank=True, null=True)
 
     objects = ContributionPlanBundleManager()
 
+    def save(self, *args, **kwargs):
+        result = super().save(*args, **kwargs)
+        self._notify_change()
+        return result
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        self._notify_change()
+        return result
+
+    def _notify_change(self):
+        # the snapshot is the only follower of bundle writes, nothing to do while it is disabled
+        if ContributionPlanConfig.active_catalog_snapshot:
+            ActivePlanCatalogEntry.objects.refresh_objects(type(self), [self.id])
+
+    @classmethod
+    def _notify_bulk_change(cls, ids):
+        if ContributionPlanConfig.active_catalog_snapshot:
+            ActivePlanCatalogEntry.objects.refresh_objects(cls, ids)
+
     @classmethod
     def get_queryset(cls, queryset, user):
         queryset = cls.filter_queryset(queryset)
@@ -72,14 +147,33 @@ class ContributionPlan(GenericPlan):
         get_contribution_length_signal.send(sender=self.__class__,  instance=self)
         return self.length
 
+    def _notify_change(self):
+        super()._notify_change()
+        ContributionPlanBundleIndex.objects.refresh(contribution_plan_id=self.id)
+
+    @classmethod
+    def _notify_bulk_change(cls, ids):
+        super()._notify_bulk_change(ids)
+        ContributionPlanBundleIndex.objects.refresh(contribution_plan_id__in=ids)
+
     class Meta:
         db_table = 'tblContributionPlan'
+        indexes = [
+            models.Index(fields=['is_deleted', 'date_valid_from', 'date_valid_to'], name='cp_deleted_validity_idx'),
+            models.Index(fields=['benefit_plan', 'is_deleted'], name='cp_benefit_plan_deleted_idx'),
+            models.Index(fields=['calculation'], name='cp_calculation_idx'),
+        ]
 
 
 class PaymentPlan(GenericPlan):
 
     class Meta:
         db_table = 'tblPaymentPlan'
+        indexes = [
+            models.Index(fields=['is_deleted', 'date_valid_from', 'date_valid_to'], name='pp_deleted_validity_idx'),
+            models.Index(fields=['benefit_plan', 'is_deleted'], name='pp_benefit_plan_deleted_idx'),
+            models.Index(fields=['calculation'], name='pp_calculation_idx'),
+        ]
 
 
 class ContributionPlanBundleDetailsManager(models.Manager):
@@ -91,7 +185,7 @@ class ContributionPlanBundleDetailsManager(models.Manager):
         return super(ContributionPlanBundleDetailsManager, self).filter(*args, **kwargs)
 
 
-class ContributionPlanBundleDetails(core_models.HistoryBusinessModel):
+class ContributionPlanBundleDetails(PartialUpdateMixin, core_models.HistoryBusinessModel):
     contribution_plan_bundle = models.ForeignKey(ContributionPlanBundle, db_column="ContributionPlanBundleUUID",
                                                  on_delete=models.deletion.DO_NOTHING)
     contribution_plan = models.ForeignKey(ContributionPlan, db_column="ContributionPlanUUID",
@@ -99,6 +193,42 @@ class ContributionPlanBundleDetails(core_models.HistoryBusinessModel):
 
     objects = ContributionPlanBundleDetailsManager()
 
+    def save(self, *args, **kwargs):
+        self._before_change()
+        result = super().save(*args, **kwargs)
+        self._notify_change()
+        return result
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        self._notify_change()
+        return result
+
+    def _before_change(self):
+        # details moved to another bundle leave the interval tree of their previous bundle
+        previous_bundle_id = self.get_dirty_fields(check_relationship=True).get("contribution_plan_bundle")
+        if previous_bundle_id is not None and previous_bundle_id != self.contribution_plan_bundle_id:
+            bundle_details_intervals.invalidate(previous_bundle_id)
+
+    @classmethod
+    def _before_bulk_change(cls, ids):
+        bundle_ids = cls.objects.filter(id__in=ids).values_list("contribution_plan_bundle_id", flat=True).distinct()
+        for bundle_id in bundle_ids:
+            bundle_details_intervals.invalidate(bundle_id)
+
+    def _notify_change(self):
+        ContributionPlanBundleIndex.objects.refresh(id=self.id)
+        bundle_details_intervals.invalidate(self.contribution_plan_bundle_id)
+        ActivePlanCatalogEntry.objects.refresh_objects(type(self), [self.id])
+
+    @classmethod
+    def _notify_bulk_change(cls, ids):
+        ContributionPlanBundleIndex.objects.refresh(id__in=ids)
+        ActivePlanCatalogEntry.objects.refresh_objects(cls, ids)
+        bundle_ids = cls.objects.filter(id__in=ids).values_list("contribution_plan_bundle_id", flat=True).distinct()
+        for bundle_id in bundle_ids:
+            bundle_details_intervals.invalidate(bundle_id)
+
     @classmethod
     def get_queryset(cls, queryset, user):
         queryset = cls.filter_queryset(queryset)
@@ -112,6 +242,171 @@ class ContributionPlanBundleDetails(core_models.HistoryBusinessModel):
 
     class Meta:
         db_table = 'tblContributionPlanBundleDetails'
+        indexes = [
+            models.Index(fields=['contribution_plan_bundle', 'is_deleted'], name='cpbd_bundle_deleted_idx'),
+            models.Index(fields=['contribution_plan', 'is_deleted'], name='cpbd_plan_deleted_idx'),
+            # validity of the details attached to a bundle, skipped by backends without partial indexes
+            models.Index(fields=['contribution_plan_bundle', 'date_valid_from', 'date_valid_to'],
+                         name='cpbd_bundle_validity_idx', condition=Q(is_deleted=False)),
+        ]
+
+
+class ContributionPlanBundleIndexManager(models.Manager):
+
+    def refresh(self, batch_size=2000, **details_filters):
+        """
+        Rebuilds the index entries of the bundle details matching details_filters, all of them when no filter
+        is given. Details or plans deleted since the last refresh lose their entries.
+        """
+        details = ContributionPlanBundleDetails.objects.filter(**details_filters)
+        with transaction.atomic():
+            if details_filters:
+                self.filter(contribution_plan_bundle_details__in=details.values("id")).delete()
+            else:
+                self.all().delete()
+            entries = []
+            for entry in self._expected_entries(details):
+                entries.append(entry)
+                if len(entries) >= batch_size:
+                    self.bulk_create(entries)
+                    entries = []
+            self.bulk_create(entries)
+
+    def check_consistency(self):
+        """
+        Compares the index with the bundle details and plans, returns the ids of the details whose index entry
+        is missing, stale or should not exist.
+        """
+        expected = {
+            entry.contribution_plan_bundle_details_id: _index_entry_key(entry)
+            for entry in self._expected_entries(ContributionPlanBundleDetails.objects.all())
+        }
+        inconsistent = []
+        for entry in self.all().iterator():
+            if expected.pop(entry.contribution_plan_bundle_details_id, None) != _index_entry_key(entry):
+                inconsistent.append(entry.contribution_plan_bundle_details_id)
+        return inconsistent + list(expected)
+
+    def _expected_entries(self, details):
+        rows = details.filter(is_deleted=False, contribution_plan__is_deleted=False).values_list(
+            "id", "contribution_plan_bundle_id", "contribution_plan__calculation",
+            "contribution_plan__benefit_plan_id", "date_valid_from", "date_valid_to",
+            "contribution_plan__date_valid_from", "contribution_plan__date_valid_to",
+        )
+        for details_id, bundle_id, calculation, benefit_plan_id, \
+                valid_from, valid_to, plan_valid_from, plan_valid_to in rows.iterator():
+            yield self.model(
+                contribution_plan_bundle_details_id=details_id,
+                contribution_plan_bundle_id=bundle_id,
+                calculation=calculation,
+                benefit_plan_id=benefit_plan_id,
+                date_valid_from=valid_from,
+                date_valid_to=valid_to,
+                plan_date_valid_from=plan_valid_from,
+                plan_date_valid_to=plan_valid_to,
+            )
+
+
+def _index_entry_key(entry):
+    return (entry.contribution_plan_bundle_id, entry.calculation, entry.benefit_plan_id,
+            entry.date_valid_from, entry.date_valid_to, entry.plan_date_valid_from, entry.plan_date_valid_to)
+
+
+class ContributionPlanBundleIndex(models.Model):
+    """
+    One entry per bundle details attaching a not deleted contribution plan, holding the calculation, benefit plan
+    and validity of the plan next to the validity of the details, so bundles can be searched by calculation or
+    product without joining the details and the plans. Entries are kept up to date by the save, delete, replace
+    and bulk paths of the details and the plans.
+    """
+    # entries go with their details or bundle when these are hard deleted, which bypasses the notifications
+    contribution_plan_bundle_details = models.OneToOneField(
+        ContributionPlanBundleDetails, db_column="ContributionPlanBundleDetailsUUID", primary_key=True,
+        on_delete=models.deletion.CASCADE, related_name="bundle_index")
+    contribution_plan_bundle = models.ForeignKey(ContributionPlanBundle, db_column="ContributionPlanBundleUUID",
+                                                 on_delete=models.deletion.CASCADE, related_name="+")
+    calculation = models.UUIDField(db_column="calculationUUID")
+    benefit_plan = models.ForeignKey(Product, db_column="BenefitPlanID", db_constraint=False,
+                                     on_delete=models.deletion.DO_NOTHING, related_name="+")
+    date_valid_from = fields.DateTimeField(db_column="DateValidFrom")
+    date_valid_to = fields.DateTimeField(db_column="DateValidTo", blank=True, null=True)
+    plan_date_valid_from = fields.DateTimeField(db_column="PlanDateValidFrom")
+    plan_date_valid_to = fields.DateTimeField(db_column="PlanDateValidTo", blank=True, null=True)
+
+    objects = ContributionPlanBundleIndexManager()
+
+    class Meta:
+        managed = True
+        db_table = 'tblContributionPlanBundleIndex'
+        indexes = [
+            models.Index(fields=['calculation', 'contribution_plan_bundle'], name='cpb_index_calculation_idx'),
+            models.Index(fields=['benefit_plan', 'contribution_plan_bundle'], name='cpb_index_benefit_plan_idx'),
+        ]
+
+
+class ActivePlanCatalogEntryManager(models.Manager):
+
+    def refresh(self, batch_size=2000):
+        """
+        Rebuilds the whole snapshot from the plans, bundles and bundle details not deleted and not expired.
+        """
+        with transaction.atomic():
+            self.all().delete()
+            for model_class in ActivePlanCatalogEntry.catalog_models():
+                self._insert(model_class.objects.all(), batch_size)
+
+    def refresh_objects(self, model_class, ids, batch_size=2000):
+        """
+        Replaces the snapshot entries of the given objects, called whenever they are saved, deleted, replaced or
+        written in bulk. Does nothing unless the snapshot is enabled with active_catalog_snapshot.
+        """
+        if not ContributionPlanConfig.active_catalog_snapshot:
+            return
+        with transaction.atomic():
+            self.filter(id__in=ids).delete()
+            self._insert(model_class.objects.filter(id__in=ids), batch_size)
+
+    def _insert(self, queryset, batch_size):
+        # expired objects are left out, objects becoming valid later are kept and filtered when reading
+        rows = queryset.filter(
+            Q(date_valid_to__isnull=True) | Q(date_valid_to__gt=py_datetime.now()), is_deleted=False,
+        ).values_list("id", "date_valid_from", "date_valid_to")
+        entity = queryset.model._meta.model_name
+        entries = []
+        for object_id, valid_from, valid_to in rows.iterator():
+            entries.append(self.model(id=object_id, entity=entity, date_valid_from=valid_from,
+                                      date_valid_to=valid_to))
+            if len(entries) >= batch_size:
+                self.bulk_create(entries)
+                entries = []
+        self.bulk_create(entries)
+
+
+class ActivePlanCatalogEntry(models.Model):
+    """
+    Snapshot of the active catalog: one entry per contribution plan, payment plan, bundle and bundle details not
+    deleted and not expired when the entry was written, keyed by the object id. Rebuilt by the
+    refresh_active_plan_catalog command and kept up to date by the save, delete, replace and bulk paths when
+    active_catalog_snapshot is enabled. The validity is copied so entries expiring between two refreshes are
+    filtered out when reading.
+    """
+    id = models.UUIDField(db_column="UUID", primary_key=True)
+    entity = models.CharField(db_column="Entity", max_length=64)
+    date_valid_from = fields.DateTimeField(db_column="DateValidFrom")
+    date_valid_to = fields.DateTimeField(db_column="DateValidTo", blank=True, null=True)
+
+    objects = ActivePlanCatalogEntryManager()
+
+    @staticmethod
+    def catalog_models():
+        return ContributionPlan, PaymentPlan, ContributionPlanBundle, ContributionPlanBundleDetails
+
+    class Meta:
+        managed = True
+        db_table = 'tblActivePlanCatalog'
+        indexes = [
+            models.Index(fields=['entity', 'date_valid_from', 'date_valid_to'], name='active_catalog_entity_idx'),
+        ]
 
 
 class ContributionPlanMutation(core_models.UUIDModel):
@@ -3,7 +3,7 @@ import graphene_django_optimizer as gql_optimizer
 
 from core.schema import signal_mutation_module_validate
 from contribution_plan.gql import ContributionPlanGQLType, ContributionPlanBundleGQLType, \
-    ContributionPlanBundleDetailsGQLType, PaymentPlanGQLType
+    ContributionPlanBundleDetailsGQLType, PaymentPlanGQLType, PlanSearchResultGQLType, PlanHistoryEntryGQLType
 from core.utils import append_validity_filter
 from contribution_plan.gql.gql_mutations.contribution_plan_bundle_details_mutations import \
     CreateContributionPlanBundleDetailsMutation, UpdateContributionPlanBundleDetailsMutation, \
@@ -16,51 +16,102 @@ from contribution_plan.gql.gql_mutations.payment_plan_mutations import CreatePay
     UpdatePaymentPlanMutation, DeletePaymentPlanMutation, ReplacePaymentPlanMutation
 from contribution_plan.models import ContributionPlanBundle, ContributionPlan, \
     ContributionPlanBundleDetails, PaymentPlan
-from core.schema import OrderedDjangoFilterConnectionField
+from contribution_plan.gql.connection_fields import PlanConnectionField
 from .models import ContributionPlanMutation, ContributionPlanBundleMutation
 from .apps import ContributionPlanConfig
+from .history import iter_changes, version_diff
+from .search import search_plans
+from .utils import active_only_filter, valid_on_filter
+
+# unlike the default validity filter of core, which keeps the objects whose dateValidTo equals the current time,
+# asOf and activeOnly treat dateValidTo as exclusive so that a replaced version and its replacement never
+# overlap at the replacement date
+AS_OF_DESCRIPTION = "Only the versions valid on this date, dateValidFrom <= asOf < dateValidTo " \
+                    "(dateValidTo is exclusive, an empty dateValidTo is open-ended)"
+ACTIVE_ONLY_DESCRIPTION = "Only the objects valid now and not deleted, dateValidFrom <= now < dateValidTo " \
+                          "(dateValidTo is exclusive, an empty dateValidTo is open-ended)"
 
 
 class Query(graphene.ObjectType):
-    contribution_plan = OrderedDjangoFilterConnectionField(
+    contribution_plan = PlanConnectionField(
         ContributionPlanGQLType,
+        result_cache=True,
         orderBy=graphene.List(of_type=graphene.String),
         dateValidFrom__Gte=graphene.DateTime(),
         dateValidTo__Lte=graphene.DateTime(),
-        applyDefaultValidityFilter=graphene.Boolean()
+        applyDefaultValidityFilter=graphene.Boolean(),
+        keyset=graphene.Boolean(),
+        asOf=graphene.Date(description=AS_OF_DESCRIPTION),
+        activeOnly=graphene.Boolean(description=ACTIVE_ONLY_DESCRIPTION)
     )
 
-    contribution_plan_bundle = OrderedDjangoFilterConnectionField(
+    contribution_plan_bundle = PlanConnectionField(
         ContributionPlanBundleGQLType,
         orderBy=graphene.List(of_type=graphene.String),
         calculation=graphene.UUID(),
         insuranceProduct=graphene.Int(),
         dateValidFrom__Gte=graphene.DateTime(),
         dateValidTo__Lte=graphene.DateTime(),
-        applyDefaultValidityFilter=graphene.Boolean()
+        applyDefaultValidityFilter=graphene.Boolean(),
+        keyset=graphene.Boolean(),
+        asOf=graphene.Date(description=AS_OF_DESCRIPTION),
+        activeOnly=graphene.Boolean(description=ACTIVE_ONLY_DESCRIPTION)
     )
 
-    contribution_plan_bundle_details = OrderedDjangoFilterConnectionField(
+    contribution_plan_bundle_details = PlanConnectionField(
         ContributionPlanBundleDetailsGQLType,
         orderBy=graphene.List(of_type=graphene.String),
         dateValidFrom__Gte=graphene.DateTime(),
         dateValidTo__Lte=graphene.DateTime(),
-        applyDefaultValidityFilter=graphene.Boolean()
+        applyDefaultValidityFilter=graphene.Boolean(),
+        keyset=graphene.Boolean(),
+        asOf=graphene.Date(description=AS_OF_DESCRIPTION),
+        activeOnly=graphene.Boolean(description=ACTIVE_ONLY_DESCRIPTION)
     )
 
-    payment_plan = OrderedDjangoFilterConnectionField(
+    payment_plan = PlanConnectionField(
         PaymentPlanGQLType,
+        result_cache=True,
         orderBy=graphene.List(of_type=graphene.String),
         dateValidFrom__Gte=graphene.DateTime(),
         dateValidTo__Lte=graphene.DateTime(),
-        applyDefaultValidityFilter=graphene.Boolean()
+        applyDefaultValidityFilter=graphene.Boolean(),
+        keyset=graphene.Boolean(),
+        asOf=graphene.Date(description=AS_OF_DESCRIPTION),
+        activeOnly=graphene.Boolean(description=ACTIVE_ONLY_DESCRIPTION)
+    )
+
+    search_plans = graphene.List(
+        PlanSearchResultGQLType,
+        term=graphene.String(required=True),
+        limit=graphene.Int()
+    )
+
+    contribution_plan_history = graphene.List(
+        PlanHistoryEntryGQLType,
+        id=graphene.UUID(required=True),
+        versionFrom=graphene.Int(),
+        versionTo=graphene.Int(),
+        dateFrom=graphene.DateTime(),
+        dateTo=graphene.DateTime()
+    )
+
+    payment_plan_history = graphene.List(
+        PlanHistoryEntryGQLType,
+        id=graphene.UUID(required=True),
+        versionFrom=graphene.Int(),
+        versionTo=graphene.Int(),
+        dateFrom=graphene.DateTime(),
+        dateTo=graphene.DateTime()
     )
 
     def resolve_contribution_plan(self, info, **kwargs):
         if not info.context.user.has_perms(ContributionPlanConfig.gql_query_contributionplan_perms):
            raise PermissionError("Unauthorized")
 
-        filters = append_validity_filter(**kwargs)
+        filters = _validity_filters(**kwargs)
+        if kwargs.get('activeOnly'):
+            filters.append(active_only_filter(ContributionPlan))
         query = ContributionPlan.objects
         return gql_optimizer.query(query.filter(*filters).all(), info)
 
@@ -68,21 +119,18 @@ class Query(graphene.ObjectType):
         if not info.context.user.has_perms(ContributionPlanConfig.gql_query_contributionplanbundle_perms):
            raise PermissionError("Unauthorized")
 
-        filters = append_validity_filter(**kwargs)
+        filters = _validity_filters(**kwargs)
         query = ContributionPlanBundle.objects
 
         calculation = kwargs.get('calculation', None)
         insurance_product = kwargs.get('insuranceProduct', None)
 
-        if calculation:
-            query = query.filter(
-                contributionplanbundledetails__contribution_plan__calculation=str(calculation)
-            ).distinct()
-
-        if insurance_product:
-            query = query.filter(
-                contributionplanbundledetails__contribution_plan__benefit_plan__id=insurance_product
-            ).distinct()
+        if calculation or insurance_product:
+            query = query.filter_by_contribution_plans(
+                calculation=calculation, benefit_plan=insurance_product, validity_filters=filters
+            )
+        if kwargs.get('activeOnly'):
+            query = query.filter(active_only_filter(ContributionPlanBundle))
 
         return gql_optimizer.query(query.filter(*filters).all(), info)
 
@@ -92,15 +140,40 @@ class Query(graphene.ObjectType):
                 ContributionPlanConfig.gql_query_contributionplan_perms)):
            raise PermissionError("Unauthorized")
 
-        filters = append_validity_filter(**kwargs)
+        filters = _validity_filters(**kwargs)
+        if kwargs.get('activeOnly'):
+            filters.append(active_only_filter(ContributionPlanBundleDetails))
         query = ContributionPlanBundleDetails.objects
         return gql_optimizer.query(query.filter(*filters).all(), info)
 
+    def resolve_search_plans(self, info, term, limit=20):
+        user = info.context.user
+        types = [type_name for type_name, perms in (
+            ("ContributionPlan", ContributionPlanConfig.gql_query_contributionplan_perms),
+            ("PaymentPlan", ContributionPlanConfig.gql_query_paymentplan_perms),
+            ("ContributionPlanBundle", ContributionPlanConfig.gql_query_contributionplanbundle_perms),
+        ) if user.has_perms(perms)]
+        if not types:
+           raise PermissionError("Unauthorized")
+        return [PlanSearchResultGQLType(**row) for row in search_plans(term, limit, types)]
+
+    def resolve_contribution_plan_history(self, info, **kwargs):
+        if not info.context.user.has_perms(ContributionPlanConfig.gql_query_contributionplan_perms):
+           raise PermissionError("Unauthorized")
+        return _resolve_plan_history(ContributionPlan, **kwargs)
+
+    def resolve_payment_plan_history(self, info, **kwargs):
+        if not info.context.user.has_perms(ContributionPlanConfig.gql_query_paymentplan_perms):
+           raise PermissionError("Unauthorized")
+        return _resolve_plan_history(PaymentPlan, **kwargs)
+
     def resolve_payment_plan(self, info, **kwargs):
         if not info.context.user.has_perms(ContributionPlanConfig.gql_query_paymentplan_perms):
            raise PermissionError("Unauthorized")
 
-        filters = append_validity_filter(**kwargs)
+        filters = _validity_filters(**kwargs)
+        if kwargs.get('activeOnly'):
+            filters.append(active_only_filter(PaymentPlan))
         query = PaymentPlan.objects
         return gql_optimizer.query(query.filter(*filters).all(), info)
 
@@ -127,6 +200,25 @@ class Mutation(graphene.ObjectType):
     replace_payment_plan = ReplacePaymentPlanMutation.Field()
 
 
+def _validity_filters(**kwargs):
+    # activeOnly replaces the default validity filter, so only its snapshot is read for the validity
+    if kwargs.get('activeOnly'):
+        kwargs['applyDefaultValidityFilter'] = False
+    filters = append_validity_filter(**kwargs)
+    if kwargs.get('asOf'):
+        filters.append(valid_on_filter(kwargs['asOf']))
+    return filters
+
+
+def _resolve_plan_history(model_class, id, versionFrom=None, versionTo=None, dateFrom=None, dateTo=None):
+    if versionFrom is not None or versionTo is not None:
+        if versionFrom is None or versionTo is None:
+            raise ValueError("versionFrom and versionTo have to be given together")
+        return [PlanHistoryEntryGQLType(**version_diff(model_class, id, versionFrom, versionTo))]
+    # entries are built while graphene walks the list, long histories are not loaded at once
+    return (PlanHistoryEntryGQLType(**entry) for entry in iter_changes(model_class, id, dateFrom, dateTo))
+
+
 def on_contribution_plan_mutation(sender, **kwargs):
     uuid = kwargs['data'].get('uuid', None)
     if not uuid:
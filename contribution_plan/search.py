@@ -0,0 +1,38 @@
+from django.db.models import Case, IntegerField, Q, Value, When
+
+from contribution_plan.models import ContributionPlan, ContributionPlanBundle, PaymentPlan
+
+
+SEARCH_MODELS = {
+    "ContributionPlan": ContributionPlan,
+    "PaymentPlan": PaymentPlan,
+    "ContributionPlanBundle": ContributionPlanBundle,
+}
+SEARCH_MAX_LIMIT = 100
+
+
+def search_plans(term, limit=20, types=tuple(SEARCH_MODELS)):
+    """
+    Current versions of contribution plans, payment plans and bundles whose code or name contains term, codes
+    and names starting with term first. Returns dictionaries with type, id, code, name and rank (0 for prefix
+    matches, 1 otherwise), at most limit of them. The icontains / istartswith lookups are served by the trigram
+    indexes on PostgreSQL and by plain LIKE scans on the other backends.
+    """
+    term = (term or "").strip()
+    if not term:
+        return []
+    limit = max(1, min(limit or 20, SEARCH_MAX_LIMIT))
+    results = []
+    for type_name in types:
+        queryset = SEARCH_MODELS[type_name].objects.filter(
+            Q(code__icontains=term) | Q(name__icontains=term),
+            is_deleted=False,
+            replacement_uuid__isnull=True,
+        ).annotate(rank=Case(
+            When(Q(code__istartswith=term) | Q(name__istartswith=term), then=Value(0)),
+            default=Value(1),
+            output_field=IntegerField(),
+        )).order_by("rank", "code", "id").values("id", "code", "name", "rank")
+        results.extend({"type": type_name, **row} for row in queryset[:limit])
+    results.sort(key=lambda row: (row["rank"], row["code"] or "", str(row["id"])))
+    return results[:limit]
@@ -0,0 +1,119 @@
+import datetime
+import uuid
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+_encoder = DjangoJSONEncoder()
+_PRIMITIVE_TYPES = (str, int, float, bool, type(None))
+_MODEL_SERIALIZERS = {}
+
+
+def json_safe(value):
+    """
+    Converts a value into JSON primitives exactly like json.loads(json.dumps(value, cls=DjangoJSONEncoder))
+    does, without building the intermediate JSON text.
+    """
+    value_type = type(value)
+    if value_type in _PRIMITIVE_TYPES:
+        return value
+    if isinstance(value, str):
+        return str.__str__(value)
+    if isinstance(value, bool):
+        return bool(value)
+    if isinstance(value, int):
+        return int(value)
+    if isinstance(value, float):
+        return float(value)
+    if isinstance(value, (list, tuple)):
+        return [json_safe(item) for item in value]
+    if isinstance(value, dict):
+        return {_json_key(key): json_safe(item) for key, item in value.items()}
+    return json_safe(_encoder.default(value))
+
+
+def _json_key(key):
+    # json.dumps converts dictionary keys of primitive types to strings, other keys are rejected
+    if isinstance(key, str):
+        return str.__str__(key)
+    if key is True:
+        return "true"
+    if key is False:
+        return "false"
+    if key is None:
+        return "null"
+    if isinstance(key, (int, float)):
+        return _encoder.encode(key)
+    raise TypeError(f"keys must be str, int, float, bool or None, not {type(key).__name__}")
+
+
+def _uuid_to_json(value):
+    if type(value) is uuid.UUID:
+        return str(value)
+    return json_safe(value)
+
+
+def _temporal_to_json(value):
+    if isinstance(value, (datetime.date, datetime.time)):
+        return _encoder.default(value)
+    return json_safe(value)
+
+
+_CONVERTERS_BY_INTERNAL_TYPE = {
+    "UUIDField": _uuid_to_json,
+    "DateTimeField": _temporal_to_json,
+    "DateField": _temporal_to_json,
+    "TimeField": _temporal_to_json,
+}
+
+
+class ModelSerializer:
+    """
+    Field list serializer producing the same dictionary as the model_to_dict + json round-trip used by the
+    services, with "id" and "uuid" set to the string representation of the primary key.
+    """
+    __slots__ = ("model", "fields")
+
+    def __init__(self, model_class):
+        self.model = model_class
+        self.fields = []
+        opts = model_class._meta
+        # same field selection as django.forms.models.model_to_dict
+        for field in [*opts.concrete_fields, *opts.private_fields, *opts.many_to_many]:
+            if not getattr(field, "editable", False) or field.many_to_many:
+                continue
+            internal_type = field.target_field.get_internal_type() if field.is_relation \
+                else field.get_internal_type()
+            converter = _CONVERTERS_BY_INTERNAL_TYPE.get(internal_type, json_safe)
+            self.fields.append((field.name, field.attname, converter))
+
+    @property
+    def keys(self):
+        names = [name for name, _, _ in self.fields]
+        return names + [key for key in ("id", "uuid") if key not in names]
+
+    def __call__(self, instance):
+        representation = {}
+        values = instance.__dict__
+        for name, attname, converter in self.fields:
+            value = values[attname] if attname in values else getattr(instance, attname)
+            representation[name] = None if value is None else converter(value)
+        uuid_string = str(instance.id)
+        representation["id"], representation["uuid"] = uuid_string, uuid_string
+        return representation
+
+
+def register_model_serializers(*model_classes):
+    for model_class in model_classes:
+        _MODEL_SERIALIZERS[model_class] = ModelSerializer(model_class)
+
+
+def get_serializer(model_class):
+    serializer = _MODEL_SERIALIZERS.get(model_class)
+    if serializer is None:
+        serializer = _MODEL_SERIALIZERS[model_class] = ModelSerializer(model_class)
+    return serializer
+
+
+def serialize(instance):
+    return get_serializer(type(instance))(instance)
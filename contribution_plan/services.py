@@ -1,10 +1,19 @@
-import json
+import uuid
 
-from django.core.serializers.json import DjangoJSONEncoder
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from django.contrib.auth.models import AnonymousUser
-from django.forms.models import model_to_dict
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from contribution_plan.apps import ContributionPlanConfig
 from contribution_plan.models import ContributionPlan as ContributionPlanModel, ContributionPlanBundle as ContributionPlanBundleModel, \
     ContributionPlanBundleDetails as ContributionPlanBundleDetailsModel, PaymentPlan as PaymentPlanModel
+from contribution_plan.cache import plan_cache
+from contribution_plan.history import iter_changes, version_diff
+from contribution_plan.serializers import json_safe, serialize
+from contribution_plan.utils import bulk_create_history_objects, composition_timeline, to_datetime, \
+    valid_on_filter
+from product.models import Product
 
 
 def check_authentication(function):
@@ -21,7 +30,69 @@ def check_authentication(function):
     return wrapper
 
 
-class ContributionPlan(object):
+def acheck_authentication(function):
+    async def wrapper(self, *args, **kwargs):
+        if type(self.user) is AnonymousUser or not self.user.id:
+            return {
+                "success": False,
+                "message": "Authentication required",
+                "detail": "PermissionDenied",
+            }
+        else:
+            result = await function(self, *args, **kwargs)
+            return result
+    return wrapper
+
+
+class AsyncServiceMixin:
+    """
+    Async counterparts of the service methods, returning the same result envelopes.
+    They are not natively async: the ORM of the supported Django versions has no async API and HistoryModel.save
+    is synchronous, so every call runs the whole sync method with sync_to_async, in a single thread hop instead
+    of one per ORM operation. With the default async_services_thread_sensitive, these hops all queue on the one
+    shared sync thread of asgiref, so concurrent calls are serialized. Disabling it runs them in the thread pool,
+    each on the database connection of its thread, outside any transaction opened by the caller. Plans held by
+    the process-local tier of the plan cache are served without leaving the event loop.
+    """
+    _cached_model = None
+
+    def _run_sync(self, method, *args):
+        return sync_to_async(method, thread_sensitive=ContributionPlanConfig.async_services_thread_sensitive)(*args)
+
+    @acheck_authentication
+    async def aget_by_id(self, by_id):
+        if self._cached_model is not None:
+            try:
+                cached = plan_cache.get_local(self._cached_model, by_id.id)
+            except Exception:
+                cached = None
+            if cached is not None:
+                return _output_result_success(dict_representation=serialize(cached))
+        return await self._run_sync(self.get_by_id, by_id)
+
+    @acheck_authentication
+    async def aget_by_ids(self, ids):
+        return await self._run_sync(self.get_by_ids, ids)
+
+    @acheck_authentication
+    async def acreate(self, data):
+        return await self._run_sync(self.create, data)
+
+    @acheck_authentication
+    async def aupdate(self, data):
+        return await self._run_sync(self.update, data)
+
+    @acheck_authentication
+    async def adelete(self, data):
+        return await self._run_sync(self.delete, data)
+
+    @acheck_authentication
+    async def areplace(self, data):
+        return await self._run_sync(self.replace, data)
+
+
+class ContributionPlan(AsyncServiceMixin):
+    _cached_model = ContributionPlanModel
 
     def __init__(self, user):
         self.user = user
@@ -29,35 +100,43 @@ class ContributionPlan(object):
     @check_authentication
     def get_by_id(self, by_contribution_plan):
         try:
-            cp = ContributionPlanModel.objects.get(id=by_contribution_plan.id)
-            uuid_string = str(cp.id)
-            dict_representation = model_to_dict(cp)
-            dict_representation["id"], dict_representation["uuid"] = (str(uuid_string), str(uuid_string))
+            cp = ContributionPlanModel.objects.get_cached(by_contribution_plan.id)
+            dict_representation = serialize(cp)
         except Exception as exc:
             return _output_exception(model_name="ContributionPlan", method="get", exception=exc)
         return _output_result_success(dict_representation=dict_representation)
 
+    @check_authentication
+    def get_by_ids(self, contribution_plan_ids):
+        return _get_many_by_ids(ContributionPlanModel, "ContributionPlan", contribution_plan_ids)
+
     @check_authentication
     def create(self, contribution_plan):
         try:
             cp = ContributionPlanModel(**contribution_plan)
             cp.save(username=self.user.username)
-            uuid_string = str(cp.id)
-            dict_representation = model_to_dict(cp)
-            dict_representation["id"], dict_representation["uuid"] = (str(uuid_string), str(uuid_string))
+            dict_representation = serialize(cp)
         except Exception as exc:
             return _output_exception(model_name="ContributionPlan", method="create", exception=exc)
         return _output_result_success(dict_representation=dict_representation)
 
+    @check_authentication
+    def create_many(self, contribution_plans, batch_size=500):
+        return _create_many_plans(ContributionPlanModel, "ContributionPlan", self.user, contribution_plans, batch_size)
+
+    @check_authentication
+    def history_diff(self, by_contribution_plan, version_from, version_to):
+        return _history_diff(ContributionPlanModel, "ContributionPlan", by_contribution_plan, version_from, version_to)
+
+    @check_authentication
+    def history_changes(self, by_contribution_plan, date_from=None, date_to=None):
+        return _history_changes(ContributionPlanModel, "ContributionPlan", by_contribution_plan, date_from, date_to)
+
     @check_authentication
     def update(self, contribution_plan):
         try:
-            updated_cp = ContributionPlanModel.objects.filter(id=contribution_plan['id']).first()
-            [setattr(updated_cp, key, contribution_plan[key]) for key in contribution_plan]
-            updated_cp.save(username=self.user.username)
-            uuid_string = str(updated_cp.id)
-            dict_representation = model_to_dict(updated_cp)
-            dict_representation["id"], dict_representation["uuid"] = (str(uuid_string), str(uuid_string))
+            updated_cp = _update_object(ContributionPlanModel, contribution_plan, self.user)
+            dict_representation = serialize(updated_cp)
         except Exception as exc:
             return _output_exception(model_name="ContributionPlan", method="update", exception=exc)
         return _output_result_success(dict_representation=dict_representation)
@@ -80,21 +159,19 @@ class ContributionPlan(object):
         try:
             cp_to_replace = ContributionPlanModel.objects.filter(id=contribution_plan['uuid']).first()
             cp_to_replace.replace_object(data=contribution_plan, username=self.user.username)
-            uuid_string = str(cp_to_replace.id)
-            dict_representation = model_to_dict(cp_to_replace)
-            dict_representation["id"], dict_representation["uuid"] = (str(uuid_string), str(uuid_string))
+            dict_representation = serialize(cp_to_replace)
         except Exception as exc:
             return _output_exception(model_name="ContributionPlan", method="replace", exception=exc)
         return {
             "success": True,
             "message": "Ok",
             "detail": "",
-            "old_object": json.loads(json.dumps(dict_representation, cls=DjangoJSONEncoder)),
+            "old_object": dict_representation,
             "uuid_new_object": str(cp_to_replace.replacement_uuid),
         }
 
 
-class ContributionPlanBundle(object):
+class ContributionPlanBundle(AsyncServiceMixin):
 
     def __init__(self, user):
         self.user = user
@@ -103,21 +180,87 @@ class ContributionPlanBundle(object):
     def get_by_id(self, by_contribution_plan_bundle):
         try:
             cpb = ContributionPlanBundleModel.objects.get(id=by_contribution_plan_bundle.id)
-            uuid_string = str(cpb.id)
-            dict_representation = model_to_dict(cpb)
-            dict_representation["id"], dict_representation["uuid"] = (str(uuid_string), str(uuid_string))
+            dict_representation = serialize(cpb)
         except Exception as exc:
             return _output_exception(model_name="ContributionPlanBundle", method="get", exception=exc)
         return _output_result_success(dict_representation=dict_representation)
 
+    @check_authentication
+    def get_by_ids(self, contribution_plan_bundle_ids):
+        return _get_many_by_ids(ContributionPlanBundleModel, "ContributionPlanBundle", contribution_plan_bundle_ids)
+
+    @check_authentication
+    def composition_at(self, by_contribution_plan_bundle, as_of):
+        """
+        Contribution plans attached to the bundle on the as_of date: both the plan and its bundle details have to
+        be valid on that day, a missing date_valid_to meaning the validity has no end.
+        """
+        try:
+            details = ContributionPlanBundleDetailsModel.objects.filter(
+                valid_on_filter(as_of),
+                contribution_plan_bundle_id=by_contribution_plan_bundle.id,
+                contribution_plan=OuterRef("pk"),
+                is_deleted=False,
+            )
+            contribution_plans = ContributionPlanModel.objects.filter(
+                valid_on_filter(as_of), Exists(details.values("id")), is_deleted=False,
+            ).order_by("code", "id")
+            dict_representation = [serialize(cp) for cp in contribution_plans]
+        except Exception as exc:
+            return _output_exception(model_name="ContributionPlanBundle", method="get composition of", exception=exc)
+        return _output_result_success(dict_representation=dict_representation)
+
+    @check_authentication
+    def composition_timeline(self, by_contribution_plan_bundles, date_from, date_to):
+        """
+        Composition of the bundles between date_from (included) and date_to (excluded), by bundle id: consecutive
+        segments with the ids of the contribution plans attached during the segment. The details and plans
+        overlapping the range are read with one query and every bundle is swept once with composition_timeline.
+        """
+        try:
+            start, end = to_datetime(date_from), to_datetime(date_to)
+            bundle_ids = [str(bundle.id) for bundle in by_contribution_plan_bundles]
+            rows = ContributionPlanBundleDetailsModel.objects.filter(
+                Q(date_valid_to__isnull=True) | Q(date_valid_to__gt=start),
+                Q(contribution_plan__date_valid_to__isnull=True) | Q(contribution_plan__date_valid_to__gt=start),
+                contribution_plan_bundle_id__in=bundle_ids,
+                date_valid_from__lt=end,
+                contribution_plan__date_valid_from__lt=end,
+                is_deleted=False,
+                contribution_plan__is_deleted=False,
+            ).values_list(
+                "contribution_plan_bundle_id", "contribution_plan_id", "date_valid_from", "date_valid_to",
+                "contribution_plan__date_valid_from", "contribution_plan__date_valid_to",
+            )
+            intervals = {bundle_id: [] for bundle_id in bundle_ids}
+            for bundle_id, plan_id, valid_from, valid_to, plan_valid_from, plan_valid_to in rows.iterator():
+                # a plan belongs to the bundle while both the details and the plan are valid
+                ends = [date for date in (valid_to, plan_valid_to) if date is not None]
+                intervals[str(bundle_id)].append(
+                    (str(plan_id), max(valid_from, plan_valid_from), min(ends) if ends else None)
+                )
+            dict_representation = {
+                bundle_id: [
+                    {
+                        "date_valid_from": json_safe(segment_start),
+                        "date_valid_to": json_safe(segment_end),
+                        "contribution_plans": plan_ids,
+                    }
+                    for segment_start, segment_end, plan_ids in composition_timeline(bundle_intervals, start, end)
+                ]
+                for bundle_id, bundle_intervals in intervals.items()
+            }
+        except Exception as exc:
+            return _output_exception(model_name="ContributionPlanBundle", method="get composition timeline of",
+                                     exception=exc)
+        return _output_result_success(dict_representation=dict_representation)
+
     @check_authentication
     def create(self, contribution_plan_bundle):
         try:
             cpb = ContributionPlanBundleModel(**contribution_plan_bundle)
             cpb.save(username=self.user.username)
-            uuid_string = str(cpb.id)
-            dict_representation = model_to_dict(cpb)
-            dict_representation["id"], dict_representation["uuid"] = (str(uuid_string), str(uuid_string))
+            dict_representation = serialize(cpb)
         except Exception as exc:
             return _output_exception(model_name="ContributionPlanBundle", method="create", exception=exc)
         return _output_result_success(dict_representation=dict_representation)
@@ -125,12 +268,8 @@ class ContributionPlanBundle(object):
     @check_authentication
     def update(self, contribution_plan_bundle):
         try:
-            updated_cpb = ContributionPlanBundleModel.objects.filter(id=contribution_plan_bundle['id']).first()
-            [setattr(updated_cpb, key, contribution_plan_bundle[key]) for key in contribution_plan_bundle]
-            updated_cpb.save(username=self.user.username)
-            uuid_string = str(updated_cpb.id)
-            dict_representation = model_to_dict(updated_cpb)
-            dict_representation["id"], dict_representation["uuid"] = (str(uuid_string), str(uuid_string))
+            updated_cpb = _update_object(ContributionPlanBundleModel, contribution_plan_bundle, self.user)
+            dict_representation = serialize(updated_cpb)
         except Exception as exc:
             return _output_exception(model_name="ContributionPlanBundle", method="update", exception=exc)
         return _output_result_success(dict_representation=dict_representation)
@@ -153,16 +292,14 @@ class ContributionPlanBundle(object):
         try:
             cpb_to_replace = ContributionPlanBundleModel.objects.filter(id=contribution_plan_bundle['uuid']).first()
             cpb_to_replace.replace_object(data=contribution_plan_bundle, username=self.user.username)
-            uuid_string = str(cpb_to_replace.id)
-            dict_representation = model_to_dict(cpb_to_replace)
-            dict_representation["id"], dict_representation["uuid"] = (str(uuid_string), str(uuid_string))
+            dict_representation = serialize(cpb_to_replace)
         except Exception as exc:
             return _output_exception(model_name="ContributionPlanBundle", method="replace", exception=exc)
         return {
             "success": True,
             "message": "Ok",
             "detail": "",
-            "old_object": json.loads(json.dumps(dict_representation, cls=DjangoJSONEncoder)),
+            "old_object": dict_representation,
             "uuid_new_object": str(cpb_to_replace.replacement_uuid),
         }
 
@@ -176,21 +313,21 @@ class ContributionPlanBundleDetails(object):
     def get_by_id(self, by_contribution_plan_bundle_details):
         try:
             cpbd = ContributionPlanBundleDetailsModel.objects.get(id=by_contribution_plan_bundle_details.id)
-            uuid_string = str(cpbd.id)
-            dict_representation = model_to_dict(cpbd)
-            dict_representation["id"], dict_representation["uuid"] = (str(uuid_string), str(uuid_string))
+            dict_representation = serialize(cpbd)
         except Exception as exc:
             return _output_exception(model_name="ContributionPlanBundleDetails", method="get", exception=exc)
         return _output_result_success(dict_representation=dict_representation)
 
+    @check_authentication
+    def get_by_ids(self, contribution_plan_bundle_details_ids):
+        return _get_many_by_ids(ContributionPlanBundleDetailsModel, "ContributionPlanBundleDetails", contribution_plan_bundle_details_ids)
+
     @check_authentication
     def create(self, contribution_plan_bundle_details):
         try:
             cpbd = ContributionPlanBundleDetailsModel(**contribution_plan_bundle_details)
             cpbd.save(username=self.user.username)
-            uuid_string = str(cpbd.id)
-            dict_representation = model_to_dict(cpbd)
-            dict_representation["id"], dict_representation["uuid"] = (str(uuid_string), str(uuid_string))
+            dict_representation = serialize(cpbd)
         except Exception as exc:
             return _output_exception(model_name="ContributionPlanBundleDetails", method="create", exception=exc)
         return _output_result_success(dict_representation=dict_representation)
@@ -198,13 +335,8 @@ class ContributionPlanBundleDetails(object):
     @check_authentication
     def update(self, contribution_plan_bundle_details):
         try:
-            updated_cpbd = ContributionPlanBundleDetailsModel.objects.filter(
-                id=contribution_plan_bundle_details['id']).first()
-            [setattr(updated_cpbd, key, contribution_plan_bundle_details[key]) for key in contribution_plan_bundle_details]
-            updated_cpbd.save(username=self.user.username)
-            uuid_string = str(updated_cpbd.id)
-            dict_representation = model_to_dict(updated_cpbd)
-            dict_representation["id"], dict_representation["uuid"] = (str(uuid_string), str(uuid_string))
+            updated_cpbd = _update_object(ContributionPlanBundleDetailsModel, contribution_plan_bundle_details, self.user)
+            dict_representation = serialize(updated_cpbd)
         except Exception as exc:
             return _output_exception(model_name="ContributionPlanBundleDetails", method="update", exception=exc)
         return _output_result_success(dict_representation=dict_representation)
@@ -223,7 +355,8 @@ class ContributionPlanBundleDetails(object):
             return _output_exception(model_name="ContributionPlanBundleDetails", method="delete", exception=exc)
 
 
-class PaymentPlan(object):
+class PaymentPlan(AsyncServiceMixin):
+    _cached_model = PaymentPlanModel
 
     def __init__(self, user):
         self.user = user
@@ -231,35 +364,43 @@ class PaymentPlan(object):
     @check_authentication
     def get_by_id(self, by_payment_plan):
         try:
-            pp = PaymentPlanModel.objects.get(id=by_payment_plan.id)
-            uuid_string = str(pp.id)
-            dict_representation = model_to_dict(pp)
-            dict_representation["id"], dict_representation["uuid"] = (str(uuid_string), str(uuid_string))
+            pp = PaymentPlanModel.objects.get_cached(by_payment_plan.id)
+            dict_representation = serialize(pp)
         except Exception as exc:
             return _output_exception(model_name="PaymentPlan", method="get", exception=exc)
         return _output_result_success(dict_representation=dict_representation)
 
+    @check_authentication
+    def get_by_ids(self, payment_plan_ids):
+        return _get_many_by_ids(PaymentPlanModel, "PaymentPlan", payment_plan_ids)
+
     @check_authentication
     def create(self, payment_plan):
         try:
             pp = PaymentPlanModel(**payment_plan)
             pp.save(username=self.user.username)
-            uuid_string = str(pp.id)
-            dict_representation = model_to_dict(pp)
-            dict_representation["id"], dict_representation["uuid"] = (str(uuid_string), str(uuid_string))
+            dict_representation = serialize(pp)
         except Exception as exc:
             return _output_exception(model_name="PaymentPlan", method="create", exception=exc)
         return _output_result_success(dict_representation=dict_representation)
 
+    @check_authentication
+    def create_many(self, payment_plans, batch_size=500):
+        return _create_many_plans(PaymentPlanModel, "PaymentPlan", self.user, payment_plans, batch_size)
+
+    @check_authentication
+    def history_diff(self, by_payment_plan, version_from, version_to):
+        return _history_diff(PaymentPlanModel, "PaymentPlan", by_payment_plan, version_from, version_to)
+
+    @check_authentication
+    def history_changes(self, by_payment_plan, date_from=None, date_to=None):
+        return _history_changes(PaymentPlanModel, "PaymentPlan", by_payment_plan, date_from, date_to)
+
     @check_authentication
     def update(self, payment_plan):
         try:
-            updated_pp = PaymentPlanModel.objects.filter(id=payment_plan['id']).first()
-            [setattr(updated_pp, key, payment_plan[key]) for key in payment_plan]
-            updated_pp.save(username=self.user.username)
-            uuid_string = str(updated_pp.id)
-            dict_representation = model_to_dict(updated_pp)
-            dict_representation["id"], dict_representation["uuid"] = (str(uuid_string), str(uuid_string))
+            updated_pp = _update_object(PaymentPlanModel, payment_plan, self.user)
+            dict_representation = serialize(updated_pp)
         except Exception as exc:
             return _output_exception(model_name="payment_plan", method="update", exception=exc)
         return _output_result_success(dict_representation=dict_representation)
@@ -282,20 +423,112 @@ class PaymentPlan(object):
         try:
             pp_to_replace = PaymentPlanModel.objects.filter(id=payment_plan['uuid']).first()
             pp_to_replace.replace_object(data=payment_plan, username=self.user.username)
-            uuid_string = str(pp_to_replace.id)
-            dict_representation = model_to_dict(pp_to_replace)
-            dict_representation["id"], dict_representation["uuid"] = (str(uuid_string), str(uuid_string))
+            dict_representation = serialize(pp_to_replace)
         except Exception as exc:
             return _output_exception(model_name="ContributionPlan", method="replace", exception=exc)
         return {
             "success": True,
             "message": "Ok",
             "detail": "",
-            "old_object": json.loads(json.dumps(dict_representation, cls=DjangoJSONEncoder)),
+            "old_object": dict_representation,
             "uuid_new_object": str(pp_to_replace.replacement_uuid),
         }
 
 
+def _update_object(model_class, data, user):
+    # with the expected version given the row is updated without loading it first
+    if "version" in data:
+        return model_class.update_with_version(data, user=user)
+    updated_object = model_class.objects.filter(id=data['id']).first()
+    [setattr(updated_object, key, data[key]) for key in data]
+    return updated_object.save_changed_fields(user=user)
+
+
+def _history_diff(model_class, model_name, plan, version_from, version_to):
+    try:
+        dict_representation = version_diff(model_class, plan.id, version_from, version_to)
+    except Exception as exc:
+        return _output_exception(model_name=model_name, method="get history of", exception=exc)
+    return _output_result_success(dict_representation=dict_representation)
+
+
+def _history_changes(model_class, model_name, plan, date_from, date_to):
+    try:
+        dict_representation = list(iter_changes(model_class, plan.id, date_from, date_to))
+    except Exception as exc:
+        return _output_exception(model_name=model_name, method="get history of", exception=exc)
+    return _output_result_success(dict_representation=dict_representation)
+
+
+def _get_many_by_ids(model_class, model_name, ids):
+    results = [None] * len(ids)
+    requested = []
+    for index, object_id in enumerate(ids):
+        try:
+            requested.append((index, uuid.UUID(str(object_id))))
+        except Exception as exc:
+            results[index] = _output_exception(model_name=model_name, method="get", exception=exc)
+
+    # one query for the whole batch, results are matched back to the input order
+    objects_by_id = {
+        obj.id: obj for obj in model_class.objects.filter(id__in={object_id for _, object_id in requested})
+    }
+    for index, object_id in requested:
+        obj = objects_by_id.get(object_id)
+        if obj is None:
+            exc = ObjectDoesNotExist(f"{model_name} matching query does not exist: {object_id}")
+            results[index] = _output_exception(model_name=model_name, method="get", exception=exc)
+            continue
+        dict_representation = serialize(obj)
+        results[index] = _output_result_success(dict_representation=dict_representation)
+    return results
+
+
+# fields filled in by the bulk insert itself or validated separately for the whole batch
+_BULK_CREATE_NOT_VALIDATED_FIELDS = [
+    "id", "benefit_plan", "user_created", "user_updated", "date_created", "date_updated", "replacement_uuid",
+]
+
+
+def _create_many_plans(model_class, model_name, user, list_of_plans, batch_size):
+    results = [None] * len(list_of_plans)
+    validated_plans = []
+    # validate the whole batch first - field level checks don't need the database
+    for index, plan_data in enumerate(list_of_plans):
+        try:
+            plan = model_class(**plan_data)
+            plan.clean_fields(exclude=_BULK_CREATE_NOT_VALIDATED_FIELDS)
+            validated_plans.append((index, plan))
+        except Exception as exc:
+            results[index] = _output_exception(model_name=model_name, method="create", exception=exc)
+
+    # benefit plans of the whole batch are checked with a single query
+    benefit_plan_ids = {plan.benefit_plan_id for _, plan in validated_plans}
+    existing_benefit_plan_ids = set(
+        Product.objects.filter(id__in=benefit_plan_ids).values_list("id", flat=True)
+    )
+    plans_to_create = []
+    for index, plan in validated_plans:
+        if plan.benefit_plan_id in existing_benefit_plan_ids:
+            plans_to_create.append((index, plan))
+        else:
+            exc = ValidationError(f"Benefit plan {plan.benefit_plan_id} does not exist")
+            results[index] = _output_exception(model_name=model_name, method="create", exception=exc)
+
+    try:
+        with transaction.atomic():
+            bulk_create_history_objects(model_class, [plan for _, plan in plans_to_create], user, batch_size)
+    except Exception as exc:
+        for index, _ in plans_to_create:
+            results[index] = _output_exception(model_name=model_name, method="create", exception=exc)
+        return results
+
+    for index, plan in plans_to_create:
+        dict_representation = serialize(plan)
+        results[index] = _output_result_success(dict_representation=dict_representation)
+    return results
+
+
 def _output_exception(model_name, method, exception):
     return {
         "success": False,
@@ -310,5 +543,5 @@ def _output_result_success(dict_representation):
         "success": True,
         "message": "Ok",
         "detail": "",
-        "data": json.loads(json.dumps(dict_representation, cls=DjangoJSONEncoder)),
+        "data": dict_representation,
     }
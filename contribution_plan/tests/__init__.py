@@ -1,3 +1,13 @@
 from .helpers import *
 from .helpers_tests import *
+from .serializers_tests import *
+from .cache_tests import *
+from .exports_tests import *
+from .imports_tests import *
+from .bundle_index_tests import *
+from .indexes_tests import *
+from .validity_tests import *
+from .intervals_tests import *
+from .archive_tests import *
+from .active_catalog_tests import *
 from .gql_tests import *
@@ -0,0 +1,45 @@
+from datetime import datetime
+from unittest import mock
+
+from django.test import TestCase
+
+from contribution_plan.apps import ContributionPlanConfig
+from contribution_plan.models import ActivePlanCatalogEntry, ContributionPlan
+from contribution_plan.tests.helpers import create_test_contribution_plan, create_test_contribution_plan_bundle
+from contribution_plan.utils import active_only_filter
+
+
+@mock.patch.object(ContributionPlanConfig, "active_catalog_snapshot", True)
+class ActivePlanCatalogTest(TestCase):
+
+    def test_refresh_keeps_only_active_objects(self):
+        active = create_test_contribution_plan(custom_props={'code': 'ACTIVE-CURRENT'})
+        future = create_test_contribution_plan(
+            custom_props={'code': 'ACTIVE-FUTURE', 'date_valid_from': datetime(2999, 1, 1)})
+        expired = create_test_contribution_plan(
+            custom_props={'code': 'ACTIVE-EXPIRED', 'date_valid_from': datetime(2000, 1, 1),
+                          'date_valid_to': datetime(2001, 1, 1)})
+        bundle = create_test_contribution_plan_bundle()
+        ActivePlanCatalogEntry.objects.all().delete()
+
+        ActivePlanCatalogEntry.objects.refresh()
+        entries = set(ActivePlanCatalogEntry.objects.filter(
+            id__in=[active.id, future.id, expired.id, bundle.id]).values_list("id", "entity"))
+        active_codes = set(ContributionPlan.objects.filter(
+            active_only_filter(ContributionPlan), code__startswith='ACTIVE-').values_list("code", flat=True))
+
+        self.assertEqual(
+            ({(active.id, 'contributionplan'), (future.id, 'contributionplan'),
+              (bundle.id, 'contributionplanbundle')}, {'ACTIVE-CURRENT'}),
+            (entries, active_codes)
+        )
+
+    def test_snapshot_follows_changes(self):
+        contribution_plan = create_test_contribution_plan(custom_props={'code': 'ACTIVE-CHANGED'})
+        created = ActivePlanCatalogEntry.objects.filter(id=contribution_plan.id).exists()
+        contribution_plan.delete(username='admin')
+
+        self.assertEqual(
+            (True, False),
+            (created, ActivePlanCatalogEntry.objects.filter(id=contribution_plan.id).exists())
+        )
@@ -0,0 +1,98 @@
+import gzip
+import json
+import os
+import tempfile
+from datetime import datetime
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from contribution_plan import archive
+from contribution_plan.archive import ARCHIVE_ENTITIES, archive_history
+from contribution_plan.models import ContributionPlan
+from contribution_plan.tests.helpers import create_test_contribution_plan
+
+
+class _Interrupted(Exception):
+    pass
+
+
+class HistoryArchiveTest(TestCase):
+
+    def setUp(self):
+        self.contribution_plan = create_test_contribution_plan(custom_props={'code': 'ARCHIVE'})
+        for periodicity in (2, 3, 4, 5):
+            self.contribution_plan.periodicity = periodicity
+            self.contribution_plan.save(username='admin')
+        self.history = ContributionPlan.history.filter(id=self.contribution_plan.id).order_by("history_id")
+        self.history.update(history_date=datetime(2000, 1, 1))
+        self.history_ids = list(self.history.values_list("history_id", flat=True))
+        self.directory = tempfile.TemporaryDirectory()
+        self.archive_path = os.path.join(self.directory.name, "contribution_plan.jsonl.gz")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_archive_keeps_first_and_last_version(self):
+        report = archive_history("contribution_plan", datetime(2001, 1, 1), self.archive_path, chunk_size=2)
+
+        self.assertEqual(
+            (3, self.history_ids[1:4], [self.history_ids[0], self.history_ids[4]], False),
+            (report["archived_rows"], self.__archived_history_ids(),
+             list(self.history.values_list("history_id", flat=True)),
+             os.path.exists(f"{self.archive_path}.checkpoint"))
+        )
+
+    def test_interrupted_archive_resumes_without_duplicates(self):
+        def interrupt(report):
+            raise _Interrupted()
+
+        with self.assertRaises(_Interrupted):
+            archive_history("contribution_plan", datetime(2001, 1, 1), self.archive_path, chunk_size=1,
+                            progress=interrupt)
+        # the next chunk is appended to the archive but its rows are never deleted
+        with mock.patch("contribution_plan.archive.transaction.atomic", side_effect=_Interrupted()):
+            with self.assertRaises(_Interrupted):
+                archive_history("contribution_plan", datetime(2001, 1, 1), self.archive_path, chunk_size=1)
+        report = archive_history("contribution_plan", datetime(2001, 1, 1), self.archive_path, chunk_size=1)
+
+        self.assertEqual(
+            (3, self.history_ids[1:4], 2),
+            (report["archived_rows"], self.__archived_history_ids(), self.history.count())
+        )
+
+    def test_first_run_interrupted_after_append_resumes_without_duplicates(self):
+        append_chunk = archive._append_chunk
+
+        def append_then_interrupt(archive_path, rows):
+            append_chunk(archive_path, rows)
+            raise _Interrupted()
+
+        with mock.patch("contribution_plan.archive._append_chunk", side_effect=append_then_interrupt):
+            with self.assertRaises(_Interrupted):
+                archive_history("contribution_plan", datetime(2001, 1, 1), self.archive_path, chunk_size=1)
+        report = archive_history("contribution_plan", datetime(2001, 1, 1), self.archive_path, chunk_size=1)
+
+        self.assertEqual(
+            (3, self.history_ids[1:4]),
+            (report["archived_rows"], self.__archived_history_ids())
+        )
+
+    def test_command_archives_every_entity_by_default(self):
+        stdout = StringIO()
+        call_command("archive_plan_history", "--out-dir", self.directory.name, "--before", "2001-01-01",
+                     stdout=stdout)
+        self.archive_path = os.path.join(self.directory.name, "contribution_plan_history_before_20010101.jsonl.gz")
+
+        self.assertEqual(
+            (sorted(ARCHIVE_ENTITIES), ["contribution_plan_history_before_20010101.jsonl.gz"], self.history_ids[1:4]),
+            # progress lines aside, one summary line per entity
+            (sorted(line.split(":")[0] for line in stdout.getvalue().splitlines() if " rows to " in line),
+             os.listdir(self.directory.name), self.__archived_history_ids())
+        )
+
+    def __archived_history_ids(self):
+        with gzip.open(self.archive_path, "rt", encoding="utf-8") as archive_file:
+            return [json.loads(line)["history_id"] for line in archive_file]
@@ -0,0 +1,84 @@
+from datetime import datetime
+
+from django.db import connection
+from django.db.models import Q
+from django.test import TestCase
+
+from contribution_plan.models import ContributionPlanBundle, ContributionPlanBundleDetails, \
+    ContributionPlanBundleIndex
+from contribution_plan.tests.helpers import create_test_contribution_plan, create_test_contribution_plan_bundle, \
+    create_test_contribution_plan_bundle_details
+
+
+class ContributionPlanBundleIndexTest(TestCase):
+
+    def test_index_follows_details_and_plan_changes(self):
+        contribution_plan = create_test_contribution_plan(
+            custom_props={'date_valid_from': datetime(2020, 1, 1), 'date_valid_to': datetime(2030, 1, 1)})
+        bundle = create_test_contribution_plan_bundle()
+        details = create_test_contribution_plan_bundle_details(
+            contribution_plan_bundle=bundle, contribution_plan=contribution_plan,
+            custom_props={'date_valid_from': datetime(2021, 1, 1)})
+        entry = ContributionPlanBundleIndex.objects.get(contribution_plan_bundle_details=details)
+        found_bundles = list(ContributionPlanBundle.objects.filter_by_contribution_plans(
+            calculation=contribution_plan.calculation, benefit_plan=contribution_plan.benefit_plan_id))
+
+        contribution_plan.is_deleted = True
+        contribution_plan.save(username='admin')
+
+        self.assertEqual(
+            (bundle.id, contribution_plan.calculation, datetime(2021, 1, 1), None, datetime(2020, 1, 1),
+             datetime(2030, 1, 1), [bundle], False),
+            (entry.contribution_plan_bundle_id, entry.calculation, entry.date_valid_from, entry.date_valid_to,
+             entry.plan_date_valid_from, entry.plan_date_valid_to, found_bundles,
+             ContributionPlanBundleIndex.objects.filter(contribution_plan_bundle_details=details).exists())
+        )
+
+    def test_validity_filters_apply_to_details_and_plan_separately(self):
+        contribution_plan = create_test_contribution_plan(
+            custom_props={'date_valid_from': datetime(2020, 1, 1), 'date_valid_to': datetime(2030, 1, 1)})
+        bundle = create_test_contribution_plan_bundle()
+        create_test_contribution_plan_bundle_details(
+            contribution_plan_bundle=bundle, contribution_plan=contribution_plan,
+            custom_props={'date_valid_from': datetime(2021, 1, 1)})
+
+        def found(validity_filter):
+            return list(ContributionPlanBundle.objects.filter_by_contribution_plans(
+                calculation=contribution_plan.calculation, validity_filters=[validity_filter]))
+
+        # the open-ended details never end before 2030, whatever the end of the plan
+        self.assertEqual(
+            ([], [bundle], []),
+            (found(Q(date_valid_to__lte=datetime(2031, 1, 1))),
+             found(Q(date_valid_from__gte=datetime(2019, 1, 1))),
+             found(Q(date_valid_from__gte=datetime(2020, 6, 1))))
+        )
+
+    def test_hard_delete_removes_index_entries(self):
+        deleted_details = create_test_contribution_plan_bundle_details()
+        moved_details = create_test_contribution_plan_bundle_details()
+        bundle = moved_details.contribution_plan_bundle
+
+        ContributionPlanBundleDetails.objects.filter(id=deleted_details.id).delete()
+        # a queryset update leaves the entry on the previous bundle until the next refresh
+        ContributionPlanBundleDetails.objects.filter(id=moved_details.id).update(
+            contribution_plan_bundle=create_test_contribution_plan_bundle())
+        ContributionPlanBundle.objects.filter(id=bundle.id).delete()
+        connection.check_constraints()
+
+        self.assertEqual(
+            (False, False),
+            (ContributionPlanBundleIndex.objects.filter(contribution_plan_bundle_details=deleted_details).exists(),
+             ContributionPlanBundleIndex.objects.filter(contribution_plan_bundle=bundle).exists())
+        )
+
+    def test_check_consistency_reports_stale_entries(self):
+        details = create_test_contribution_plan_bundle_details()
+        ContributionPlanBundleIndex.objects.filter(contribution_plan_bundle_details=details).update(benefit_plan_id=-1)
+        inconsistent = ContributionPlanBundleIndex.objects.check_consistency()
+        ContributionPlanBundleIndex.objects.refresh()
+
+        self.assertEqual(
+            ([details.id], []),
+            (inconsistent, ContributionPlanBundleIndex.objects.check_consistency())
+        )
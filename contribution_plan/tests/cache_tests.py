@@ -0,0 +1,181 @@
+import pickle
+import tempfile
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from graphene import Schema
+from graphene.test import Client
+
+from contribution_plan import schema as contribution_plan_schema
+from contribution_plan.cache import calcrule_params_cache, plan_cache, query_result_cache
+from contribution_plan.models import ContributionPlan, PaymentPlan
+from contribution_plan.tests.helpers import create_test_contribution_plan, create_test_payment_plan
+from contribution_plan.utils import obtain_calcrule_params_cached
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class PlanCacheTest(TestCase):
+
+    def setUp(self):
+        plan_cache.clear_local()
+
+    def test_get_cached_hits_after_first_lookup(self):
+        contribution_plan = create_test_contribution_plan()
+        first = ContributionPlan.objects.get_cached(contribution_plan.id)
+        info_before = plan_cache.info()
+        with self.assertNumQueries(0):
+            second = ContributionPlan.objects.get_cached(str(contribution_plan.id))
+        info_after = plan_cache.info()
+
+        self.assertEqual(
+            (first.id, first.code, info_before["misses"], info_before["local_hits"] + 1),
+            (second.id, second.code, info_after["misses"], info_after["local_hits"])
+        )
+
+    def test_shared_tier_serves_lookup_after_local_eviction(self):
+        payment_plan = create_test_payment_plan()
+        PaymentPlan.objects.get_cached(payment_plan.id)
+        plan_cache.clear_local()
+        shared_hits = plan_cache.info()["shared_hits"]
+        with self.assertNumQueries(0):
+            cached_payment_plan = PaymentPlan.objects.get_cached(payment_plan.id)
+
+        self.assertEqual(
+            (payment_plan.id, shared_hits + 1),
+            (cached_payment_plan.id, plan_cache.info()["shared_hits"])
+        )
+
+    def test_save_invalidates_cached_plan(self):
+        contribution_plan = create_test_contribution_plan()
+        ContributionPlan.objects.get_cached(contribution_plan.id)
+        contribution_plan.periodicity = 3
+        contribution_plan.save(username='admin')
+        cached_contribution_plan = ContributionPlan.objects.get_cached(contribution_plan.id)
+
+        self.assertEqual((3, 2), (cached_contribution_plan.periodicity, cached_contribution_plan.version))
+
+    def test_plan_stored_by_late_reader_is_never_served(self):
+        contribution_plan = create_test_contribution_plan()
+        key = plan_cache._key(ContributionPlan, contribution_plan.id)
+        generation = plan_cache._generation(key)
+        stale_data = pickle.dumps(ContributionPlan.objects.get(id=contribution_plan.id))
+        contribution_plan.periodicity = 3
+        contribution_plan.save(username='admin')
+        # a reader that loaded the row before the save stores it once the plan is invalidated
+        plan_cache._shared.set(plan_cache._data_key(key, generation), stale_data, plan_cache.timeout)
+        plan_cache.clear_local()
+
+        self.assertEqual(3, ContributionPlan.objects.get_cached(contribution_plan.id).periodicity)
+
+    def test_get_cached_not_existing_plan(self):
+        with self.assertRaises(ContributionPlan.DoesNotExist):
+            ContributionPlan.objects.get_cached("00000000-0000-0000-0000-000000000000")
+
+
+class QueryResultCacheTest(TestCase):
+    class BaseTestContext:
+        user = mock.Mock(is_anonymous=False)
+
+    QUERY = '''
+    {
+        paymentPlan(code_Istartswith:"RESULT-CACHE", orderBy:["code"]) {
+            edges { node { code } }
+        }
+    }
+    '''
+
+    @classmethod
+    def setUpClass(cls):
+        super(QueryResultCacheTest, cls).setUpClass()
+        cls.graph_client = Client(Schema(query=contribution_plan_schema.Query))
+
+    def test_result_cached_until_plan_created_with_local_memory_cache(self):
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.__assert_cached_until_plan_created("RESULT-CACHE-LOCMEM")
+
+    def test_result_cached_until_plan_created_with_file_cache(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory}}):
+            self.__assert_cached_until_plan_created("RESULT-CACHE-FILE")
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_product_change_drops_cached_plan_pages(self):
+        product = create_test_payment_plan(custom_props={'code': "RESULT-CACHE-PRODUCT"}).benefit_plan
+        generation = query_result_cache.generation(PaymentPlan)
+        product.name = "Renamed product"
+        product.save()
+
+        self.assertLess(generation, query_result_cache.generation(PaymentPlan))
+
+    def __assert_cached_until_plan_created(self, code):
+        create_test_payment_plan(custom_props={'code': f"{code}-1"})
+        first_codes = self.__execute_query()
+        hits = query_result_cache.info()["hits"]
+        with self.assertNumQueries(0):
+            cached_codes = self.__execute_query()
+        cached_hits = query_result_cache.info()["hits"]
+        create_test_payment_plan(custom_props={'code': f"{code}-2"})
+        codes_after_create = self.__execute_query()
+
+        self.assertEqual(
+            ([f"{code}-1"], [f"{code}-1"], hits + 1, [f"{code}-1", f"{code}-2"]),
+            (first_codes, cached_codes, cached_hits, codes_after_create)
+        )
+
+    def __execute_query(self):
+        result = self.graph_client.execute(self.QUERY, context=self.BaseTestContext())
+        return [edge['node']['code'] for edge in result['data']['paymentPlan']['edges']]
+
+
+class CalculationRuleParamsCacheTest(TestCase):
+
+    def setUp(self):
+        calcrule_params_cache.clear()
+
+    def test_params_parsed_once_per_version(self):
+        payment_plan = create_test_payment_plan(custom_props={
+            'json_ext': {"calculation_rule": {"rate": "5", "numberOfDays": "", "fixedBatch": "null"}}
+        })
+        params = obtain_calcrule_params_cached(payment_plan, ["rate", "numberOfDays"], ["fixedBatch", "limit"])
+        misses = calcrule_params_cache.info()["misses"]
+        cached_params = obtain_calcrule_params_cached(
+            PaymentPlan.objects.get(id=payment_plan.id), ["rate", "numberOfDays"], ["fixedBatch", "limit"]
+        )
+
+        self.assertEqual(
+            ({"rate": 5, "numberOfDays": 0, "fixedBatch": None, "limit": None}, 5, True, misses, "5"),
+            (params.as_dict(), params.rate, cached_params is params, calcrule_params_cache.info()["misses"],
+             payment_plan.json_ext["calculation_rule"]["rate"])
+        )
+
+    def test_params_of_unsaved_plan_are_not_cached(self):
+        payment_plan = PaymentPlan(json_ext={"calculation_rule": {"rate": "5"}})
+        params = obtain_calcrule_params_cached(payment_plan, ["rate"], [])
+
+        self.assertEqual((5, 0), (params["rate"], calcrule_params_cache.info()["size"]))
+
+    def test_params_of_changed_json_ext_are_not_cached(self):
+        payment_plan = create_test_payment_plan(custom_props={'json_ext': {"calculation_rule": {"rate": "5"}}})
+        obtain_calcrule_params_cached(payment_plan, ["rate"], [])
+        payment_plan.json_ext["calculation_rule"]["rate"] = "7"
+        params = obtain_calcrule_params_cached(payment_plan, ["rate"], [])
+        saved_params = obtain_calcrule_params_cached(PaymentPlan.objects.get(id=payment_plan.id), ["rate"], [])
+
+        self.assertEqual((7, 5), (params["rate"], saved_params["rate"]))
+
+    def test_params_are_read_only(self):
+        payment_plan = create_test_payment_plan(custom_props={'json_ext': {"calculation_rule": {"rate": "5"}}})
+        params = obtain_calcrule_params_cached(payment_plan, ["rate"], [])
+        with self.assertRaises(AttributeError):
+            params.rate = 6
+        with self.assertRaises(TypeError):
+            params["rate"] = 6
+
+    def test_save_with_new_json_ext_invalidates_params(self):
+        payment_plan = create_test_payment_plan(custom_props={'json_ext': {"calculation_rule": {"rate": "5"}}})
+        obtain_calcrule_params_cached(payment_plan, ["rate"], [])
+        payment_plan.json_ext = {"calculation_rule": {"rate": "7"}}
+        payment_plan.save(username='admin')
+        params = obtain_calcrule_params_cached(PaymentPlan.objects.get(id=payment_plan.id), ["rate"], [])
+
+        self.assertEqual(7, params["rate"])
@@ -0,0 +1,47 @@
+import csv
+import io
+import json
+from datetime import date
+
+from django.test import TestCase
+
+from contribution_plan.exports import export_catalog
+from contribution_plan.serializers import serialize
+from contribution_plan.tests.helpers import create_test_contribution_plan, create_test_contribution_plan_bundle, \
+    create_test_contribution_plan_bundle_details
+
+
+class CatalogExportTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(CatalogExportTest, cls).setUpClass()
+        cls.contribution_plan = create_test_contribution_plan(
+            custom_props={'json_ext': {'calculation_rule': {'rate': 5}}, 'date_valid_from': date(2020, 1, 1)})
+        cls.expired_contribution_plan = create_test_contribution_plan(
+            custom_props={'code': 'EXPIRED', 'date_valid_from': date(2010, 1, 1), 'date_valid_to': date(2011, 1, 1)})
+        cls.contribution_plan_bundle = create_test_contribution_plan_bundle()
+        create_test_contribution_plan_bundle_details(
+            contribution_plan_bundle=cls.contribution_plan_bundle, contribution_plan=cls.contribution_plan)
+        cls.other_contribution_plan_bundle = create_test_contribution_plan_bundle()
+
+    def test_export_jsonl_valid_on(self):
+        out = io.StringIO()
+        count = export_catalog(out, "contribution_plan", "jsonl", valid_on=date(2021, 1, 1))
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        ids = {row["id"] for row in rows}
+
+        self.assertEqual(len(rows), count)
+        self.assertIn(serialize(self.contribution_plan), rows)
+        self.assertNotIn(str(self.expired_contribution_plan.id), ids)
+
+    def test_export_csv_bundles_by_benefit_plan(self):
+        out = io.StringIO()
+        count = export_catalog(out, "contribution_plan_bundle", "csv", chunk_size=1,
+                               benefit_plan=self.contribution_plan.benefit_plan_id)
+        header, *rows = list(csv.reader(io.StringIO(out.getvalue())))
+        json_ext_by_id = {row[header.index("id")]: row[header.index("json_ext")] for row in rows}
+
+        self.assertEqual(len(rows), count)
+        self.assertEqual("{}", json_ext_by_id.get(str(self.contribution_plan_bundle.id)))
+        self.assertNotIn(str(self.other_contribution_plan_bundle.id), json_ext_by_id)
@@ -2,3 +2,4 @@ from .query_tests import *
 from .mutations_cp_tests import *
 from .mutations_cpb_tests import *
 from .mutations_cpbd_tests import *
+from .dataloaders_tests import *
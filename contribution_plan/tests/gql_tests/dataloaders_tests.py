@@ -0,0 +1,80 @@
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from graphene import Schema
+from graphene.test import Client
+
+from contribution_plan import schema as contribution_plan_schema
+from contribution_plan.dataloaders import set_dataloaders
+from contribution_plan.tests.helpers import create_test_contribution_plan, create_test_contribution_plan_bundle, \
+    create_test_contribution_plan_bundle_details
+
+
+class DataLoadersTest(TestCase):
+    class DataLoadersTestContext:
+
+        def __init__(self):
+            self.user = mock.Mock(is_anonymous=False)
+            self.dataloaders = {}
+            set_dataloaders(self.dataloaders)
+
+    class NoDataLoadersTestContext:
+
+        def __init__(self):
+            self.user = mock.Mock(is_anonymous=False)
+
+    QUERY = '''
+    fragment planFields on ContributionPlanGQLType {
+        code
+        benefitPlan { code }
+    }
+    {
+        contributionPlanBundleDetails(contributionPlanBundle_Code: "LOADER-BUNDLE") {
+            edges {
+                node {
+                    plan: contributionPlan { ...planFields }
+                    bundle: contributionPlanBundle { code }
+                }
+            }
+        }
+    }
+    '''
+
+    @classmethod
+    def setUpClass(cls):
+        super(DataLoadersTest, cls).setUpClass()
+        cls.graph_client = Client(Schema(query=contribution_plan_schema.Query))
+
+    def test_nested_fields_resolve_in_constant_number_of_queries(self):
+        first_page_queries, first_page_size = self.__add_details_and_count_queries(2)
+        second_page_queries, second_page_size = self.__add_details_and_count_queries(8)
+
+        self.assertEqual(
+            (2, 10, first_page_queries),
+            (first_page_size, second_page_size, second_page_queries)
+        )
+
+    def test_nested_fields_fall_back_without_dataloaders(self):
+        self.__add_details_and_count_queries(3)
+        result = self.graph_client.execute(self.QUERY, context=self.NoDataLoadersTestContext())
+        loaded_result = self.graph_client.execute(self.QUERY, context=self.DataLoadersTestContext())
+        plan_codes = sorted(edge['node']['plan']['code']
+                            for edge in result['data']['contributionPlanBundleDetails']['edges'])
+
+        self.assertEqual(
+            (None, ['LOADER-0', 'LOADER-1', 'LOADER-2'], loaded_result['data']),
+            (result.get('errors'), plan_codes, result['data'])
+        )
+
+    def __add_details_and_count_queries(self, number_of_details):
+        for index in range(number_of_details):
+            create_test_contribution_plan_bundle_details(
+                contribution_plan_bundle=create_test_contribution_plan_bundle(custom_props={'code': 'LOADER-BUNDLE'}),
+                contribution_plan=create_test_contribution_plan(custom_props={'code': f'LOADER-{index}'}),
+            )
+        with CaptureQueriesContext(connection) as context:
+            result = self.graph_client.execute(self.QUERY, context=self.DataLoadersTestContext())
+        edges = result['data']['contributionPlanBundleDetails']['edges']
+        return len(context.captured_queries), len(edges)
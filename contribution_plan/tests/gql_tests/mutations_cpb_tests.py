@@ -185,6 +185,45 @@ class MutationTestContributionPlanBundle(TestCase):
         result_mutation = self.add_mutation("updateContributionPlanBundle", input_param)
         self.assertEqual(True, 'errors' in result_mutation)
 
+    def test_contribution_plan_bundle_replace_with_attached_plans(self):
+        contribution_plan_bundle = create_test_contribution_plan_bundle(
+            custom_props={'code': 'CPB replace', 'date_valid_from': datetime.date(2020, 1, 1)})
+        list_cpbd = [
+            create_test_contribution_plan_bundle_details(
+                contribution_plan_bundle=contribution_plan_bundle,
+                custom_props={'date_valid_from': datetime.date(2020, 1, 1), 'date_valid_to': date_valid_to}
+            ) for date_valid_to in [None, datetime.date(2020, 6, 1), datetime.date(2022, 1, 1)]
+        ]
+        input_param = {
+            "uuid": str(contribution_plan_bundle.id),
+            "dateValidFrom": "2021-01-01",
+        }
+        self.add_mutation("replaceContributionPlanBundle", input_param)
+
+        old_cpbd = ContributionPlanBundleDetails.objects.filter(id__in=[cpbd.id for cpbd in list_cpbd])
+        new_cpb = ContributionPlanBundle.objects.get(id=ContributionPlanBundle.objects.get(
+            id=contribution_plan_bundle.id).replacement_uuid)
+        new_cpbd = ContributionPlanBundleDetails.objects.filter(contribution_plan_bundle=new_cpb)
+
+        self.assertEqual(
+            (
+                sorted(str(cpbd.contribution_plan_id) for cpbd in list_cpbd),
+                {new_cpb.date_valid_from},
+                # details already ended before the new version are left untouched
+                [1, 2, 2],
+                [datetime.date(2020, 6, 1), datetime.date(2021, 1, 1), datetime.date(2021, 1, 1)],
+                2,
+            ),
+            (
+                sorted(str(cpbd.contribution_plan_id) for cpbd in new_cpbd),
+                {cpbd.date_valid_from for cpbd in new_cpbd},
+                sorted(cpbd.version for cpbd in old_cpbd),
+                sorted(cpbd.date_valid_to.date() for cpbd in old_cpbd),
+                ContributionPlanBundleDetails.history.filter(
+                    id__in=[cpbd.id for cpbd in list_cpbd], version=2).count(),
+            )
+        )
+
     def find_by_id_query(self, query_type, id, context=None):
         query = F'''
         {{
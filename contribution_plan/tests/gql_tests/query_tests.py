@@ -1,9 +1,12 @@
 import graphene
 import datetime
 import base64
+import re
 
 from django.contrib.auth.models import AnonymousUser
-from django.test import TestCase
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.test import TestCase, override_settings
 from graphene import Schema
 from graphene.test import Client
 from unittest import mock
@@ -11,6 +14,10 @@ from uuid import UUID
 
 from contribution_plan.tests.helpers import *
 from contribution_plan import schema as contribution_plan_schema
+from contribution_plan.apps import ContributionPlanConfig
+from contribution_plan.cache import query_result_cache
+from contribution_plan.gql.connection_fields import _has_own_filters
+from contribution_plan.models import ActivePlanCatalogEntry
 
 
 class QueryTest(TestCase):
@@ -109,6 +116,237 @@ class QueryTest(TestCase):
         converted_id = base64.b64decode(result['id']).decode('utf-8').split(':')[1]
         self.assertEqual(UUID(converted_id), id)
 
+    def test_find_contribution_plan_bundle_by_calculation_uses_index_exists(self):
+        bundle = self.test_contribution_plan_details.contribution_plan_bundle
+        contribution_plan = self.test_contribution_plan_details.contribution_plan
+        deleted_details = create_test_contribution_plan_bundle_details(
+            contribution_plan=contribution_plan, custom_props={'is_deleted': True})
+        query = F'''
+        {{
+            contributionPlanBundle(
+                calculation:"{contribution_plan.calculation}",
+                insuranceProduct:{contribution_plan.benefit_plan_id},
+                orderBy:["code"]) {{
+                edges {{
+                  node {{
+                    id
+                  }}
+                }}
+          }}
+        }}
+        '''
+        with CaptureQueriesContext(connection) as context:
+            query_result = self.execute_query(query)
+        bundle_query = next(query['sql'] for query in context.captured_queries
+                            if 'tblContributionPlanBundleIndex' in query['sql'])
+        ids = [UUID(base64.b64decode(edge['node']['id']).decode('utf-8').split(':')[1])
+               for edge in query_result['contributionPlanBundle']['edges']]
+
+        self.assertEqual(
+            ([bundle.id], True, False),
+            (ids, 'EXISTS' in bundle_query.upper(), 'DISTINCT' in bundle_query.upper())
+        )
+        self.assertNotIn(deleted_details.contribution_plan_bundle.id, ids)
+
+    def test_keyset_pagination_walks_all_pages(self):
+        product = self.test_contribution_plan.benefit_plan
+        codes = ["KEYSET-B", None, "KEYSET-A", "KEYSET-B", "KEYSET-C"]
+        for code in codes:
+            create_test_contribution_plan(product=product, custom_props={'code': code, 'name': 'KEYSET'})
+
+        seen_codes, after, has_next_page = [], None, True
+        while has_next_page:
+            after_arg = f', after:"{after}"' if after else ''
+            query = F'''
+            {{
+                contributionPlan(name:"KEYSET", orderBy:["-code"], keyset:true, first:2{after_arg}) {{
+                    totalCount
+                    pageInfo {{ hasNextPage endCursor }}
+                    edges {{ node {{ code }} }}
+                }}
+            }}
+            '''
+            result = self.execute_query(query)['contributionPlan']
+            seen_codes += [edge['node']['code'] for edge in result['edges']]
+            has_next_page, after = result['pageInfo']['hasNextPage'], result['pageInfo']['endCursor']
+
+        self.assertEqual(["KEYSET-C", "KEYSET-B", "KEYSET-B", "KEYSET-A", None], seen_codes)
+
+    def test_keyset_pagination_keeps_sub_millisecond_ordering(self):
+        product = self.test_contribution_plan.benefit_plan
+        date_created = datetime.datetime(2021, 3, 1, 12, 0, 0, 100)
+        codes = ["KEYSET-US-1", "KEYSET-US-2", "KEYSET-US-3", "KEYSET-US-4"]
+        for index, code in enumerate(codes):
+            contribution_plan = create_test_contribution_plan(
+                product=product, custom_props={'code': code, 'name': 'KEYSET-US'})
+            # every plan created within the same millisecond
+            ContributionPlan.objects.filter(id=contribution_plan.id).update(
+                date_created=date_created + datetime.timedelta(microseconds=200 * index))
+
+        for order, expected_codes in (("dateCreated", codes), ("-dateCreated", codes[::-1])):
+            seen_codes, after, has_next_page = [], None, True
+            while has_next_page and len(seen_codes) <= len(codes):
+                after_arg = f', after:"{after}"' if after else ''
+                query = F'''
+                {{
+                    contributionPlan(name:"KEYSET-US", orderBy:["{order}"], keyset:true, first:1{after_arg}) {{
+                        pageInfo {{ hasNextPage endCursor }}
+                        edges {{ node {{ code }} }}
+                    }}
+                }}
+                '''
+                result = self.execute_query(query)['contributionPlan']
+                seen_codes += [edge['node']['code'] for edge in result['edges']]
+                has_next_page, after = result['pageInfo']['hasNextPage'], result['pageInfo']['endCursor']
+
+            self.assertEqual(expected_codes, seen_codes)
+
+    def test_total_count_runs_only_when_selected(self):
+        query = '''
+        {
+            paymentPlan(first:1) {
+                edges { node { id } }
+            }
+        }
+        '''
+        with CaptureQueriesContext(connection) as context:
+            self.execute_query(query)
+        count_queries = [query['sql'] for query in context.captured_queries if 'COUNT(' in query['sql'].upper()]
+        self.assertEqual([], count_queries)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_approximate_total_count_is_cached(self):
+        if connection.vendor == 'postgresql':
+            self.skipTest("the planner estimate is used on PostgreSQL")
+        query = '''
+        {
+            paymentPlan(first:1) {
+                approximateTotalCount
+            }
+        }
+        '''
+        first_count = self.execute_query(query)['paymentPlan']['approximateTotalCount']
+        create_test_payment_plan()
+        with CaptureQueriesContext(connection) as context:
+            cached_count = self.execute_query(query)['paymentPlan']['approximateTotalCount']
+
+        self.assertEqual(
+            (1, 1, []),
+            (first_count, cached_count,
+             [query['sql'] for query in context.captured_queries if 'COUNT(' in query['sql'].upper()])
+        )
+
+    def test_planner_estimate_only_for_unfiltered_listings(self):
+        self.assertEqual(
+            (False, False, True, True),
+            (_has_own_filters(PaymentPlan.objects.all()),
+             _has_own_filters(PaymentPlan.objects.filter(is_deleted=False)),
+             _has_own_filters(PaymentPlan.objects.filter(is_deleted=False, code="FILTERED")),
+             _has_own_filters(PaymentPlan.objects.filter(periodicity__gt=1)))
+        )
+
+    def test_search_plans_ranks_prefix_matches_first(self):
+        product = self.test_contribution_plan.benefit_plan
+        create_test_contribution_plan(product=product, custom_props={'code': 'XSEARCH-B', 'name': 'First plan'})
+        create_test_payment_plan(product=product, custom_props={'code': 'PP-1', 'name': 'Plan xsearch'})
+        create_test_contribution_plan_bundle(custom_props={'code': 'XSEARCH-A', 'name': 'Bundle'})
+        query = '''
+        {
+            searchPlans(term:"xsearch", limit:10) {
+                type
+                code
+                rank
+            }
+        }
+        '''
+        result = self.execute_query(query)['searchPlans']
+
+        self.assertEqual(
+            [
+                {'type': 'ContributionPlanBundle', 'code': 'XSEARCH-A', 'rank': 0},
+                {'type': 'ContributionPlan', 'code': 'XSEARCH-B', 'rank': 0},
+                {'type': 'PaymentPlan', 'code': 'PP-1', 'rank': 1},
+            ],
+            result
+        )
+
+    def test_find_contribution_plan_as_of(self):
+        product = self.test_contribution_plan.benefit_plan
+        for code, valid_from, valid_to in (("ASOF-OLD", datetime.datetime(2019, 1, 1), datetime.datetime(2020, 1, 1)),
+                                           ("ASOF-NEW", datetime.datetime(2020, 1, 1), None)):
+            create_test_contribution_plan(product=product, custom_props={
+                'code': code, 'name': 'ASOF', 'date_valid_from': valid_from, 'date_valid_to': valid_to})
+        query = '''
+        {{
+            contributionPlan(name:"ASOF", asOf:"{as_of}") {{
+                edges {{ node {{ code }} }}
+            }}
+        }}
+        '''
+        codes = {
+            as_of: [edge['node']['code'] for edge in
+                    self.execute_query(query.format(as_of=as_of))['contributionPlan']['edges']]
+            for as_of in ("2019-06-01", "2020-01-01", "2030-01-01")
+        }
+
+        self.assertEqual(
+            {"2019-06-01": ["ASOF-OLD"], "2020-01-01": ["ASOF-NEW"], "2030-01-01": ["ASOF-NEW"]},
+            codes
+        )
+
+    def test_payment_plan_history_version_diff(self):
+        payment_plan = create_test_payment_plan(product=self.test_payment_plan.benefit_plan)
+        payment_plan.periodicity = 3
+        payment_plan.save(username='admin')
+        query = F'''
+        {{
+            paymentPlanHistory(id:"{payment_plan.id}", versionFrom:1, versionTo:2) {{
+                version
+                changes {{ field oldValue newValue }}
+            }}
+        }}
+        '''
+        result = self.execute_query(query)['paymentPlanHistory']
+
+        self.assertEqual(
+            [{'version': 2, 'changes': [{'field': 'periodicity', 'oldValue': '1', 'newValue': '3'}]}],
+            result
+        )
+
+    def test_find_contribution_plan_active_only(self):
+        product = self.test_contribution_plan.benefit_plan
+        for code, valid_from, valid_to in (("ACTIVEONLY-EXPIRED", datetime.datetime(2019, 1, 1), datetime.datetime(2020, 1, 1)),
+                                           ("ACTIVEONLY-CURRENT", datetime.datetime(2020, 1, 1), None)):
+            create_test_contribution_plan(product=product, custom_props={
+                'code': code, 'name': 'ACTIVEONLY', 'date_valid_from': valid_from, 'date_valid_to': valid_to})
+        query = '''
+        {
+            contributionPlan(name:"ACTIVEONLY", activeOnly:true, applyDefaultValidityFilter:true) {
+                edges { node { code } }
+            }
+        }
+        '''
+        codes = []
+        for snapshot in (False, True):
+            # pages cached by the first query would hide the snapshot
+            with mock.patch.object(ContributionPlanConfig, "active_catalog_snapshot", snapshot), \
+                    mock.patch.object(query_result_cache, "timeout", 0):
+                ActivePlanCatalogEntry.objects.refresh()
+                with CaptureQueriesContext(connection) as context:
+                    codes.append(
+                        [edge['node']['code'] for edge in self.execute_query(query)['contributionPlan']['edges']])
+        # with the snapshot, the validity columns of the plan table are not filtered
+        plan_where_clauses = [
+            re.sub(r'["`\[\]]', '', query['sql']).split(' WHERE ', 1)[1] for query in context.captured_queries
+            if 'tblActivePlanCatalog' in query['sql'] and ' WHERE ' in query['sql']
+        ]
+
+        self.assertEqual(
+            ([["ACTIVEONLY-CURRENT"], ["ACTIVEONLY-CURRENT"]], True, False),
+            (codes, bool(plan_where_clauses),
+             any('tblContributionPlan.DateValidTo' in where for where in plan_where_clauses))
+        )
+
     def find_by_id_query(self, query_type, id, context=None):
         query = F'''
         {{
@@ -8,7 +8,7 @@ from calculation.calculation_rule import ContributionValuationRule
 
 
 def create_test_contribution_plan_bundle(custom_props={}):
-    user = __get_or_create_simple_contribution_plan_user()
+    user = get_or_create_simple_contribution_plan_user()
     object_data = {
         'is_deleted': 0,
         'code': "Contribution Plan Bundle Code",
@@ -28,7 +28,7 @@ def create_test_contribution_plan(product=None, calculation=ContributionValuatio
     if not product:
         product = create_test_product("PlanCode", custom_props={"insurance_period": 12, })
 
-    user = __get_or_create_simple_contribution_plan_user()
+    user = get_or_create_simple_contribution_plan_user()
 
     object_data = {
         'is_deleted': False,
@@ -55,7 +55,7 @@ def create_test_contribution_plan_bundle_details(contribution_plan_bundle=None,
     if not contribution_plan:
         contribution_plan = create_test_contribution_plan()
 
-    user = __get_or_create_simple_contribution_plan_user()
+    user = get_or_create_simple_contribution_plan_user()
     object_data = {
         'contribution_plan_bundle': contribution_plan_bundle,
         'contribution_plan': contribution_plan,
@@ -79,7 +79,7 @@ def create_test_payment_plan(product=None, calculation=ContributionValuationRule
     if not product:
         product = create_test_product("PlanCode", custom_props={"insurance_period": 12, })
 
-    user = __get_or_create_simple_contribution_plan_user()
+    user = get_or_create_simple_contribution_plan_user()
 
     object_data = {
         'is_deleted': False,
@@ -98,7 +98,7 @@ def create_test_payment_plan(product=None, calculation=ContributionValuationRule
     return payment_plan
 
 
-def __get_or_create_simple_contribution_plan_user():
+def get_or_create_simple_contribution_plan_user():
     if not User.objects.filter(username='admin').exists():
         User.objects.create_superuser(username='admin', password='S\/pe®Pąßw0rd™')
     user = User.objects.filter(username='admin').first()
@@ -0,0 +1,73 @@
+import json
+import os
+import tempfile
+
+from django.test import TestCase
+
+from calculation.calculation_rule import ContributionValuationRule
+from contribution_plan.imports import CatalogImportError, import_catalog
+from contribution_plan.models import ContributionPlan, ContributionPlanBundleDetails
+from contribution_plan.tests.helpers import create_test_contribution_plan, create_test_contribution_plan_bundle, \
+    get_or_create_simple_contribution_plan_user
+
+
+class CatalogImportTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(CatalogImportTest, cls).setUpClass()
+        cls.user = get_or_create_simple_contribution_plan_user()
+        cls.contribution_plan = create_test_contribution_plan(custom_props={'code': 'IMPORT-EXISTING'})
+        cls.benefit_plan_id = cls.contribution_plan.benefit_plan_id
+
+    def test_import_rejects_invalid_rows_without_writing(self):
+        rows = [
+            self.__plan_row("IMPORT-A"),
+            self.__plan_row("IMPORT-A"),
+            self.__plan_row("IMPORT-EXISTING"),
+            {**self.__plan_row("IMPORT-B"), "benefit_plan": -1},
+            {**self.__plan_row("IMPORT-C"), "calculation": "00000000-0000-0000-0000-000000000000"},
+        ]
+        with self.assertRaises(CatalogImportError) as context:
+            import_catalog("contribution_plan", rows, self.user)
+
+        self.assertEqual(
+            ([1, 2, 3, 4, 5], 0),
+            ([row_number for row_number, _ in context.exception.errors],
+             ContributionPlan.objects.filter(code__in=["IMPORT-A", "IMPORT-B", "IMPORT-C"]).count())
+        )
+
+    def test_import_resumes_after_committed_chunks(self):
+        rows = [self.__plan_row(f"IMPORT-RESUME-{index}") for index in range(5)]
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint_path = os.path.join(directory, "plans.checkpoint")
+            # first two chunks of two rows committed by an earlier run
+            with open(checkpoint_path, "w") as checkpoint_file:
+                json.dump({"entity": "contribution_plan", "committed_rows": 4, "total_rows": 5}, checkpoint_file)
+            progress = []
+            count = import_catalog("contribution_plan", rows, self.user, chunk_size=2,
+                                   checkpoint_path=checkpoint_path, progress=lambda *args: progress.append(args))
+            checkpoint_removed = not os.path.exists(checkpoint_path)
+
+        self.assertEqual(
+            (1, [(5, 5)], True, ["IMPORT-RESUME-4"]),
+            (count, progress, checkpoint_removed,
+             list(ContributionPlan.objects.filter(code__startswith="IMPORT-RESUME-").values_list("code", flat=True)))
+        )
+
+    def test_import_bundle_details_by_code(self):
+        bundle = create_test_contribution_plan_bundle(custom_props={'code': 'IMPORT-BUNDLE'})
+        rows = [{"contribution_plan_bundle": "IMPORT-BUNDLE", "contribution_plan": "IMPORT-EXISTING",
+                 "date_valid_from": "2021-01-01", "json_ext": {}}]
+        import_catalog("contribution_plan_bundle_details", rows, self.user)
+        details = ContributionPlanBundleDetails.objects.get(contribution_plan_bundle=bundle)
+
+        self.assertEqual(
+            (self.contribution_plan.id, 1, 1),
+            (details.contribution_plan_id, details.version, details.history.count())
+        )
+
+    def __plan_row(self, code):
+        return {"code": code, "name": code, "benefit_plan": str(self.benefit_plan_id),
+                "calculation": str(ContributionValuationRule.uuid), "periodicity": "12",
+                "date_valid_from": "2021-01-01", "json_ext": {}}
@@ -0,0 +1,38 @@
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase
+
+from contribution_plan.models import ContributionPlan, ContributionPlanBundleDetails, PaymentPlan
+from contribution_plan.tests.helpers import create_test_contribution_plan_bundle_details
+from core.utils import append_validity_filter
+
+
+@skipUnless(connection.vendor == 'postgresql', "query plans are checked on PostgreSQL")
+class ValidityIndexesTest(TestCase):
+
+    def setUp(self):
+        self.contribution_plan_bundle_details = create_test_contribution_plan_bundle_details()
+        # the test tables are tiny, sequential scans are disabled so the planner shows which index it would use
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+
+    def test_validity_filter_uses_deleted_validity_index(self):
+        filters = append_validity_filter(applyDefaultValidityFilter=True)
+        for model_class, index_name in ((ContributionPlan, 'cp_deleted_validity_idx'),
+                                        (PaymentPlan, 'pp_deleted_validity_idx')):
+            plan = model_class.objects.filter(*filters, is_deleted=False).explain()
+            self.assertIn(index_name, plan)
+
+    def test_bundle_details_lookups_use_indexes(self):
+        details = self.contribution_plan_bundle_details
+        for queryset in (
+            ContributionPlanBundleDetails.objects.filter(
+                contribution_plan_bundle=details.contribution_plan_bundle, is_deleted=False),
+            ContributionPlanBundleDetails.objects.filter(
+                contribution_plan=details.contribution_plan, is_deleted=False),
+            ContributionPlan.objects.filter(benefit_plan=details.contribution_plan.benefit_plan, is_deleted=False),
+        ):
+            plan = queryset.explain()
+            self.assertNotIn('Seq Scan', plan)
+            self.assertIn('Index', plan)
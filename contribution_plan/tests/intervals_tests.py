@@ -0,0 +1,89 @@
+import random
+from datetime import date, datetime, timedelta
+
+from django.test import TestCase, override_settings
+
+from contribution_plan.intervals import IntervalTree, bundle_details_intervals
+from contribution_plan.tests.helpers import create_test_contribution_plan_bundle, \
+    create_test_contribution_plan_bundle_details
+
+
+class IntervalTreeTest(TestCase):
+
+    def test_overlapping_matches_linear_scan(self):
+        generator = random.Random(0)
+        start = datetime(2020, 1, 1)
+        intervals = []
+        for index in range(500):
+            valid_from = start + timedelta(days=generator.randrange(1000))
+            valid_to = None if generator.random() < 0.1 else valid_from + timedelta(days=generator.randrange(1, 90))
+            intervals.append((valid_from, valid_to, index))
+        tree = IntervalTree(intervals)
+        by_start = sorted(intervals, key=lambda interval: interval[0])
+
+        for _ in range(200):
+            query_from = start + timedelta(days=generator.randrange(-10, 1100))
+            query_to = None if generator.random() < 0.1 else query_from + timedelta(days=generator.randrange(30))
+            expected = [index for valid_from, valid_to, index in by_start
+                        if (query_to is None or valid_from < query_to) and (valid_to is None or valid_to > query_from)]
+            self.assertEqual(sorted(expected), sorted(tree.overlapping(query_from, query_to)))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class BundleDetailsIntervalIndexTest(TestCase):
+
+    def setUp(self):
+        bundle_details_intervals.clear()
+
+    def test_overlapping_follows_details_changes(self):
+        bundle = create_test_contribution_plan_bundle()
+        first = create_test_contribution_plan_bundle_details(
+            contribution_plan_bundle=bundle,
+            custom_props={'date_valid_from': datetime(2020, 1, 1), 'date_valid_to': datetime(2020, 6, 1)})
+        second = create_test_contribution_plan_bundle_details(
+            contribution_plan_bundle=bundle, custom_props={'date_valid_from': datetime(2020, 6, 1)})
+
+        found = bundle_details_intervals.overlapping(bundle.id, date(2020, 5, 1), date(2020, 7, 1))
+        with self.assertNumQueries(0):
+            # validity ranges are half-open, the first details ends when the range starts
+            found_later = bundle_details_intervals.overlapping(bundle.id, date(2020, 6, 1))
+        second.delete(username='admin')
+        found_after_delete = bundle_details_intervals.overlapping(bundle.id, date(2020, 5, 1), date(2020, 7, 1))
+
+        self.assertEqual(
+            ([first.id, second.id], [second.id], [first.id]),
+            ([interval.id for interval in found], [interval.id for interval in found_later],
+             [interval.id for interval in found_after_delete])
+        )
+
+    def test_details_moved_to_another_bundle_leave_previous_tree(self):
+        bundle, other_bundle = create_test_contribution_plan_bundle(), create_test_contribution_plan_bundle()
+        details = create_test_contribution_plan_bundle_details(contribution_plan_bundle=bundle)
+        found_before = bundle_details_intervals.overlapping(bundle.id, date(2000, 1, 1))
+        bundle_details_intervals.overlapping(other_bundle.id, date(2000, 1, 1))
+        details.contribution_plan_bundle = other_bundle
+        details.save(username='admin')
+
+        self.assertEqual(
+            ([details.id], [], [details.id]),
+            ([interval.id for interval in found_before],
+             [interval.id for interval in bundle_details_intervals.overlapping(bundle.id, date(2000, 1, 1))],
+             [interval.id for interval in bundle_details_intervals.overlapping(other_bundle.id, date(2000, 1, 1))])
+        )
+
+    def test_memory_budget_evicts_least_recently_used_bundle(self):
+        bundles = [create_test_contribution_plan_bundle() for _ in range(3)]
+        for bundle in bundles:
+            create_test_contribution_plan_bundle_details(contribution_plan_bundle=bundle)
+        max_intervals = bundle_details_intervals.max_intervals
+        bundle_details_intervals.max_intervals = 2
+        try:
+            for bundle in bundles:
+                bundle_details_intervals.overlapping(bundle.id, date(2000, 1, 1))
+            info = bundle_details_intervals.info()
+            with self.assertNumQueries(1):
+                bundle_details_intervals.overlapping(bundles[0].id, date(2000, 1, 1))
+        finally:
+            bundle_details_intervals.max_intervals = max_intervals
+
+        self.assertEqual((2, 2), (info["bundles"], info["intervals"]))
@@ -0,0 +1,43 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.forms.models import model_to_dict
+from django.test import TestCase
+
+from contribution_plan.models import ContributionPlan
+from contribution_plan.serializers import serialize
+from contribution_plan.tests.helpers import create_test_contribution_plan, create_test_contribution_plan_bundle, \
+    create_test_contribution_plan_bundle_details, create_test_payment_plan
+
+
+class SerializersTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(SerializersTest, cls).setUpClass()
+        cls.contribution_plan = create_test_contribution_plan(
+            custom_props={'json_ext': {'calculation_rule': {'rate': 5, 'limits': [1, 2.5, None]}}})
+        cls.contribution_plan_bundle = create_test_contribution_plan_bundle()
+        cls.contribution_plan_bundle_details = create_test_contribution_plan_bundle_details(
+            contribution_plan_bundle=cls.contribution_plan_bundle, contribution_plan=cls.contribution_plan)
+        cls.payment_plan = create_test_payment_plan()
+
+    def test_serialize_matches_model_to_dict_json_round_trip(self):
+        for instance in [self.contribution_plan, self.contribution_plan_bundle,
+                         self.contribution_plan_bundle_details, self.payment_plan]:
+            db_instance = type(instance).objects.get(id=instance.id)
+            for obj in [instance, db_instance]:
+                self.assertEqual(json.dumps(self.__legacy_serialize(obj)), json.dumps(serialize(obj)))
+
+    def test_serialize_not_saved_payload_values(self):
+        plan = ContributionPlan(
+            code="CP", benefit_plan_id="1", periodicity=6, calculation=str(self.contribution_plan.calculation),
+            date_valid_from="2021-01-01", json_ext={1: "int key"})
+        self.assertEqual(json.dumps(self.__legacy_serialize(plan)), json.dumps(serialize(plan)))
+
+    @staticmethod
+    def __legacy_serialize(instance):
+        uuid_string = str(instance.id)
+        dict_representation = model_to_dict(instance)
+        dict_representation["id"], dict_representation["uuid"] = (str(uuid_string), str(uuid_string))
+        return json.loads(json.dumps(dict_representation, cls=DjangoJSONEncoder))
@@ -1 +1,2 @@
-from .services_cp_tests import *
\ No newline at end of file
+from .services_cp_tests import *
+from .services_async_tests import *
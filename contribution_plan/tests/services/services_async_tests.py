@@ -0,0 +1,91 @@
+from unittest import mock
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.test import TestCase
+
+from calculation.calculation_rule import ContributionValuationRule
+from contribution_plan.apps import ContributionPlanConfig
+from contribution_plan.models import ContributionPlan
+from contribution_plan.services import ContributionPlan as ContributionPlanService, \
+    ContributionPlanBundle as ContributionPlanBundleService
+from contribution_plan.tests.helpers import create_test_contribution_plan, create_test_contribution_plan_bundle, \
+    get_or_create_simple_contribution_plan_user
+from product.test_helpers import create_test_product
+
+
+class AsyncServiceTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(AsyncServiceTest, cls).setUpClass()
+        cls.user = get_or_create_simple_contribution_plan_user()
+        cls.contribution_plan_service = ContributionPlanService(cls.user)
+        cls.contribution_plan_bundle_service = ContributionPlanBundleService(cls.user)
+        cls.test_product = create_test_product("PlanCode", custom_props={"insurance_period": 12, })
+        cls.contribution_plan = create_test_contribution_plan(product=cls.test_product)
+        cls.contribution_plan_bundle = create_test_contribution_plan_bundle()
+
+    def test_aget_by_id_matches_sync_result(self):
+        response = async_to_sync(self.contribution_plan_service.aget_by_id)(self.contribution_plan)
+        # second call is served by the process-local cache tier
+        response_cached = async_to_sync(self.contribution_plan_service.aget_by_id)(self.contribution_plan)
+        self.assertEqual(
+            (self.contribution_plan_service.get_by_id(self.contribution_plan), response),
+            (response_cached, response)
+        )
+
+    def test_aget_by_ids(self):
+        response = async_to_sync(self.contribution_plan_bundle_service.aget_by_ids)(
+            [self.contribution_plan_bundle.id])
+        self.assertEqual(
+            (True, str(self.contribution_plan_bundle.id)),
+            (response[0]['success'], response[0]['data']['id'])
+        )
+
+    def test_acreate_aupdate(self):
+        response = async_to_sync(self.contribution_plan_service.acreate)({
+            'code': "CP ASYNC",
+            'name': "Contribution Plan Async",
+            'benefit_plan_id': self.test_product.id,
+            'periodicity': 6,
+            'calculation': str(ContributionValuationRule.uuid),
+            'json_ext': {},
+        })
+        response_update = async_to_sync(self.contribution_plan_service.aupdate)({
+            'id': response['data']['id'],
+            'periodicity': 12,
+        })
+
+        # tear down the test data
+        ContributionPlan.objects.filter(id=response['data']['id']).delete()
+
+        self.assertEqual(
+            (True, True, 12, 2),
+            (
+                response['success'],
+                response_update['success'],
+                response_update['data']['periodicity'],
+                response_update['data']['version'],
+            )
+        )
+
+    def test_anonymous_user(self):
+        service = ContributionPlanService(AnonymousUser())
+        response = async_to_sync(service.aget_by_id)(self.contribution_plan)
+        self.assertEqual((False, "Authentication required"), (response['success'], response['message']))
+
+    def test_thread_sensitive_setting(self):
+        calls = []
+
+        def recording_sync_to_async(function, thread_sensitive):
+            calls.append(thread_sensitive)
+            # the test transaction is only visible from the shared sync thread
+            return sync_to_async(function, thread_sensitive=True)
+
+        with mock.patch.object(ContributionPlanConfig, "async_services_thread_sensitive", False), \
+                mock.patch("contribution_plan.services.sync_to_async", recording_sync_to_async):
+            response = async_to_sync(self.contribution_plan_bundle_service.aget_by_ids)(
+                [self.contribution_plan_bundle.id])
+
+        self.assertEqual(([False], True), (calls, response[0]['success']))
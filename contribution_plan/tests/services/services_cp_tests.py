@@ -1,4 +1,8 @@
+from datetime import date, datetime
+
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from contribution_plan.services import ContributionPlan as ContributionPlanService, \
     ContributionPlanBundle as ContributionPlanBundleService, \
     ContributionPlanBundleDetails as ContributionPlanBundleDetailsService, PaymentPlan as PaymentPlanService
@@ -7,7 +11,7 @@ from contribution_plan.models import ContributionPlan, ContributionPlanBundle, \
 from calculation.calculation_rule import ContributionValuationRule
 from core.models import User
 from contribution_plan.tests.helpers import create_test_contribution_plan, \
-    create_test_contribution_plan_bundle
+    create_test_contribution_plan_bundle, create_test_contribution_plan_bundle_details
 from product.test_helpers import create_test_product
 
 
@@ -365,6 +369,95 @@ class ServiceTestContributionPlan(TestCase):
             )
         )
 
+    def test_contribution_plan_history(self):
+        contribution_plan = create_test_contribution_plan(
+            product=self.test_product, custom_props={'code': 'HISTORY', 'name': 'History plan'})
+        contribution_plan.periodicity = 6
+        contribution_plan.save(username='admin')
+        contribution_plan.name = 'History plan renamed'
+        contribution_plan.save(username='admin')
+
+        diff = self.contribution_plan_service.history_diff(contribution_plan, 1, 3)
+        changes = self.contribution_plan_service.history_changes(contribution_plan)
+        missing_version = self.contribution_plan_service.history_diff(contribution_plan, 1, 9)
+
+        self.assertEqual(
+            ({'name': ('History plan', 'History plan renamed'), 'periodicity': (12, 6)},
+             [1, 2, 3], {'periodicity': (12, 6)}, [('name', 'History plan', 'History plan renamed')],
+             False),
+            ({change['field']: (change['old_value'], change['new_value']) for change in diff['data']['changes']},
+             [entry['version'] for entry in changes['data']],
+             {change['field']: (change['old_value'], change['new_value'])
+              for change in changes['data'][1]['changes']},
+             [(change['field'], change['old_value'], change['new_value'])
+              for change in changes['data'][2]['changes']],
+             missing_version['success'])
+        )
+
+    def test_contribution_plan_bundle_composition_at(self):
+        bundle = create_test_contribution_plan_bundle()
+        open_ended_plan = create_test_contribution_plan(
+            product=self.test_product, custom_props={'code': 'COMPOSITION-A', 'date_valid_from': datetime(2020, 1, 1)})
+        ended_plan = create_test_contribution_plan(
+            product=self.test_product,
+            custom_props={'code': 'COMPOSITION-B', 'date_valid_from': datetime(2020, 1, 1),
+                          'date_valid_to': datetime(2021, 1, 1)})
+        for contribution_plan in (open_ended_plan, ended_plan):
+            create_test_contribution_plan_bundle_details(
+                contribution_plan_bundle=bundle, contribution_plan=contribution_plan,
+                custom_props={'date_valid_from': datetime(2020, 1, 1)})
+
+        with self.assertNumQueries(1):
+            response_2020 = self.contribution_plan_bundle_service.composition_at(bundle, date(2020, 6, 1))
+        # validity ends are exclusive
+        response_2021 = self.contribution_plan_bundle_service.composition_at(bundle, date(2021, 1, 1))
+        response_2019 = self.contribution_plan_bundle_service.composition_at(bundle, date(2019, 6, 1))
+
+        self.assertEqual(
+            (['COMPOSITION-A', 'COMPOSITION-B'], ['COMPOSITION-A'], []),
+            tuple([cp['code'] for cp in response['data']]
+                  for response in (response_2020, response_2021, response_2019))
+        )
+
+    def test_contribution_plan_bundle_composition_timeline(self):
+        bundle = create_test_contribution_plan_bundle()
+        empty_bundle = create_test_contribution_plan_bundle()
+        plan_a = create_test_contribution_plan(
+            product=self.test_product, custom_props={'code': 'TIMELINE-A', 'date_valid_from': datetime(2020, 1, 1)})
+        plan_b = create_test_contribution_plan(
+            product=self.test_product,
+            custom_props={'code': 'TIMELINE-B', 'date_valid_from': datetime(2020, 1, 1),
+                          'date_valid_to': datetime(2020, 9, 1)})
+        for contribution_plan, valid_from, valid_to in (
+                (plan_a, datetime(2020, 1, 1), datetime(2020, 3, 1)),
+                # new version of the details attaching plan_a, starting when the previous one ends
+                (plan_a, datetime(2020, 3, 1), None),
+                (plan_b, datetime(2020, 6, 1), None),
+        ):
+            create_test_contribution_plan_bundle_details(
+                contribution_plan_bundle=bundle, contribution_plan=contribution_plan,
+                custom_props={'date_valid_from': valid_from, 'date_valid_to': valid_to})
+
+        with self.assertNumQueries(1):
+            response = self.contribution_plan_bundle_service.composition_timeline(
+                [bundle, empty_bundle], date(2020, 2, 1), date(2021, 1, 1))
+
+        a, b = str(plan_a.id), str(plan_b.id)
+        self.assertTrue(response['success'])
+        self.assertEqual(
+            [('2020-02-01T00:00:00', '2020-06-01T00:00:00', [a]),
+             ('2020-06-01T00:00:00', '2020-09-01T00:00:00', sorted([a, b])),
+             # plan_b itself is no longer valid
+             ('2020-09-01T00:00:00', '2021-01-01T00:00:00', [a])],
+            [(segment['date_valid_from'], segment['date_valid_to'], segment['contribution_plans'])
+             for segment in response['data'][str(bundle.id)]]
+        )
+        self.assertEqual(
+            [{'date_valid_from': '2020-02-01T00:00:00', 'date_valid_to': '2021-01-01T00:00:00',
+              'contribution_plans': []}],
+            response['data'][str(empty_bundle.id)]
+        )
+
     def test_contribution_plan_bundle_create(self):
         contribution_plan_bundle = {
             'code': "CPB1",
@@ -685,3 +778,169 @@ class ServiceTestContributionPlan(TestCase):
                 response['data']['version'],
             )
         )
+
+    def test_contribution_plan_create_many(self):
+        contribution_plans = [
+            {
+                'code': "CP BULK %d" % index,
+                'name': "Contribution Plan Bulk %d" % index,
+                'benefit_plan_id': self.test_product.id,
+                'periodicity': 6,
+                'calculation': str(self.calculation),
+                'json_ext': {},
+            } for index in range(3)
+        ]
+        # missing obligatory field should only fail its own item
+        del contribution_plans[1]['periodicity']
+
+        response = self.contribution_plan_service.create_many(contribution_plans)
+        created_ids = [item['data']['id'] for item in response if item['success']]
+        history_count = ContributionPlan.history.filter(id__in=created_ids).count()
+
+        # tear down the test data
+        ContributionPlan.history.filter(id__in=created_ids).delete()
+        ContributionPlan.objects.filter(id__in=created_ids).delete()
+
+        self.assertEqual(
+            (
+                [True, False, True],
+                "Failed to create ContributionPlan",
+                ["CP BULK 0", "CP BULK 2"],
+                [1, 1],
+                2,
+            ),
+            (
+                [item['success'] for item in response],
+                response[1]['message'],
+                [item['data']['code'] for item in response if item['success']],
+                [item['data']['version'] for item in response if item['success']],
+                history_count,
+            )
+        )
+
+    def test_payment_plan_create_many_not_existing_benefit_plan(self):
+        payment_plans = [
+            {
+                'code': "PP BULK",
+                'name': "Payment Plan Bulk",
+                'benefit_plan_id': self.test_product.id,
+                'periodicity': 1,
+                'calculation': str(self.calculation),
+                'json_ext': {},
+            },
+            {
+                'code': "PP BULK NO PRODUCT",
+                'name': "Payment Plan Bulk without product",
+                'benefit_plan_id': -1,
+                'periodicity': 1,
+                'calculation': str(self.calculation),
+                'json_ext': {},
+            },
+        ]
+
+        response = self.payment_plan_service.create_many(payment_plans)
+
+        # tear down the test data
+        PaymentPlan.objects.filter(id=response[0]['data']['id']).delete()
+
+        self.assertEqual(
+            (
+                True,
+                "PP BULK",
+                self.test_product.id,
+                False,
+                "Failed to create PaymentPlan",
+            ),
+            (
+                response[0]['success'],
+                response[0]['data']['code'],
+                response[0]['data']['benefit_plan'],
+                response[1]['success'],
+                response[1]['message'],
+            )
+        )
+
+    def test_contribution_plan_get_by_ids(self):
+        missing_id = "00000000-0000-0000-0000-000000000000"
+        response = self.contribution_plan_service.get_by_ids(
+            [str(self.contribution_plan2.id), missing_id, self.contribution_plan.id]
+        )
+
+        self.assertEqual(
+            (
+                [True, False, True],
+                [str(self.contribution_plan2.id), str(self.contribution_plan.id)],
+                "Failed to get ContributionPlan",
+            ),
+            (
+                [item['success'] for item in response],
+                [item['data']['id'] for item in response if item['success']],
+                response[1]['message'],
+            )
+        )
+
+    def test_contribution_plan_bundle_get_by_ids(self):
+        response = self.contribution_plan_bundle_service.get_by_ids([self.contribution_plan_bundle.id, "not-uuid"])
+
+        self.assertEqual(
+            (
+                [True, False],
+                str(self.contribution_plan_bundle.id),
+                "Failed to get ContributionPlanBundle",
+            ),
+            (
+                [item['success'] for item in response],
+                response[0]['data']['uuid'],
+                response[1]['message'],
+            )
+        )
+
+    def test_contribution_plan_update_writes_only_changed_fields(self):
+        contribution_plan = create_test_contribution_plan(product=self.test_product)
+        contribution_plan_to_update = {
+            'id': str(contribution_plan.id),
+            'periodicity': 3,
+        }
+        with CaptureQueriesContext(connection) as context:
+            response = self.contribution_plan_service.update(contribution_plan_to_update)
+        update_statements = [query['sql'] for query in context.captured_queries
+                             if query['sql'].startswith('UPDATE') and 'tblContributionPlan' in query['sql']]
+
+        self.assertEqual(
+            (True, 3, 2, 1, True, False, 1),
+            (
+                response['success'],
+                response['data']['periodicity'],
+                response['data']['version'],
+                len(update_statements),
+                'Periodicity' in update_statements[0],
+                '"Name"' in update_statements[0] or '[Name]' in update_statements[0],
+                ContributionPlan.history.filter(id=contribution_plan.id, version=2).count(),
+            )
+        )
+
+    def test_contribution_plan_update_with_expected_version(self):
+        contribution_plan = create_test_contribution_plan(product=self.test_product)
+        response_stale = self.contribution_plan_service.update({
+            'id': str(contribution_plan.id),
+            'version': contribution_plan.version + 1,
+            'periodicity': 3,
+        })
+        # uuid is not a column, it is ignored
+        response = self.contribution_plan_service.update({
+            'id': str(contribution_plan.id),
+            'uuid': str(contribution_plan.id),
+            'version': contribution_plan.version,
+            'periodicity': 3,
+        })
+
+        self.assertEqual(
+            (False, True, 3, 2, 1),
+            (
+                response_stale['success'],
+                response['success'],
+                response['data']['periodicity'],
+                response['data']['version'],
+                ContributionPlan.history.filter(id=contribution_plan.id, version=2).count(),
+            )
+        )
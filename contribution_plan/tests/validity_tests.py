@@ -0,0 +1,44 @@
+from datetime import date, datetime
+from unittest import skipIf
+
+from django.test import TestCase
+
+from contribution_plan.tests.helpers import create_test_contribution_plan
+from contribution_plan.validity import np, valid_contribution_plan, valid_contribution_plans
+from product.test_helpers import create_test_product
+
+
+@skipIf(np is None, "numpy is not installed")
+class ValidContributionPlansTest(TestCase):
+
+    def test_same_results_as_orm_lookup(self):
+        product = create_test_product("VALIDITY1", custom_props={"insurance_period": 12, })
+        other_product = create_test_product("VALIDITY2", custom_props={"insurance_period": 12, })
+        for plan_product, valid_from, valid_to in (
+                (product, datetime(2020, 1, 1), datetime(2020, 7, 1)),
+                # overlaps the previous plan and starts later, wins while both are valid
+                (product, datetime(2020, 4, 1), datetime(2020, 10, 1)),
+                (product, datetime(2021, 1, 1), None),
+                (other_product, datetime(2020, 6, 1), datetime(2021, 6, 1)),
+        ):
+            create_test_contribution_plan(product=plan_product, custom_props={
+                'date_valid_from': valid_from, 'date_valid_to': valid_to})
+        deleted_plan = create_test_contribution_plan(product=other_product, custom_props={
+            'date_valid_from': datetime(2020, 1, 1)})
+        deleted_plan.delete(username='admin')
+
+        pairs = [(benefit_plan.id, date(year, month, day))
+                 for benefit_plan in (product, other_product)
+                 for year in (2019, 2020, 2021, 2022)
+                 for month in (1, 3, 4, 6, 7, 9, 10, 12)
+                 for day in (1, 15)]
+        # pairs in any order, including an unknown benefit plan
+        pairs = pairs[::2] + pairs[1::2] + [(-1, date(2020, 5, 1))]
+
+        found = valid_contribution_plans([pair[0] for pair in pairs], [pair[1] for pair in pairs])
+
+        self.assertEqual(
+            [valid_contribution_plan(benefit_plan_id, as_of) for benefit_plan_id, as_of in pairs],
+            list(found)
+        )
+        self.assertIsNone(found[-1])
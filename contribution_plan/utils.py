@@ -1,12 +1,123 @@
+import copy
 import json
+import uuid
+from datetime import date, datetime as py_datetime, time
 
-from contribution_plan.models import GenericPlan
+from django.db.models import Q
+from simple_history.utils import bulk_create_with_history
+
+from core import datetime
+from contribution_plan.apps import ContributionPlanConfig
+from contribution_plan.cache import CalculationRuleParams, calcrule_params_cache
+from contribution_plan.models import ActivePlanCatalogEntry, GenericPlan
+
+
+def bulk_create_history_objects(model_class, objects: list, user, batch_size: int = 500) -> list:
+    # fill in the audit fields normally set by HistoryModel.save and insert the rows
+    # together with their historical records using batched inserts
+    now = datetime.datetime.now()
+    for obj in objects:
+        if obj.id is None:
+            obj.id = uuid.uuid4()
+        obj.version = 1
+        obj.user_created = user
+        obj.user_updated = user
+        obj.date_created = now
+        obj.date_updated = now
+    created = bulk_create_with_history(objects, model_class, batch_size=batch_size, default_user=user)
+    model_class._notify_bulk_change([obj.id for obj in objects])
+    return created
+
+
+def to_datetime(value: date) -> py_datetime:
+    # dates stand for the start of the day
+    if not isinstance(value, py_datetime):
+        value = py_datetime.combine(value, time.min)
+    return value
+
+
+def valid_on_filter(as_of: date, prefix: str = "") -> Q:
+    # validity ranges are half-open [date_valid_from, date_valid_to), a missing date_valid_to means open-ended
+    as_of = to_datetime(as_of)
+    return Q(**{f"{prefix}date_valid_from__lte": as_of}) & (
+        Q(**{f"{prefix}date_valid_to__isnull": True}) | Q(**{f"{prefix}date_valid_to__gt": as_of})
+    )
+
+
+def active_only_filter(model_class) -> Q:
+    # objects valid now and not deleted, read from the active catalog snapshot when it is enabled
+    now = py_datetime.now()
+    if ContributionPlanConfig.active_catalog_snapshot:
+        return Q(id__in=ActivePlanCatalogEntry.objects.filter(
+            valid_on_filter(now), entity=model_class._meta.model_name
+        ).values("id"))
+    return valid_on_filter(now) & Q(is_deleted=False)
+
+
+def composition_timeline(intervals, start: py_datetime, end: py_datetime) -> list:
+    """
+    Sweeps the half-open (plan_id, valid_from, valid_to) intervals once, ordered by date, and returns the
+    [start, end) range split into consecutive (segment_start, segment_end, plan_ids) segments during which the
+    set of plans does not change. A missing valid_to means open-ended, plan ids are sorted by their text form.
+    """
+    events = []
+    for plan_id, valid_from, valid_to in intervals:
+        valid_from = max(valid_from, start)
+        valid_to = end if valid_to is None else min(valid_to, end)
+        if valid_from < valid_to:
+            events.append((valid_from, 1, plan_id))
+            events.append((valid_to, -1, plan_id))
+    events.sort(key=lambda event: event[0])
+
+    segments = []
+    # several details versions can attach the same plan at the same time, count them
+    attached = {}
+    segment_start = start
+    for moment, delta, plan_id in events:
+        if moment > segment_start:
+            _append_segment(segments, segment_start, moment, attached)
+            segment_start = moment
+        count = attached.get(plan_id, 0) + delta
+        if count:
+            attached[plan_id] = count
+        else:
+            del attached[plan_id]
+    if end > segment_start:
+        _append_segment(segments, segment_start, end, attached)
+    return segments
+
+
+def _append_segment(segments, segment_start, segment_end, attached):
+    plan_ids = sorted(attached, key=str)
+    if segments and segments[-1][2] == plan_ids:
+        # same plans on both sides of the event, e.g. a plan detached and attached again on the same date
+        segments[-1] = (segments[-1][0], segment_end, plan_ids)
+    else:
+        segments.append((segment_start, segment_end, plan_ids))
 
 
 def obtain_calcrule_params(plan: GenericPlan,
     integer_param_list: list, none_integer_param_list: list) -> dict:
     # obtaining payment plan params saved in payment plan json_ext fields
-    pp_params = plan.json_ext
+    return _parse_calcrule_params(plan.json_ext, integer_param_list, none_integer_param_list)
+
+
+def obtain_calcrule_params_cached(plan: GenericPlan,
+    integer_param_list: list, none_integer_param_list: list) -> CalculationRuleParams:
+    # same params as obtain_calcrule_params, parsed once per plan version and never modifying plan.json_ext
+    def parse():
+        return CalculationRuleParams(
+            _parse_calcrule_params(copy.deepcopy(plan.json_ext), integer_param_list, none_integer_param_list)
+        )
+
+    if plan.id is None or "json_ext" in plan.get_dirty_fields():
+        # not saved yet, or json_ext changed since the plan was loaded, the cached version does not describe it
+        return parse()
+    param_lists = (tuple(integer_param_list), tuple(none_integer_param_list))
+    return calcrule_params_cache.get(plan, param_lists, parse)
+
+
+def _parse_calcrule_params(pp_params, integer_param_list: list, none_integer_param_list: list) -> dict:
     if isinstance(pp_params, str):
         pp_params = json.loads(pp_params)
     if pp_params:
@@ -0,0 +1,130 @@
+import heapq
+from datetime import datetime as py_datetime
+
+from django.db.models import F, Q
+
+from contribution_plan.models import ContributionPlan
+from contribution_plan.utils import to_datetime, valid_on_filter
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy is an optional dependency, installed with the "numpy" extra
+    np = None
+
+
+def valid_contribution_plan(benefit_plan_id, as_of):
+    """
+    Id of the contribution plan of the benefit plan valid on the as_of date, None if there is none. When several
+    plans are valid, the one starting last wins, then the one created last.
+    """
+    return ContributionPlan.objects.filter(
+        valid_on_filter(as_of), benefit_plan_id=benefit_plan_id, is_deleted=False,
+    ).order_by(
+        "-date_valid_from", F("date_created").desc(nulls_last=True)
+    ).values_list("id", flat=True).first()
+
+
+def valid_contribution_plans(benefit_plan_ids, dates):
+    """
+    Same as valid_contribution_plan for every (benefit_plan_ids[i], dates[i]) pair, as an array of plan ids (None
+    where no plan is valid) in the order of the pairs. The plans of the benefit plans valid at some point between
+    the first and the last date are loaded with one query.
+    """
+    _require_numpy()
+    benefit_plan_ids = np.asarray(benefit_plan_ids, dtype=np.int64)
+    dates = np.asarray(dates, dtype="datetime64[us]")
+    if not len(dates):
+        return np.empty(0, dtype=object)
+    lookup = ValidPlanLookup.load(np.unique(benefit_plan_ids).tolist(), dates.min().item(), dates.max().item())
+    return lookup.lookup(benefit_plan_ids, dates)
+
+
+class ValidPlanLookup:
+    """
+    Validity intervals of contribution plans, split for every benefit plan into consecutive segments during which
+    the same plan is valid. The segment starts are kept in a sorted numpy array, so the valid plans of any number
+    of (benefit plan, date) pairs are found with one searchsorted call per benefit plan.
+    """
+
+    def __init__(self, plans):
+        """
+        plans: (plan_id, benefit_plan_id, date_valid_from, date_valid_to, date_created) tuples, a missing
+        date_valid_to meaning open-ended.
+        """
+        _require_numpy()
+        # plans sorted by priority, the position of a plan in the list is its rank, lower ranks win
+        plans = sorted(plans, key=lambda plan: (plan[2], plan[4] or py_datetime.min), reverse=True)
+        self.plan_ids = np.array([plan[0] for plan in plans] + [None], dtype=object)
+        intervals_by_benefit_plan = {}
+        for rank, (_, benefit_plan_id, valid_from, valid_to, _) in enumerate(plans):
+            intervals_by_benefit_plan.setdefault(benefit_plan_id, []).append((rank, valid_from, valid_to))
+        self._segments = {
+            benefit_plan_id: _segments(intervals) for benefit_plan_id, intervals in intervals_by_benefit_plan.items()
+        }
+
+    @classmethod
+    def load(cls, benefit_plan_ids, date_from=None, date_to=None):
+        """
+        Loads the not deleted contribution plans of the benefit plans, restricted to the plans valid at some point
+        between date_from and date_to (both included) when they are given.
+        """
+        queryset = ContributionPlan.objects.filter(benefit_plan_id__in=benefit_plan_ids, is_deleted=False)
+        if date_from is not None:
+            date_from = to_datetime(date_from)
+            queryset = queryset.filter(Q(date_valid_to__isnull=True) | Q(date_valid_to__gt=date_from))
+        if date_to is not None:
+            queryset = queryset.filter(date_valid_from__lte=to_datetime(date_to))
+        return cls(queryset.values_list(
+            "id", "benefit_plan_id", "date_valid_from", "date_valid_to", "date_created"
+        ).iterator())
+
+    def lookup(self, benefit_plan_ids, dates):
+        benefit_plan_ids = np.asarray(benefit_plan_ids, dtype=np.int64)
+        dates = np.asarray(dates, dtype="datetime64[us]")
+        ranks = np.full(len(dates), -1, dtype=np.int64)
+        # the pairs of every benefit plan are contiguous once sorted by benefit plan
+        order = np.argsort(benefit_plan_ids, kind="stable")
+        sorted_ids = benefit_plan_ids[order]
+        unique_ids, starts = np.unique(sorted_ids, return_index=True)
+        ends = np.append(starts[1:], len(sorted_ids))
+        for benefit_plan_id, start, end in zip(unique_ids.tolist(), starts.tolist(), ends.tolist()):
+            segments = self._segments.get(benefit_plan_id)
+            if segments is None:
+                continue
+            segment_starts, segment_ranks = segments
+            positions = order[start:end]
+            ranks[positions] = segment_ranks[np.searchsorted(segment_starts, dates[positions], side="right")]
+        # rank -1 selects the trailing None
+        return self.plan_ids[ranks]
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("The valid plans lookup requires numpy, install openimis-be-contribution-plan[numpy]")
+
+
+def _segments(intervals):
+    """
+    Sweeps the (rank, valid_from, valid_to) intervals of one benefit plan, returns the sorted segment starts and
+    the ranks of the plans valid in each segment, preceded by -1 for the dates before the first segment.
+    """
+    boundaries = sorted({valid_from for _, valid_from, _ in intervals}
+                        | {valid_to for _, _, valid_to in intervals if valid_to is not None})
+    by_start = sorted(intervals, key=lambda interval: interval[1])
+    segment_starts, segment_ranks = [], [-1]
+    heap = []
+    next_interval = 0
+    for boundary in boundaries:
+        while next_interval < len(by_start) and by_start[next_interval][1] <= boundary:
+            rank, _, valid_to = by_start[next_interval]
+            heapq.heappush(heap, (rank, valid_to))
+            next_interval += 1
+        # ended intervals are dropped once they reach the top of the heap
+        while heap and heap[0][1] is not None and heap[0][1] <= boundary:
+            heapq.heappop(heap)
+        rank = heap[0][0] if heap else -1
+        if rank != segment_ranks[-1]:
+            segment_starts.append(boundary)
+            segment_ranks.append(rank)
+    return np.array(segment_starts, dtype="datetime64[us]"), np.array(segment_ranks, dtype=np.int64)
@@ -22,12 +22,18 @@ setup(
     author_email='dborowiecki@soldevelo.com',
     install_requires=[
         'django',
+        # async service counterparts, shipped with Django 3.0+ but not with older versions
+        'asgiref>=3.3',
         'django-db-signals',
         'djangorestframework',
         'openimis-be-core',
         'openimis-be-product',
         'openimis-be-calculation'
     ],
+    extras_require={
+        # vectorized valid plans lookup of contribution_plan.validity
+        'numpy': ['numpy'],
+    },
     classifiers=[
         'Environment :: Web Environment',
         'Framework :: Django',